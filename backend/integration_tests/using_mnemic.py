@@ -30,7 +30,7 @@ async def main():
                 "row_data": [random.uniform(0, 100), random.uniform(0, 100)]
             }
             await utils.process_message(db, msg)
-        print(await utils.get_latest_trace('junk'))
+        print(await utils.get_latest_trace(db, 'junk'))
 
 
 if __name__ == '__main__':
@@ -1,33 +1,47 @@
 """The listening UDP server for tracing messages."""
 
 import asyncio
+import multiprocessing
 import os
 import signal
 
 import logging
 
-import dolon.utils as utils
 import dolon.db_conn as db_conn
+import dolon.ingestion as ingestion
+import dolon.retention as retention
+import dolon.utils as utils
 
 logging.basicConfig(level=logging.DEBUG)
 
 server_port = int(os.environ["BACK_END_PORT"])
+batch_size = int(os.environ.get("BACK_END_BATCH_SIZE", 500))
+batch_delay = float(os.environ.get("BACK_END_BATCH_DELAY", 0.5))
+metrics_interval = float(os.environ.get("BACK_END_METRICS_INTERVAL", 60))
+high_water_mark = int(os.environ.get("BACK_END_HIGH_WATER_MARK", 10000))
+drop_policy = os.environ.get("BACK_END_DROP_POLICY", ingestion.DROP_NEWEST)
+number_of_workers = int(os.environ.get("BACK_END_WORKERS", 1))
+retention_interval = float(
+    os.environ.get("BACK_END_RETENTION_INTERVAL", 60 * 60)
+)
+
+_PARTITION_MAINTENANCE_INTERVAL_IN_SECS = 6 * 60 * 60
 
 class CustomMsgProtocol(asyncio.BaseProtocol):
     """Override the base protocall.
 
-    :cvar db: Hold the database connection that will be shared accros all
+    :cvar ingestor: Queues the received messages; shared accros all
         requests.
     """
-    _db = None
+    _ingestor = None
 
     @classmethod
-    def set_db(cls, db):
-        """Sets the database connection.
+    def set_ingestor(cls, ingestor):
+        """Sets the ingestor.
 
-        :param db: The database connection.
+        :param Ingestor ingestor: The ingestor.
         """
-        cls._db = db
+        cls._ingestor = ingestor
 
     def datagram_received(self, data, addr):
         """Called when a new UDP request is received.
@@ -35,19 +49,57 @@ class CustomMsgProtocol(asyncio.BaseProtocol):
         :param data: The data received from the server.
         :param addr: Unused.
         """
-        message = data.decode()
-        asyncio.ensure_future(
-            utils.process_message(db=self._db, payload=message)
-        )
+        self._ingestor.submit(data)
+
+
+async def log_metrics(ingestor, row_batcher):
+    """Periodically logs the ingestion metrics.
+
+    :param Ingestor ingestor: The ingestor to report for.
+    :param RowBatcher row_batcher: The row batcher to report for.
+    """
+    while True:
+        await asyncio.sleep(metrics_interval)
+        logging.info("Ingestion metrics: %s", ingestor.get_metrics())
+        logging.info("Batching metrics: %s", row_batcher.get_metrics())
+
 
-async def run():
-    """Runs the server."""
+async def maintain_partitions(db):
+    """Periodically creates the partitions for the upcoming tracing rows.
+
+    :param db: The database connection.
+    """
+    while True:
+        try:
+            await utils.create_partitions(db)
+        except Exception as ex:
+            logging.exception(ex)
+        await asyncio.sleep(_PARTITION_MAINTENANCE_INTERVAL_IN_SECS)
+
+
+async def apply_retention_forever(db):
+    """Periodically rolls up and expires the old tracing rows.
+
+    :param db: The database connection.
+    """
+    while True:
+        try:
+            dropped = await retention.apply_retention(db)
+            if dropped:
+                logging.info("Dropped partitions: %s", dropped)
+        except Exception as ex:
+            logging.exception(ex)
+        await asyncio.sleep(retention_interval)
+
+
+async def run(reuse_port=False):
+    """Runs the server.
+
+    :param bool reuse_port: If true the port can be bound by several
+        processes at the same time with the kernel distributing the
+        datagrams among them.
+    """
     stop_event = asyncio.Event()
-    loop = asyncio.get_event_loop()
-    await loop.create_datagram_endpoint(
-        CustomMsgProtocol,
-        local_addr=('0.0.0.0', server_port)
-    )
 
     async def terminate():
         """Called upon termination."""
@@ -64,10 +116,80 @@ async def run():
         )
     logging.info("Starting UDP server")
     async with db_conn.DbConnection() as db:
-        CustomMsgProtocol.set_db(db)
-        await stop_event.wait()
+        row_batcher = ingestion.RowBatcher(
+            db,
+            max_batch_size=batch_size,
+            max_delay=batch_delay
+        )
+        ingestor = ingestion.Ingestor(
+            db,
+            row_batcher,
+            high_water_mark=high_water_mark,
+            drop_policy=drop_policy
+        )
+        async with row_batcher, ingestor:
+            CustomMsgProtocol.set_ingestor(ingestor)
+            transport, _ = await loop.create_datagram_endpoint(
+                CustomMsgProtocol,
+                local_addr=('0.0.0.0', server_port),
+                reuse_port=reuse_port
+            )
+            background_tasks = [
+                asyncio.ensure_future(log_metrics(ingestor, row_batcher)),
+                asyncio.ensure_future(maintain_partitions(db)),
+                asyncio.ensure_future(apply_retention_forever(db)),
+            ]
+            await stop_event.wait()
+            for task in background_tasks:
+                task.cancel()
+            transport.close()
+
+
+def _run_worker():
+    """Runs a worker process.
+
+    Each worker has its own event loop and database connection pool.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run(reuse_port=True))
+
+
+def run_workers(workers):
+    """Runs the server as a supervisor of several worker processes.
+
+    All the workers bind the same UDP port (using SO_REUSEPORT) so decoding
+    and storing the messages can use as many cores as the workers. The
+    SIGTERM and SIGINT signals received by the supervisor are forwarded to
+    the workers which shut down gracefully flushing their pending rows.
+
+    :param int workers: The number of worker processes to start.
+    """
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_run_worker, name=f'mnemic-worker-{index}')
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    def forward_signal(signum, frame):
+        """Forwards the received signal to the workers."""
+        for process in processes:
+            if process.is_alive():
+                os.kill(process.pid, signum)
+
+    for signal_to_overwrite in ('SIGTERM', 'SIGINT'):
+        signal.signal(getattr(signal, signal_to_overwrite), forward_signal)
+    logging.info("Started %d workers", workers)
+    for process in processes:
+        process.join()
+        logging.info("%s exited with %s", process.name, process.exitcode)
 
 
 if __name__ == '__main__':
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(run())
+    if number_of_workers > 1:
+        run_workers(number_of_workers)
+    else:
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(run())
@@ -5,14 +5,130 @@ CREATE TABLE tracing_run (
      app_name VARCHAR (128) NOT NULL,
      column_names text[],
      creation_time  TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+     rolled_up_until TIMESTAMP,
      unique(uuid, app_name)
 );
 
+CREATE INDEX tracing_run_app_name_idx ON tracing_run (app_name, creation_time);
+
+-- Tracing rows are partitioned by month; rows that do not fall in any of the
+-- monthly partitions are stored in the default one.
 CREATE TABLE tracing_row
 (
-    id serial PRIMARY KEY,
+    id bigserial,
     uuid VARCHAR,
     row_data real[],
-    date_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    date_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_time)
+) PARTITION BY RANGE (date_time);
+
+CREATE INDEX tracing_row_uuid_date_time_idx ON tracing_row (uuid, date_time);
+
+-- Used to follow the rows of live runs.
+CREATE INDEX tracing_row_uuid_id_idx ON tracing_row (uuid, id);
+
+CREATE TABLE tracing_row_default PARTITION OF tracing_row DEFAULT;
+
+-- Creates the partition for the month of the passed in date if missing; rows
+-- of that month that are already stored in the default partition are moved
+-- to the new one.
+CREATE OR REPLACE FUNCTION create_tracing_row_partition(month_date DATE)
+RETURNS VOID AS $$
+DECLARE
+    from_date DATE := date_trunc('month', month_date);
+    to_date DATE := date_trunc('month', month_date) + INTERVAL '1 month';
+    partition_name TEXT := 'tracing_row_' || to_char(month_date, 'YYYY_MM');
+BEGIN
+    -- Serializes concurrent callers (like several backend workers).
+    PERFORM pg_advisory_xact_lock(hashtext('tracing_row_partitions'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE tracing_row INCLUDING DEFAULTS)',
+        partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM tracing_row_default '
+        'WHERE date_time >= %L AND date_time < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        from_date, to_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE tracing_row ATTACH PARTITION %I '
+        'FOR VALUES FROM (%L) TO (%L)',
+        partition_name, from_date, to_date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creates the partitions from the current month up to months_ahead months
+-- in the future.
+CREATE OR REPLACE FUNCTION create_tracing_row_partitions(months_ahead INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    FOR month_index IN 0..months_ahead LOOP
+        PERFORM create_tracing_row_partition(
+            (CURRENT_DATE + make_interval(months => month_index))::DATE
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT create_tracing_row_partitions(2);
+
+-- Per application retention policies; the policy of the '*' application
+-- applies to all the applications without their own policy. Rows older than
+-- raw_days are rolled up to buckets of bucket_seconds.
+CREATE TABLE retention_policy (
+    app_name VARCHAR (128) PRIMARY KEY,
+    raw_days INTEGER NOT NULL CHECK (raw_days > 0),
+    bucket_seconds INTEGER NOT NULL CHECK (bucket_seconds > 0)
+);
+
+-- Rolled up tracing rows; the rows of a run that are older than its
+-- rolled_up_until time are read from here.
+CREATE TABLE tracing_row_rollup (
+    uuid VARCHAR NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    row_min real[],
+    row_max real[],
+    row_avg real[],
+    PRIMARY KEY (uuid, bucket_start)
+);
+
+-- Running sums over the rows of each run used to compute correlations
+-- without reading the rows; each array is a width x width matrix flattened
+-- in row-major order (see dolon/impl/run_stats_impl.py).
+CREATE TABLE tracing_run_stats (
+    uuid VARCHAR PRIMARY KEY,
+    width INTEGER NOT NULL,
+    n DOUBLE PRECISION[] NOT NULL,
+    sx DOUBLE PRECISION[] NOT NULL,
+    sxx DOUBLE PRECISION[] NOT NULL,
+    sxy DOUBLE PRECISION[] NOT NULL
+);
+
+-- Adds two arrays of the same size element by element.
+CREATE OR REPLACE FUNCTION add_float8_arrays(
+    a DOUBLE PRECISION[], b DOUBLE PRECISION[]
+)
+RETURNS DOUBLE PRECISION[] AS $$
+    SELECT array_agg(x + y ORDER BY i)
+    FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i)
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Stack samples of the runs; each row counts the samples of a call path
+-- (its frames from the outermost, separated by ';') taken during one
+-- sampling interval.
+CREATE TABLE tracing_stack (
+    uuid VARCHAR NOT NULL,
+    date_time TIMESTAMP NOT NULL,
+    stack TEXT NOT NULL,
+    samples INTEGER NOT NULL
 );
 
+CREATE INDEX tracing_stack_uuid_date_time_idx
+    ON tracing_stack (uuid, date_time);
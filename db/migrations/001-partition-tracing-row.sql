@@ -0,0 +1,95 @@
+-- Upgrades a database created by an older create-db.sql to the partitioned
+-- and indexed tracing_row table.
+--
+-- Runs in a single transaction; the backend should be stopped while it runs
+-- since tracing rows received in the meanwhile would be lost.
+--
+--     psql -U postgres -d mnemic -f 001-partition-tracing-row.sql
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS tracing_run_app_name_idx
+    ON tracing_run (app_name, creation_time);
+
+ALTER TABLE tracing_row RENAME TO tracing_row_legacy;
+ALTER SEQUENCE tracing_row_id_seq RENAME TO tracing_row_legacy_id_seq;
+ALTER INDEX tracing_row_pkey RENAME TO tracing_row_legacy_pkey;
+
+CREATE TABLE tracing_row
+(
+    id bigserial,
+    uuid VARCHAR,
+    row_data real[],
+    date_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, date_time)
+) PARTITION BY RANGE (date_time);
+
+CREATE INDEX tracing_row_uuid_date_time_idx ON tracing_row (uuid, date_time);
+
+CREATE TABLE tracing_row_default PARTITION OF tracing_row DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_tracing_row_partition(month_date DATE)
+RETURNS VOID AS $$
+DECLARE
+    from_date DATE := date_trunc('month', month_date);
+    to_date DATE := date_trunc('month', month_date) + INTERVAL '1 month';
+    partition_name TEXT := 'tracing_row_' || to_char(month_date, 'YYYY_MM');
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('tracing_row_partitions'));
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN;
+    END IF;
+    EXECUTE format(
+        'CREATE TABLE %I (LIKE tracing_row INCLUDING DEFAULTS)',
+        partition_name
+    );
+    EXECUTE format(
+        'WITH moved AS (DELETE FROM tracing_row_default '
+        'WHERE date_time >= %L AND date_time < %L RETURNING *) '
+        'INSERT INTO %I SELECT * FROM moved',
+        from_date, to_date, partition_name
+    );
+    EXECUTE format(
+        'ALTER TABLE tracing_row ATTACH PARTITION %I '
+        'FOR VALUES FROM (%L) TO (%L)',
+        partition_name, from_date, to_date
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION create_tracing_row_partitions(months_ahead INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    FOR month_index IN 0..months_ahead LOOP
+        PERFORM create_tracing_row_partition(
+            (CURRENT_DATE + make_interval(months => month_index))::DATE
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Creates a partition for every month that holds existing rows.
+SELECT create_tracing_row_partition(month_date::DATE)
+FROM generate_series(
+    date_trunc('month', (SELECT min(date_time) FROM tracing_row_legacy)),
+    date_trunc('month', CURRENT_DATE),
+    INTERVAL '1 month'
+) AS month_date;
+
+SELECT create_tracing_row_partitions(2);
+
+INSERT INTO tracing_row (id, uuid, row_data, date_time)
+SELECT id, uuid, row_data, COALESCE(date_time, CURRENT_TIMESTAMP)
+FROM tracing_row_legacy;
+
+SELECT setval(
+    'tracing_row_id_seq',
+    (SELECT COALESCE(max(id), 0) + 1 FROM tracing_row),
+    false
+);
+
+DROP TABLE tracing_row_legacy;
+
+COMMIT;
+
+ANALYZE tracing_row;
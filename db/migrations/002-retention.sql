@@ -0,0 +1,26 @@
+-- Adds the tables used to roll up and expire old tracing rows.
+--
+--     psql -U postgres -d mnemic -f 002-retention.sql
+
+BEGIN;
+
+ALTER TABLE tracing_run ADD COLUMN IF NOT EXISTS rolled_up_until TIMESTAMP;
+
+CREATE TABLE retention_policy (
+    app_name VARCHAR (128) PRIMARY KEY,
+    raw_days INTEGER NOT NULL CHECK (raw_days > 0),
+    bucket_seconds INTEGER NOT NULL CHECK (bucket_seconds > 0)
+);
+
+CREATE TABLE tracing_row_rollup (
+    uuid VARCHAR NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    row_min real[],
+    row_max real[],
+    row_avg real[],
+    PRIMARY KEY (uuid, bucket_start)
+);
+
+COMMIT;
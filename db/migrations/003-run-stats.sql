@@ -0,0 +1,63 @@
+-- Adds the running statistics of the tracing runs and computes them for the
+-- rows already stored; rolled up rows are not included.
+--
+-- The backend should be stopped while it runs since the statistics of
+-- tracing rows received in the meanwhile would be counted twice.
+--
+--     psql -U postgres -d mnemic -f 003-run-stats.sql
+
+BEGIN;
+
+CREATE TABLE tracing_run_stats (
+    uuid VARCHAR PRIMARY KEY,
+    width INTEGER NOT NULL,
+    n DOUBLE PRECISION[] NOT NULL,
+    sx DOUBLE PRECISION[] NOT NULL,
+    sxx DOUBLE PRECISION[] NOT NULL,
+    sxy DOUBLE PRECISION[] NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION add_float8_arrays(
+    a DOUBLE PRECISION[], b DOUBLE PRECISION[]
+)
+RETURNS DOUBLE PRECISION[] AS $$
+    SELECT array_agg(x + y ORDER BY i)
+    FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i)
+$$ LANGUAGE sql IMMUTABLE;
+
+INSERT INTO tracing_run_stats (uuid, width, n, sx, sxx, sxy)
+WITH runs AS (
+    SELECT uuid, cardinality(column_names) AS width
+    FROM tracing_run
+    WHERE cardinality(column_names) > 0
+),
+cells AS (
+    SELECT r.uuid, r.id, v.value::DOUBLE PRECISION AS value, v.i
+    FROM tracing_row r, unnest(r.row_data) WITH ORDINALITY AS v(value, i)
+    WHERE v.value IS NOT NULL AND v.value <> 'NaN'
+),
+pairs AS (
+    SELECT
+        a.uuid, a.i, b.i AS j,
+        count(*) AS n,
+        sum(a.value) AS sx,
+        sum(a.value * a.value) AS sxx,
+        sum(a.value * b.value) AS sxy
+    FROM cells a JOIN cells b ON a.uuid = b.uuid AND a.id = b.id
+    GROUP BY 1, 2, 3
+)
+SELECT
+    runs.uuid,
+    runs.width,
+    array_agg(coalesce(p.n, 0)::DOUBLE PRECISION ORDER BY gi.i, gj.j),
+    array_agg(coalesce(p.sx, 0) ORDER BY gi.i, gj.j),
+    array_agg(coalesce(p.sxx, 0) ORDER BY gi.i, gj.j),
+    array_agg(coalesce(p.sxy, 0) ORDER BY gi.i, gj.j)
+FROM
+    runs
+    CROSS JOIN LATERAL generate_series(1, runs.width) AS gi(i)
+    CROSS JOIN LATERAL generate_series(1, runs.width) AS gj(j)
+    LEFT JOIN pairs p ON p.uuid = runs.uuid AND p.i = gi.i AND p.j = gj.j
+GROUP BY runs.uuid, runs.width;
+
+COMMIT;
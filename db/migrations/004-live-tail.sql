@@ -0,0 +1,9 @@
+-- Adds the index used to follow the rows of live runs.
+--
+--     psql -U postgres -d mnemic -f 004-live-tail.sql
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS tracing_row_uuid_id_idx ON tracing_row (uuid, id);
+
+COMMIT;
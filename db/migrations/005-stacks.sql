@@ -0,0 +1,17 @@
+-- Adds the table holding the stack samples of the runs.
+--
+--     psql -U postgres -d mnemic -f 005-stacks.sql
+
+BEGIN;
+
+CREATE TABLE tracing_stack (
+    uuid VARCHAR NOT NULL,
+    date_time TIMESTAMP NOT NULL,
+    stack TEXT NOT NULL,
+    samples INTEGER NOT NULL
+);
+
+CREATE INDEX tracing_stack_uuid_date_time_idx
+    ON tracing_stack (uuid, date_time);
+
+COMMIT;
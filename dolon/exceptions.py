@@ -11,3 +11,7 @@ class InvalidMessage(DolonException):
 
 class InvalidEnvironmentVariable(DolonException):
     """Invalid environment variable."""
+
+
+class MissingDependency(DolonException):
+    """An optional dependency is not installed."""
@@ -0,0 +1,192 @@
+"""Reports the pauses of the garbage collector.
+
+A callback registered in gc.callbacks times every collection and counts the
+collections per generation along with the objects they found unreachable.
+Every value is reported per window: each profiler function returns what
+happened since it was last called, so collected as columns of a tracing run
+the pauses line up with the rest of the diagnostics (like the average_time
+of the profiled functions).
+"""
+
+import gc
+import time
+
+# The generations of the garbage collector.
+GENERATIONS = (0, 1, 2)
+
+
+class GcDiagnostics:
+    """Times the collections of the garbage collector.
+
+    Must be used as an async context manager (or started and stopped
+    explicitly); its profiler functions can be passed as diagnostics to
+    start_tracer.
+
+    The callback only adds to running totals and the profiler functions
+    return their difference from the previous read, so no lock is needed
+    between the collecting thread and the tracer; a collection can happen
+    in any thread, including while a value is read.
+
+    :ivar list _collections: The collections per generation.
+    :ivar float _pause_time: The total time (in seconds) of the collections.
+    :ivar float _max_pause: The longest collection since the last read.
+    :ivar int _collected: The unreachable objects found.
+    :ivar int _uncollectable: The unreachable objects that could not be
+        freed.
+    :ivar dict _last_read: Maps each total to its value when last read.
+    :ivar float _started: When the running collection started.
+    :ivar bool _active: True while the callback is registered.
+    """
+
+    def __init__(self):
+        """Initializer."""
+        self._collections = [0] * len(GENERATIONS)
+        self._pause_time = 0.0
+        self._max_pause = 0.0
+        self._collected = 0
+        self._uncollectable = 0
+        self._last_read = {}
+        self._started = None
+        self._active = False
+
+    def start(self):
+        """Starts timing the collections."""
+        if not self._active:
+            self._active = True
+            gc.callbacks.append(self._on_gc)
+
+    def stop(self):
+        """Stops timing the collections."""
+        if self._active:
+            self._active = False
+            gc.callbacks.remove(self._on_gc)
+            self._started = None
+
+    @property
+    def active(self):
+        """True while the collections are timed.
+
+        :rtype: bool
+        """
+        return self._active
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _on_gc(self, phase, info):
+        """Times a collection; called by the garbage collector.
+
+        :param str phase: Either 'start' or 'stop'.
+        :param dict info: Holds the generation of the collection and, when
+            stopping, the collected and uncollectable objects.
+        """
+        if phase == 'start':
+            self._started = time.perf_counter()
+            return
+        if self._started is None:
+            return
+        pause = time.perf_counter() - self._started
+        self._started = None
+        self._collections[info['generation']] += 1
+        self._pause_time += pause
+        if pause > self._max_pause:
+            self._max_pause = pause
+        self._collected += info['collected']
+        self._uncollectable += info['uncollectable']
+
+    def _take(self, name, total):
+        """Returns the increase of a total since it was last read.
+
+        :param str name: The name of the total.
+        :param total: The current value of the total.
+        """
+        last = self._last_read.get(name, 0)
+        self._last_read[name] = total
+        return total - last
+
+    def take_collections(self, generation):
+        """Returns the collections of a generation since the last call.
+
+        :param int generation: The generation (0 to 2).
+
+        :rtype: int
+        """
+        return self._take(
+            f'collections_{generation}', self._collections[generation]
+        )
+
+    async def gen0_collections(self):
+        """Returns the collections of the youngest generation.
+
+        :returns: The number of generation 0 collections since the last
+            call. Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self.take_collections(0)
+
+    async def gen1_collections(self):
+        """Returns the collections of the middle generation.
+
+        :returns: The number of generation 1 collections since the last
+            call. Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self.take_collections(1)
+
+    async def gen2_collections(self):
+        """Returns the full collections.
+
+        :returns: The number of generation 2 collections since the last
+            call. Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self.take_collections(2)
+
+    async def gc_pause_time(self):
+        """Returns the time spent in collections.
+
+        :returns: The total time (in seconds) of the collections since the
+            last call. Can be used as a profiler function.
+
+        :rtype: float.
+        """
+        return self._take('pause_time', self._pause_time)
+
+    async def max_gc_pause(self):
+        """Returns the longest collection.
+
+        :returns: The time (in seconds) of the longest collection since the
+            last call. Can be used as a profiler function.
+
+        :rtype: float.
+        """
+        max_pause, self._max_pause = self._max_pause, 0.0
+        return max_pause
+
+    async def gc_collected(self):
+        """Returns the objects freed by the collections.
+
+        :returns: The number of unreachable objects found by the
+            collections since the last call. Can be used as a profiler
+            function.
+
+        :rtype: int.
+        """
+        return self._take('collected', self._collected)
+
+    async def gc_uncollectable(self):
+        """Returns the objects the collections could not free.
+
+        :returns: The number of uncollectable objects found since the last
+            call. Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self._take('uncollectable', self._uncollectable)
@@ -1,11 +1,75 @@
 """Exposes constants."""
 
+# The channel notified with the uuid of every new tracing run.
+TRACING_RUN_CHANNEL = 'tracing_run_created'
+
+# The channel notified with the uuid of every run that new rows were stored
+# for; sent once per run and stored batch.
+TRACING_ROWS_CHANNEL = 'tracing_rows_stored'
+
 SQL_INSERT_RUN = """
-INSERT INTO tracing_run (uuid, app_name, column_names)  VALUES($1, $2, $3);
+WITH inserted AS (
+    INSERT INTO tracing_run (uuid, app_name, column_names)
+    VALUES($1, $2, $3) RETURNING uuid
+)
+SELECT pg_notify('""" + TRACING_RUN_CHANNEL + """', uuid) FROM inserted;
 """
 
 SQL_INSERT_ROW = """
-INSERT INTO tracing_row (uuid, row_data) VALUES($1, $2);
+INSERT INTO tracing_row (uuid, row_data, date_time)
+VALUES($1, $2, COALESCE($3, CURRENT_TIMESTAMP));
+"""
+
+TRACING_ROW_TABLE = 'tracing_row'
+
+TRACING_ROW_COPY_COLUMNS = ('uuid', 'row_data', 'date_time')
+
+SQL_NOTIFY_ROWS_STORED = """
+SELECT pg_notify('""" + TRACING_ROWS_CHANNEL + """', uuid)
+FROM unnest($1::varchar[]) AS uuid;
+"""
+
+SQL_SELECT_LAST_ROW_ID = """
+select coalesce(max(id), 0) as last_id from tracing_row where uuid=$1
+"""
+
+# Selects up to $3 raw rows of a run stored after the row with id $2.
+SQL_SELECT_ROWS_AFTER = """
+select id, date_time, row_data from tracing_row
+where uuid=$1 and id > $2
+order by id
+limit $3
+"""
+
+TRACING_STACK_TABLE = 'tracing_stack'
+
+TRACING_STACK_COPY_COLUMNS = ('uuid', 'date_time', 'stack', 'samples')
+
+# Adds up the stack samples of a run between $2 and $3 (both optional)
+# returning the $4 call paths with the most samples.
+SQL_SELECT_STACKS = """
+select
+    stack,
+    sum(samples) as samples
+from
+    tracing_stack
+where
+    uuid=$1 and
+    ($2::timestamp is null or date_time >= $2) and
+    ($3::timestamp is null or date_time < $3)
+group by
+    stack
+order by
+    samples desc
+limit $4
+"""
+
+SQL_DELETE_EXPIRED_STACKS = """
+delete from tracing_stack where uuid=$1 and date_time < $2
+"""
+
+SQL_CREATE_PARTITIONS = """
+SELECT create_tracing_row_partitions($1);
 """
 
 SQL_SELECT_NUMBER_OF_COLS = """
@@ -24,28 +88,288 @@ select uuid from tracing_run where app_name=$1
 order by creation_time desc limit 1
 """
 
-SQL_SELECT_ALL_TRACER_RUNS = """
- select app_name  from tracing_run group by app_name order by  max(creation_time) desc
+# Selects the runs of $1 applications (all of them if null) skipping the
+# first $2 ones; up to $3 runs (all of them if null) are selected for each
+# application. Applications are sorted by their latest run.
+SQL_SELECT_TRACER_TREE = """
+with apps as (
+    select
+        app_name,
+        max(creation_time) as last_run
+    from
+        tracing_run
+    group by
+        app_name
+    order by
+        last_run desc, app_name
+    limit $1 offset $2
+)
+select
+    a.app_name,
+    r.uuid,
+    r.creation_time
+from
+    apps a
+    cross join lateral (
+        select
+            uuid,
+            creation_time
+        from
+            tracing_run
+        where
+            app_name = a.app_name
+        order by
+            creation_time desc
+        limit $3
+    ) as r
+order by
+    a.last_run desc, a.app_name, r.creation_time desc
 """
 
-SQL_SELECT_RUNS = """
-select creation_time as creation_time, uuid from tracing_run where app_name = $1 order by creation_time desc;
+SQL_SELECT_APP_NAME = """
+Select app_name, creation_time from tracing_run where uuid=$1
 """
 
+# The rows of a run older than its rolled_up_until time are read from the
+# rolled up data (using the average of each bucket) and the rest from the raw
+# tracing rows.
+SQL_SELECT_TRACE_ROWS = """
+select 
+    bucket_start as date_time, 
+    row_avg as row_data 
+from 
+    tracing_row_rollup 
+where 
+    uuid=$1 and 
+    bucket_start < coalesce(
+        (select rolled_up_until from tracing_run where uuid=$1), '-infinity'
+    )
+union all
+select 
+    date_time, 
+    row_data 
+from 
+    tracing_row 
+where 
+    uuid=$1 and 
+    date_time >= coalesce(
+        (select rolled_up_until from tracing_run where uuid=$1), '-infinity'
+    )
+"""
 
-SQL_SELECT_APP_NAME = """
-Select app_name, creation_time from tracing_run where uuid=$1
+# Selects the rows of a run between $2 and $3 (both optional).
+SQL_SELECT_TRACE = """
+select date_time, row_data from (""" + SQL_SELECT_TRACE_ROWS + """) as trace
+where
+    ($2::timestamp is null or date_time >= $2) and
+    ($3::timestamp is null or date_time < $3)
+order by date_time
+"""
+
+# Selects the rows of a run between $2 and $3 (both optional) for csv export;
+# the columns to select follow the time.
+SQL_SELECT_TRACE_CSV = ("""
+select
+    to_char(date_time, 'YYYY-MM-DD HH24:MI:SS') as time{columns}
+from
+    (""" + SQL_SELECT_TRACE_ROWS + """) as trace
+where
+    ($2::timestamp is null or date_time >= $2) and
+    ($3::timestamp is null or date_time < $3)
+order by
+    date_time
+""").format
+
+# Selects the points of a run between $2 and $3 (both optional) reduced to
+# about $4 points per column (all of them if $4 is null); the points are
+# split to $4 / 2 buckets of consecutive rows keeping the min and the max
+# point of each bucket so the shape of the series is preserved. The idx of
+# a point is its position among all the selected rows.
+SQL_SELECT_DOWNSAMPLED_TRACE = """
+with trace as (
+    select
+        row_data,
+        row_number() over (order by date_time) - 1 as idx,
+        count(*) over () as total
+    from
+        (""" + SQL_SELECT_TRACE_ROWS + """) as trace_rows
+    where
+        ($2::timestamp is null or date_time >= $2) and
+        ($3::timestamp is null or date_time < $3)
+), points as (
+    select
+        v.col,
+        t.idx,
+        v.value,
+        case
+            when $4::integer is null or t.total <= $4 then t.idx
+            else t.idx * greatest($4 / 2, 1) / t.total
+        end as bucket
+    from
+        trace t,
+        unnest(t.row_data) with ordinality as v(value, col)
+), ranked as (
+    select
+        col,
+        idx,
+        value,
+        row_number() over (
+            partition by col, bucket order by value nulls last, idx
+        ) as min_rank,
+        row_number() over (
+            partition by col, bucket order by value desc nulls last, idx
+        ) as max_rank
+    from
+        points
+)
+select
+    col,
+    idx,
+    value
+from
+    ranked
+where
+    min_rank = 1 or max_rank = 1
+order by
+    col, idx
 """
 
 SQL_SELECT_RUN_INFO = """
-select                                                                             
-    count(*) as counter, 
-    min(a.date_time) as from_time,  
-    max(a.date_time) as to_time
+select
+    coalesce(sum(a.counter), 0) as counter,
+    min(a.from_time) as from_time,
+    max(a.to_time) as to_time
+from (
+    select
+        sum(samples) as counter,
+        min(bucket_start) as from_time,
+        max(bucket_start) as to_time
+    from
+        tracing_row_rollup
+    where
+        uuid=$1 and
+        bucket_start < coalesce(
+            (select rolled_up_until from tracing_run where uuid=$1),
+            '-infinity'
+        )
+    union all
+    select
+        count(*) as counter,
+        min(date_time) as from_time,
+        max(date_time) as to_time
+    from
+        tracing_row
+    where
+        uuid=$1 and
+        date_time >= coalesce(
+            (select rolled_up_until from tracing_run where uuid=$1),
+            '-infinity'
+        )
+) as a
+"""
+
+SQL_SELECT_RETENTION_POLICIES = """
+select app_name, raw_days, bucket_seconds from retention_policy
+"""
+
+SQL_UPSERT_RETENTION_POLICY = """
+insert into retention_policy (app_name, raw_days, bucket_seconds)
+values ($1, $2, $3)
+on conflict (app_name) do update set
+    raw_days = excluded.raw_days,
+    bucket_seconds = excluded.bucket_seconds
+"""
+
+SQL_DELETE_RETENTION_POLICY = """
+delete from retention_policy where app_name=$1
+"""
+
+SQL_TRY_RETENTION_LOCK = """
+select pg_try_advisory_lock(hashtext('tracing_row_retention'))
+"""
+
+SQL_RETENTION_UNLOCK = """
+select pg_advisory_unlock(hashtext('tracing_row_retention'))
+"""
+
+SQL_SELECT_LOCAL_TIME = """
+select localtimestamp
+"""
+
+SQL_SELECT_RUNS_FOR_RETENTION = """
+select uuid, app_name, rolled_up_until from tracing_run
+"""
+
+# Rolls up the rows of a run from $2 to $3 in buckets of $4 seconds.
+SQL_ROLLUP_RUN = """
+insert into tracing_row_rollup
+    (uuid, bucket_start, bucket_seconds, samples, row_min, row_max, row_avg)
+select
+    $1,
+    bucket_start,
+    $4,
+    max(samples),
+    array_agg(min_value order by idx),
+    array_agg(max_value order by idx),
+    array_agg(avg_value order by idx)
+from (
+    select
+        timestamp 'epoch' + interval '1 second' * $4 *
+            floor(extract(epoch from r.date_time)::float8 / $4)
+            as bucket_start,
+        v.idx,
+        min(v.value) as min_value,
+        max(v.value) as max_value,
+        avg(v.value)::real as avg_value,
+        count(*) as samples
+    from
+        tracing_row r,
+        unnest(r.row_data) with ordinality as v(value, idx)
+    where
+        r.uuid=$1 and r.date_time >= $2 and r.date_time < $3
+    group by 1, 2
+) as buckets
+group by bucket_start
+on conflict (uuid, bucket_start) do nothing
+"""
+
+SQL_UPDATE_ROLLED_UP_UNTIL = """
+update tracing_run set rolled_up_until=$2 where uuid=$1
+"""
+
+SQL_SELECT_ROW_PARTITIONS = """
+select 
+    c.relname as partition_name 
 from 
-    tracing_row a
+    pg_inherits i join pg_class c on c.oid = i.inhrelid 
 where 
-    a.uuid=$1
+    i.inhparent = 'tracing_row'::regclass
+"""
+
+SQL_RUN_HAS_ROWS_IN_PARTITION = """
+select exists(select 1 from {partition_name} where uuid=$1)
+""".format
+
+SQL_DROP_PARTITION = """
+drop table {partition_name}
+""".format
+
+# Adds the passed in sums to the statistics of a run; sums of a different
+# width than the stored ones are ignored.
+SQL_UPSERT_RUN_STATS = """
+insert into tracing_run_stats (uuid, width, n, sx, sxx, sxy)
+values ($1, $2, $3, $4, $5, $6)
+on conflict (uuid) do update set
+    n = add_float8_arrays(tracing_run_stats.n, excluded.n),
+    sx = add_float8_arrays(tracing_run_stats.sx, excluded.sx),
+    sxx = add_float8_arrays(tracing_run_stats.sxx, excluded.sxx),
+    sxy = add_float8_arrays(tracing_run_stats.sxy, excluded.sxy)
+where
+    tracing_run_stats.width = excluded.width
+"""
+
+SQL_SELECT_RUN_STATS = """
+select width, n, sx, sxx, sxy from tracing_run_stats where uuid=$1
 """
 
 MINUTE_IN_SECONDS = 60
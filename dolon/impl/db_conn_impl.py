@@ -1,6 +1,8 @@
 """Wraps db connection pool within a context manager."""
 
+import contextlib
 import os
+import time
 
 import asyncpg
 
@@ -9,6 +11,77 @@ import asyncpg
 _DEFAULT_HOST = "172.17.0.1"
 
 
+class _MeteredPool:
+    """Wraps a connection pool measuring its saturation and wait times.
+
+    Exposes the same acquire interface as the wrapped pool; every other
+    attribute is delegated to it.
+
+    :ivar asyncpg.pool.Pool _conn_pool: The wrapped pool.
+    :ivar int _waiting: The number of callers waiting for a connection.
+    """
+
+    def __init__(self, conn_pool):
+        self._conn_pool = conn_pool
+        self._waiting = 0
+        self._acquisitions = 0
+        self._last_wait = 0
+        self._max_wait = 0
+        self._total_wait = 0
+
+    def __getattr__(self, name):
+        return getattr(self._conn_pool, name)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, timeout=None):
+        """Acquires a connection from the pool measuring the time waited.
+
+        :param float timeout: The max time (in seconds) to wait for a
+            connection.
+        """
+        started = time.perf_counter()
+        self._waiting += 1
+        try:
+            conn = await self._conn_pool.acquire(timeout=timeout)
+        finally:
+            self._waiting -= 1
+        wait = time.perf_counter() - started
+        self._acquisitions += 1
+        self._last_wait = wait
+        self._max_wait = max(self._max_wait, wait)
+        self._total_wait += wait
+        try:
+            yield conn
+        finally:
+            await self._conn_pool.release(conn)
+
+    def get_metrics(self):
+        """Returns the saturation and wait time metrics of the pool.
+
+        Wait times are expressed in seconds; saturation is the ratio of the
+        connections in use to the max size of the pool.
+
+        :returns: The metrics of the pool.
+        :rtype: dict
+        """
+        size = self._conn_pool.get_size()
+        max_size = self._conn_pool.get_max_size()
+        in_use = size - self._conn_pool.get_idle_size()
+        acquisitions = self._acquisitions
+        return {
+            'size': size,
+            'max_size': max_size,
+            'in_use': in_use,
+            'saturation': in_use / max_size if max_size else 0,
+            'waiting': self._waiting,
+            'acquisitions': acquisitions,
+            'last_wait': self._last_wait,
+            'max_wait': self._max_wait,
+            'average_wait':
+                self._total_wait / acquisitions if acquisitions else 0,
+        }
+
+
 class DbConnectionImpl:
     """Wraps db connection pool within a context manager."""
 
@@ -25,16 +98,26 @@ class DbConnectionImpl:
         return self._conn_pool
 
     async def __aenter__(self):
-        self._conn_pool = await asyncpg.create_pool(
-            self._conn_str,
-            min_size=self._min_size,
-            max_size=self._max_size,
-            statement_cache_size=0,
-            max_inactive_connection_lifetime=10,
-            max_queries=1000
+        self._conn_pool = _MeteredPool(
+            await asyncpg.create_pool(
+                self._conn_str,
+                min_size=self._min_size,
+                max_size=self._max_size,
+                statement_cache_size=0,
+                max_inactive_connection_lifetime=10,
+                max_queries=1000
+            )
         )
         return self
 
+    def get_metrics(self):
+        """Returns the saturation and wait time metrics of the pool.
+
+        :returns: The metrics of the pool.
+        :rtype: dict
+        """
+        return self._conn_pool.get_metrics()
+
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         if self._conn_pool:
             await self._conn_pool.close()
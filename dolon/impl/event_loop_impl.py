@@ -0,0 +1,181 @@
+"""Measures how much the event loop is blocked.
+
+Three signals are collected:
+
+    lag         A timer is scheduled every probe interval; the delay between
+                the time it was due and the time it actually ran is how long
+                the loop was too busy to serve it.
+    callbacks   The time every callback of the loop takes to run is measured
+                by wrapping asyncio.Handle._run (task steps, call_soon and
+                timer callbacks all run through it); the ones that take
+                longer than a threshold are counted.
+    ready queue The number of callbacks waiting to run, read when the probe
+                runs (and not when the diagnostics are collected since the
+                tracer's own tasks are queued then).
+
+Every value is kept per window; reading a value starts a new window for it.
+"""
+
+import asyncio
+import threading
+import time
+
+# The monitors measuring the callbacks of their loop.
+_monitors = []
+_monitors_lock = threading.Lock()
+_original_run = asyncio.Handle._run
+
+
+def _timed_run(handle):
+    """Runs the callback of a handle measuring its duration."""
+    started = time.perf_counter()
+    try:
+        _original_run(handle)
+    finally:
+        duration = time.perf_counter() - started
+        for monitor in _monitors:
+            if duration >= monitor.slow_callback_duration and \
+                    handle._loop is monitor.loop:
+                monitor.add_slow_callback(duration)
+
+
+def _add_monitor(monitor):
+    """Starts measuring the callbacks for the passed in monitor."""
+    with _monitors_lock:
+        _monitors.append(monitor)
+        asyncio.Handle._run = _timed_run
+
+
+def _remove_monitor(monitor):
+    """Stops measuring the callbacks for the passed in monitor."""
+    with _monitors_lock:
+        _monitors.remove(monitor)
+        if not _monitors:
+            asyncio.Handle._run = _original_run
+
+
+class EventLoopMonitor:
+    """Measures the lag and the slow callbacks of an event loop.
+
+    :ivar float probe_interval: The time (in seconds) between lag probes.
+    :ivar float slow_callback_duration: The min duration (in seconds) of the
+        callbacks counted as slow; None to not measure the callbacks.
+    :ivar loop: The monitored loop.
+    """
+
+    def __init__(self, probe_interval=0.1, slow_callback_duration=0.1):
+        """Initializer.
+
+        :param float probe_interval: The time (in seconds) between probes.
+        :param float slow_callback_duration: The min duration (in seconds)
+            of the callbacks counted as slow; None to not measure them.
+        """
+        assert probe_interval > 0
+        self.probe_interval = probe_interval
+        self.slow_callback_duration = slow_callback_duration
+        self.loop = None
+        self._probe_handle = None
+        self._due_time = None
+        self._lag_total = 0.0
+        self._lag_count = 0
+        self._max_lag = 0.0
+        self._max_ready = 0
+        self._slow_callbacks = 0
+        self._slow_callbacks_time = 0.0
+
+    def start(self):
+        """Starts monitoring the running loop."""
+        assert self.loop is None
+        self.loop = asyncio.get_running_loop()
+        self._schedule_probe()
+        if self.slow_callback_duration is not None:
+            _add_monitor(self)
+
+    def stop(self):
+        """Stops monitoring."""
+        if self.loop is None:
+            return
+        if self.slow_callback_duration is not None:
+            _remove_monitor(self)
+        self._probe_handle.cancel()
+        self._probe_handle = None
+        self.loop = None
+
+    def add_slow_callback(self, duration):
+        """Counts a slow callback.
+
+        :param float duration: The time (in seconds) the callback took.
+        """
+        self._slow_callbacks += 1
+        self._slow_callbacks_time += duration
+
+    def take_lag(self):
+        """Returns the average lag (in seconds) of the probes of the window.
+
+        :returns: The average lag; None if no probe ran.
+        :rtype: float
+        """
+        if not self._lag_count:
+            return None
+        lag = self._lag_total / self._lag_count
+        self._lag_total, self._lag_count = 0.0, 0
+        return lag
+
+    def take_max_lag(self):
+        """Returns the max lag (in seconds) of the window.
+
+        :rtype: float
+        """
+        self._check_overdue_probe()
+        max_lag, self._max_lag = self._max_lag, 0.0
+        return max_lag
+
+    def take_max_ready(self):
+        """Returns the max number of ready callbacks seen in the window.
+
+        :rtype: int
+        """
+        max_ready, self._max_ready = self._max_ready, 0
+        return max_ready
+
+    def take_slow_callbacks(self):
+        """Returns the number of slow callbacks of the window.
+
+        :rtype: int
+        """
+        count, self._slow_callbacks = self._slow_callbacks, 0
+        return count
+
+    def take_slow_callbacks_time(self):
+        """Returns the total time (in seconds) of the slow callbacks.
+
+        :rtype: float
+        """
+        total, self._slow_callbacks_time = self._slow_callbacks_time, 0.0
+        return total
+
+    def _schedule_probe(self):
+        """Schedules the next lag probe."""
+        self._due_time = self.loop.time() + self.probe_interval
+        self._probe_handle = self.loop.call_at(self._due_time, self._probe)
+
+    def _probe(self):
+        """Records the lag of the probe and schedules the next one."""
+        lag = max(0.0, self.loop.time() - self._due_time)
+        self._lag_total += lag
+        self._lag_count += 1
+        self._max_lag = max(self._max_lag, lag)
+        self._max_ready = max(self._max_ready, len(self.loop._ready))
+        self._schedule_probe()
+
+    def _check_overdue_probe(self):
+        """Accounts for the lag of a probe that is overdue but not run yet.
+
+        A loop blocked for longer than the window would otherwise report no
+        lag until the probe finally runs.
+        """
+        if self.loop is None:
+            return
+        lag = self.loop.time() - self._due_time
+        if lag > self.probe_interval:
+            self._max_lag = max(self._max_lag, lag)
@@ -0,0 +1,128 @@
+"""Implements a compact histogram of non negative integers.
+
+Values are counted in log-linear buckets: every power of two range is split
+in SUB_BUCKETS equally sized buckets (values below 2 * SUB_BUCKETS have a
+bucket of their own) so any value is known within 1 / SUB_BUCKETS of its
+magnitude while the whole 64 bit range needs less than a thousand counters.
+Histograms with the same layout are merged by adding their counters.
+"""
+
+import array
+
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_BITS = 64
+
+# The number of buckets needed to count any value of up to MAX_BITS bits.
+NUMBER_OF_BUCKETS = ((MAX_BITS - SUB_BUCKET_BITS) << SUB_BUCKET_BITS) + \
+    SUB_BUCKETS
+
+
+def get_bucket_index(value):
+    """Returns the index of the bucket counting the passed in value.
+
+    :param int value: A non negative integer of up to MAX_BITS bits.
+
+    :returns: The index of the bucket.
+    :rtype: int
+    """
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift <= 0:
+        return value
+    return (shift << SUB_BUCKET_BITS) + (value >> shift)
+
+
+def get_bucket_upper_value(index):
+    """Returns the highest value counted by the passed in bucket.
+
+    :param int index: The index of the bucket.
+
+    :returns: The highest value counted by the bucket.
+    :rtype: int
+    """
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    if shift <= 0:
+        return index
+    sub_bucket = index - (shift << SUB_BUCKET_BITS)
+    return ((sub_bucket + 1) << shift) - 1
+
+
+class Histogram:
+    """Counts non negative integers in log-linear buckets.
+
+    :ivar array.array counts: The counter of each bucket.
+    :ivar int total: The number of counted values.
+    """
+
+    __slots__ = ('counts', 'total')
+
+    def __init__(self):
+        """Initializer."""
+        self.counts = array.array('Q', bytes(8 * NUMBER_OF_BUCKETS))
+        self.total = 0
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Creates a histogram holding the passed in counters.
+
+        :param counts: The counter of each bucket.
+
+        :returns: The histogram.
+        :rtype: Histogram
+        """
+        assert len(counts) == NUMBER_OF_BUCKETS
+        instance = cls()
+        instance.counts = array.array('Q', counts)
+        instance.total = sum(instance.counts)
+        return instance
+
+    def record(self, value):
+        """Counts a value.
+
+        :param int value: A non negative integer of up to MAX_BITS bits.
+        """
+        self.counts[get_bucket_index(value)] += 1
+        self.total += 1
+
+    def merge(self, other):
+        """Adds the values counted by another histogram to this one.
+
+        :param Histogram other: The histogram to merge.
+        """
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.total += other.total
+
+    def get_percentile(self, percentile):
+        """Returns the value below or at which a percentage of values fall.
+
+        :param float percentile: The percentage (0 to 100).
+
+        :returns: The highest value of the bucket where the percentile falls;
+            None if no value was counted.
+        :rtype: int
+        """
+        assert 0 <= percentile <= 100
+        if not self.total:
+            return None
+        target = max(1, -(-self.total * percentile // 100))
+        running_total = 0
+        for index, count in enumerate(self.counts):
+            running_total += count
+            if running_total >= target:
+                return get_bucket_upper_value(index)
+        return None
+
+    def get_max(self):
+        """Returns the max counted value.
+
+        :returns: The highest value of the bucket of the max counted value;
+            None if no value was counted.
+        :rtype: int
+        """
+        for index in range(len(self.counts) - 1, -1, -1):
+            if self.counts[index]:
+                return get_bucket_upper_value(index)
+        return None
@@ -0,0 +1,185 @@
+"""Implements the memory diagnostics of the trace client.
+
+The diagnostics come in tiers of increasing cost:
+
+    process     The resident and unique memory of the process; read from
+                /proc/self/statm where available, otherwise from a psutil
+                Process created once.
+    gc          The collections of the garbage collector and the objects
+                they collected, read from gc.get_stats (the pauses are
+                timed by gc_diagnostics).
+    tracemalloc The allocation sites that grew the most between snapshots;
+                tracemalloc slows down every allocation so it is only
+                enabled on request.
+"""
+
+import gc
+import os
+import tracemalloc
+
+import psutil
+
+_STATM_PATH = '/proc/self/statm'
+
+_process = None
+_page_size = None
+
+
+def _get_process():
+    """Returns the psutil Process of the current process.
+
+    The handle is created once per process since creating it is much more
+    expensive than reading from it.
+
+    :rtype: psutil.Process
+    """
+    global _process
+    if _process is None or _process.pid != os.getpid():
+        _process = psutil.Process()
+    return _process
+
+
+def get_rss():
+    """Returns the resident memory of the process.
+
+    :returns: The resident memory in bytes.
+    :rtype: int
+    """
+    global _page_size
+    try:
+        with open(_STATM_PATH, 'rb') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except OSError:
+        return _get_process().memory_info().rss
+    if _page_size is None:
+        _page_size = os.sysconf('SC_PAGE_SIZE')
+    return resident_pages * _page_size
+
+
+def get_uss():
+    """Returns the memory unique to the process.
+
+    Needs to walk the memory mappings of the process so it is slower than
+    get_rss.
+
+    :returns: The unique memory in bytes.
+    :rtype: int
+    """
+    return _get_process().memory_full_info().uss
+
+
+def get_rss_gb():
+    """Returns the resident memory of the process in Gb.
+
+    :rtype: float
+    """
+    return _get_process().memory_info().rss / 2. ** 30
+
+
+class GcWindow:
+    """Tracks the garbage collections since the last read.
+
+    Collections and collected objects are read from gc.get_stats so they
+    cost nothing between reads.
+    """
+
+    def __init__(self):
+        """Initializer."""
+        self._last_collections = self._get_collections()
+        self._last_collected = self._get_collected()
+
+    @staticmethod
+    def _get_collections():
+        """Returns the number of collections since the process started."""
+        return sum(stats['collections'] for stats in gc.get_stats())
+
+    @staticmethod
+    def _get_collected():
+        """Returns the objects collected since the process started."""
+        return sum(stats['collected'] for stats in gc.get_stats())
+
+    def take_collections(self):
+        """Returns the number of collections since the last call.
+
+        :rtype: int
+        """
+        collections = self._get_collections()
+        count = collections - self._last_collections
+        self._last_collections = collections
+        return count
+
+    def take_collected(self):
+        """Returns the number of objects collected since the last call.
+
+        :rtype: int
+        """
+        collected = self._get_collected()
+        count = collected - self._last_collected
+        self._last_collected = collected
+        return count
+
+
+class AllocationTracker:
+    """Compares tracemalloc snapshots to find the growing allocation sites.
+
+    :ivar int top_n: The number of allocation sites to report.
+    :ivar int frames: The number of frames stored per allocation.
+    :ivar list top_allocations: The (site, size_diff, count_diff) tuples of
+        the allocation sites whose size changed the most between the last
+        two snapshots, sizes in bytes.
+    """
+
+    def __init__(self, top_n=10, frames=1):
+        """Initializer.
+
+        :param int top_n: The number of allocation sites to report.
+        :param int frames: The number of frames stored per allocation; more
+            frames tell the sites apart better but cost more.
+        """
+        assert top_n > 0
+        assert frames > 0
+        self.top_n = top_n
+        self.frames = frames
+        self.top_allocations = []
+        self._started_tracing = False
+        self._snapshot = None
+
+    def start(self):
+        """Starts tracing the allocations unless already traced."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._snapshot = self._take_snapshot()
+
+    def stop(self):
+        """Stops tracing the allocations if started by start."""
+        self._snapshot = None
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def take_growth(self):
+        """Takes a new snapshot comparing it to the previous one.
+
+        Updates top_allocations.
+
+        :returns: The total size difference (in bytes) between the snapshots.
+        :rtype: int
+        """
+        snapshot = self._take_snapshot()
+        key_type = 'lineno' if self.frames == 1 else 'traceback'
+        differences = snapshot.compare_to(self._snapshot, key_type)
+        self._snapshot = snapshot
+        self.top_allocations = [
+            (str(difference.traceback), difference.size_diff,
+             difference.count_diff)
+            for difference in differences[:self.top_n]
+        ]
+        return sum(difference.size_diff for difference in differences)
+
+    @staticmethod
+    def _take_snapshot():
+        """Returns a snapshot without the allocations of tracemalloc itself."""
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+        ))
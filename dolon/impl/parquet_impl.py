@@ -0,0 +1,171 @@
+"""Exports tracing runs as parquet files.
+
+Requires pyarrow which is an optional dependency (pip install dolon[parquet]).
+"""
+
+import dolon.exceptions as exceptions
+import dolon.impl.constants as constants
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+    parquet = None
+
+_DEFAULT_BATCH_SIZE = 10000
+
+
+class _ChunkSink:
+    """A write only file collecting the written bytes until drained.
+
+    Lets the synchronous parquet writer produce the file in chunks that are
+    then passed to an async output.
+
+    :ivar list[bytes] _chunks: The bytes written since the last drain.
+    :ivar int _position: The number of bytes written so far.
+    """
+
+    def __init__(self):
+        """Initializer."""
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self):
+        """Returns the bytes written since the last drain.
+
+        :returns: The written bytes.
+        :rtype: bytes
+        """
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _check_dependencies():
+    """Checks that pyarrow is installed.
+
+    raises: MissingDependency
+    """
+    if pyarrow is None:
+        raise exceptions.MissingDependency(
+            "Exporting to parquet requires pyarrow: pip install pyarrow"
+        )
+
+
+async def export_traces_parquet(db, uuids, output, from_time=None,
+                                to_time=None, batch_size=_DEFAULT_BATCH_SIZE):
+    """Writes the tracing rows of the passed in runs as a parquet file.
+
+    The file holds a uuid and a time column followed by a float32 column
+    for each of the columns of the runs; values of columns a run does not
+    have are null. Rows are read from a cursor and written as one row group
+    per batch_size rows so memory use does not depend on the size of the
+    runs.
+
+    :param db: The database object to use.
+    :param list[str] uuids: The identifiers for the trace runs.
+    :param output: A coroutine function called with each chunk (bytes).
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are exported.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are exported.
+    :param int batch_size: The number of rows per row group.
+
+    raises: MissingDependency
+    """
+    _check_dependencies()
+    assert batch_size > 0
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        run_columns = {}
+        column_names = []
+        for uuid in uuids:
+            records = await conn.fetch(constants.SQL_SELECT_COL_NAMES, uuid)
+            run_columns[uuid] = [record['col_name'] for record in records]
+            for col_name in run_columns[uuid]:
+                if col_name not in column_names:
+                    column_names.append(col_name)
+
+        schema = pyarrow.schema(
+            [
+                pyarrow.field('uuid', pyarrow.string()),
+                pyarrow.field('time', pyarrow.timestamp('us')),
+            ] + [
+                pyarrow.field(col_name, pyarrow.float32())
+                for col_name in column_names
+            ]
+        )
+        sink = _ChunkSink()
+        writer = parquet.ParquetWriter(sink, schema)
+        try:
+            stmt = await conn.prepare(constants.SQL_SELECT_TRACE)
+            for uuid in uuids:
+                positions = [
+                    column_names.index(col_name)
+                    for col_name in run_columns[uuid]
+                ]
+                async with conn.transaction():
+                    cursor = await stmt.cursor(uuid, from_time, to_time)
+                    while True:
+                        records = await cursor.fetch(batch_size)
+                        if not records:
+                            break
+                        writer.write_batch(
+                            _make_batch(
+                                schema, uuid, records, positions,
+                                len(column_names)
+                            )
+                        )
+                        await output(sink.drain())
+        finally:
+            writer.close()
+        await output(sink.drain())
+
+
+def _make_batch(schema, uuid, records, positions, number_of_columns):
+    """Converts the passed in tracing rows to a record batch.
+
+    :param pyarrow.Schema schema: The schema of the batch.
+    :param str uuid: The identifier for the trace run.
+    :param list records: The tracing rows.
+    :param list[int] positions: The position in the file of each column of
+        the run.
+    :param int number_of_columns: The number of value columns in the file.
+
+    :returns: The record batch.
+    :rtype: pyarrow.RecordBatch
+    """
+    columns = [[None] * len(records) for _ in range(number_of_columns)]
+    for row_index, record in enumerate(records):
+        for value, position in zip(record['row_data'], positions):
+            columns[position][row_index] = value
+    arrays = [
+        pyarrow.array([uuid] * len(records), pyarrow.string()),
+        pyarrow.array(
+            [record['date_time'] for record in records],
+            pyarrow.timestamp('us')
+        ),
+    ] + [pyarrow.array(values, pyarrow.float32()) for values in columns]
+    return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
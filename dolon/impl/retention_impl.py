@@ -0,0 +1,199 @@
+"""Rolls up and expires the old tracing rows.
+
+The rows of a run that are older than the raw_days of its retention policy
+are rolled up to min / max / avg buckets and the rolled_up_until time of the
+run is moved forward; from then on the old rows of the run are read from the
+rolled up data.
+
+The raw rows are never deleted one by one; a monthly partition is dropped as
+a whole as soon as all the runs that have rows in it are rolled up past its
+end.
+"""
+
+import datetime
+import logging
+import re
+
+import dolon.impl.constants as constants
+
+_logger = logging.getLogger(__name__)
+
+# The application name of the policy that applies to all the applications
+# without their own policy.
+DEFAULT_POLICY = '*'
+
+_MONTHLY_PARTITION = re.compile(r'^tracing_row_(\d{4})_(\d{2})$')
+
+
+async def set_retention_policy(db, app_name, raw_days, bucket_seconds):
+    """Sets the retention policy for an application.
+
+    :param db: The database object to use.
+    :param str app_name: The application name; DEFAULT_POLICY to set the
+        policy for all the applications without their own policy.
+    :param int raw_days: The number of days to keep the raw rows for.
+    :param int bucket_seconds: The size of the buckets to roll up to.
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        await conn.execute(
+            constants.SQL_UPSERT_RETENTION_POLICY,
+            app_name,
+            raw_days,
+            bucket_seconds
+        )
+
+
+async def delete_retention_policy(db, app_name):
+    """Removes the retention policy of an application.
+
+    :param db: The database object to use.
+    :param str app_name: The application name.
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        await conn.execute(constants.SQL_DELETE_RETENTION_POLICY, app_name)
+
+
+async def apply_retention(db):
+    """Rolls up the expired rows and drops the expired partitions.
+
+    Only one caller can apply the retention at the same time; calls made
+    while another one is running return immediately.
+
+    :param db: The database object to use.
+
+    :returns: The names of the dropped partitions.
+    :rtype: list[str]
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        if not await conn.fetchval(constants.SQL_TRY_RETENTION_LOCK):
+            return []
+        try:
+            now = await conn.fetchval(constants.SQL_SELECT_LOCAL_TIME)
+            policies = {
+                record['app_name']: record
+                for record in await conn.fetch(
+                    constants.SQL_SELECT_RETENTION_POLICIES
+                )
+            }
+            runs = await conn.fetch(constants.SQL_SELECT_RUNS_FOR_RETENTION)
+            rolled_up_until = {}
+            for run in runs:
+                rolled_up_until[run['uuid']] = await _rollup_run(
+                    conn, run, policies, now
+                )
+            return await _drop_expired_partitions(conn, rolled_up_until, now)
+        finally:
+            await conn.execute(constants.SQL_RETENTION_UNLOCK)
+
+
+async def _rollup_run(conn, run, policies, now):
+    """Rolls up the rows of the run that expired since its last roll up.
+
+    Stack samples are not rolled up; the expired ones are deleted.
+
+    :param conn: The connection to use.
+    :param run: The record of the run.
+    :param dict policies: Maps application names to retention policies.
+    :param datetime.datetime now: The current database time.
+
+    :returns: The time up to which the run is rolled up.
+    :rtype: datetime.datetime
+    """
+    previous_cutoff = run['rolled_up_until']
+    policy = policies.get(run['app_name']) or policies.get(DEFAULT_POLICY)
+    if not policy:
+        return previous_cutoff
+    bucket_seconds = policy['bucket_seconds']
+    cutoff = _align_to_bucket(
+        now - datetime.timedelta(days=policy['raw_days']), bucket_seconds
+    )
+    if previous_cutoff and previous_cutoff >= cutoff:
+        return previous_cutoff
+    async with conn.transaction():
+        await conn.execute(
+            constants.SQL_ROLLUP_RUN,
+            run['uuid'],
+            previous_cutoff or datetime.datetime.min,
+            cutoff,
+            bucket_seconds
+        )
+        await conn.execute(
+            constants.SQL_UPDATE_ROLLED_UP_UNTIL, run['uuid'], cutoff
+        )
+        await conn.execute(
+            constants.SQL_DELETE_EXPIRED_STACKS, run['uuid'], cutoff
+        )
+    return cutoff
+
+
+async def _drop_expired_partitions(conn, rolled_up_until, now):
+    """Drops the monthly partitions that hold only rolled up rows.
+
+    Rows of unknown runs do not prevent a partition from being dropped
+    since they can never be displayed.
+
+    :param conn: The connection to use.
+    :param dict rolled_up_until: Maps run identifiers to the time they are
+        rolled up to.
+    :param datetime.datetime now: The current database time.
+
+    :returns: The names of the dropped partitions.
+    :rtype: list[str]
+    """
+    dropped = []
+    for record in await conn.fetch(constants.SQL_SELECT_ROW_PARTITIONS):
+        partition_name = record['partition_name']
+        partition_end = _get_partition_end(partition_name)
+        if partition_end is None or partition_end > now:
+            continue
+        has_raw_rows = constants.SQL_RUN_HAS_ROWS_IN_PARTITION(
+            partition_name=partition_name
+        )
+        for uuid, cutoff in rolled_up_until.items():
+            if cutoff is None or cutoff < partition_end:
+                if await conn.fetchval(has_raw_rows, uuid):
+                    break
+        else:
+            await conn.execute(
+                constants.SQL_DROP_PARTITION(partition_name=partition_name)
+            )
+            _logger.info("Dropped expired partition %s", partition_name)
+            dropped.append(partition_name)
+    return dropped
+
+
+def _get_partition_end(partition_name):
+    """Returns the time the passed in monthly partition ends at.
+
+    :param str partition_name: The name of the partition.
+
+    :returns: The end of the partition (exclusive) or None if the partition
+        is not a monthly one.
+    :rtype: datetime.datetime
+    """
+    match = _MONTHLY_PARTITION.match(partition_name)
+    if not match:
+        return None
+    year, month = int(match.group(1)), int(match.group(2))
+    if month == 12:
+        return datetime.datetime(year + 1, 1, 1)
+    return datetime.datetime(year, month + 1, 1)
+
+
+def _align_to_bucket(date_time, bucket_seconds):
+    """Aligns the passed in time to the start of its bucket.
+
+    :param datetime.datetime date_time: The time to align.
+    :param int bucket_seconds: The size of the bucket.
+
+    :returns: The start of the bucket the time belongs to.
+    :rtype: datetime.datetime
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+    seconds = int((date_time - epoch).total_seconds())
+    return epoch + datetime.timedelta(
+        seconds=seconds - seconds % bucket_seconds
+    )
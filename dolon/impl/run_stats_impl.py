@@ -0,0 +1,185 @@
+"""Maintains the running sufficient statistics of the tracing runs.
+
+For every pair of columns (i, j) of a run the following sums are kept over
+the rows where both values are present:
+
+    n[i][j]     The number of rows.
+    sx[i][j]    The sum of the values of column i.
+    sxx[i][j]   The sum of the squares of the values of column i.
+    sxy[i][j]   The sum of the products of the values of columns i and j.
+
+The sums of column j for the same rows are found at [j][i] so any
+correlation of the run is computed from them in constant time, without
+reading the tracing rows. Each matrix is stored flattened in row-major
+order.
+
+The statistics are added up as the rows are stored so they always reflect
+all the raw rows of a run, including the ones later removed by the
+retention policies.
+"""
+
+import math
+
+import dolon.impl.constants as constants
+
+
+class RunStats:
+    """Accumulates the sufficient statistics of rows of the same width.
+
+    :ivar int width: The number of values in each row.
+    :ivar list[float] n: The number of rows per pair of columns.
+    :ivar list[float] sx: The sums of the values per pair of columns.
+    :ivar list[float] sxx: The sums of the squares per pair of columns.
+    :ivar list[float] sxy: The sums of the products per pair of columns.
+    """
+
+    def __init__(self, width):
+        """Initializer.
+
+        :param int width: The number of values in each row.
+        """
+        self.width = width
+        size = width * width
+        self.n = [0.0] * size
+        self.sx = [0.0] * size
+        self.sxx = [0.0] * size
+        self.sxy = [0.0] * size
+
+    def add_row(self, row_data):
+        """Adds the values of a row.
+
+        Missing values (None or NaN) are excluded from every pair they
+        belong to.
+
+        :param list row_data: The values of the row.
+        """
+        assert len(row_data) == self.width
+        width = self.width
+        n, sx, sxx, sxy = self.n, self.sx, self.sxx, self.sxy
+        present = [
+            (index, value, value * value)
+            for index, value in enumerate(row_data)
+            if value is not None and not math.isnan(value)
+        ]
+        for position, (i, x, xx) in enumerate(present):
+            ii = i * width + i
+            n[ii] += 1
+            sx[ii] += x
+            sxx[ii] += xx
+            sxy[ii] += xx
+            row_offset = i * width
+            for j, y, yy in present[position + 1:]:
+                ij = row_offset + j
+                ji = j * width + i
+                n[ij] += 1
+                sx[ij] += x
+                sx[ji] += y
+                sxx[ij] += xx
+                sxx[ji] += yy
+                sxy[ij] += x * y
+
+    def get_record(self, uuid):
+        """Returns the arguments to store the statistics for a run.
+
+        Mirrors the symmetric sums that add_row keeps for i < j only.
+
+        :param str uuid: The identifier for the trace run.
+
+        :returns: The arguments of SQL_UPSERT_RUN_STATS.
+        :rtype: tuple
+        """
+        width = self.width
+        n = list(self.n)
+        sxy = list(self.sxy)
+        for i in range(width):
+            for j in range(i + 1, width):
+                n[j * width + i] = n[i * width + j]
+                sxy[j * width + i] = sxy[i * width + j]
+        return uuid, width, n, self.sx, self.sxx, sxy
+
+
+def make_run_stats(rows):
+    """Computes the statistics for the passed in tracing rows.
+
+    :param rows: The (uuid, row_data) pairs of the tracing rows.
+
+    :returns: The arguments of SQL_UPSERT_RUN_STATS for each run.
+    :rtype: list[tuple]
+    """
+    stats = {}
+    for uuid, row_data in rows:
+        key = uuid, len(row_data)
+        run_stats = stats.get(key)
+        if run_stats is None:
+            run_stats = stats[key] = RunStats(len(row_data))
+        run_stats.add_row(row_data)
+    return [
+        run_stats.get_record(uuid) for (uuid, _), run_stats in stats.items()
+    ]
+
+
+async def store_run_stats(conn, rows):
+    """Adds the statistics of the passed in tracing rows to their runs.
+
+    Rows whose width differs from the width of the statistics already
+    stored for their run are ignored.
+
+    :param conn: The connection to use.
+    :param rows: The (uuid, row_data) pairs of the tracing rows.
+    """
+    records = make_run_stats(rows)
+    if records:
+        await conn.executemany(constants.SQL_UPSERT_RUN_STATS, records)
+
+
+def get_correlation(stats, width, i, j):
+    """Returns the correlation between two columns.
+
+    :param dict stats: Holds the n, sx, sxx and sxy sums of the run.
+    :param int width: The number of columns of the run.
+    :param int i: The index of the first column.
+    :param int j: The index of the second column.
+
+    :returns: The Pearson correlation; None if it cannot be computed.
+    :rtype: float
+    """
+    ij = i * width + j
+    ji = j * width + i
+    n = stats['n'][ij]
+    if n < 2:
+        return None
+    sx = stats['sx'][ij]
+    sy = stats['sx'][ji]
+    var_x = n * stats['sxx'][ij] - sx * sx
+    var_y = n * stats['sxx'][ji] - sy * sy
+    if var_x <= 0 or var_y <= 0:
+        return None
+    correlation = (n * stats['sxy'][ij] - sx * sy) / math.sqrt(var_x * var_y)
+    return max(-1.0, min(1.0, correlation))
+
+
+async def get_correlations(db, uuid):
+    """Returns the correlation matrix of a run.
+
+    Only the stored statistics are read so the cost depends on the number
+    of columns and not on the number of rows; live runs are supported.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+
+    :returns: The column names and the correlation matrix; correlations that
+        cannot be computed are None.
+    :rtype: dict
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        records = await conn.fetch(constants.SQL_SELECT_COL_NAMES, uuid)
+        column_names = [record['col_name'] for record in records]
+        stats = await conn.fetchrow(constants.SQL_SELECT_RUN_STATS, uuid)
+    matrix = [[None] * len(column_names) for _ in column_names]
+    if stats is not None:
+        width = min(stats['width'], len(column_names))
+        for i in range(width):
+            for j in range(width):
+                matrix[i][j] = get_correlation(stats, stats['width'], i, j)
+    return {'columns': column_names, 'matrix': matrix}
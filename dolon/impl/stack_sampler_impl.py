@@ -0,0 +1,129 @@
+"""Samples the call stacks of the running threads.
+
+A background thread wakes up at a fixed interval and reads the current frame
+of every other thread through sys._current_frames; each stack is folded to a
+single string holding its frames from the outermost to the innermost
+separated by ';' and the samples are counted per folded stack. Since the
+samples are taken regardless of what the threads are doing the counts are
+proportional to wall clock time, including time spent waiting.
+"""
+
+import sys
+import threading
+
+# Stands for the outermost frames of stacks deeper than the max depth.
+TRUNCATED_FRAME = '...'
+
+
+class StackSamplerImpl:
+    """Counts the samples of the call stacks of the running threads.
+
+    :ivar float interval: The time (in seconds) between samples.
+    :ivar int max_depth: The max number of frames kept per stack; the
+        innermost frames are kept.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        """Initializer.
+
+        :param float interval: The time (in seconds) between samples.
+        :param int max_depth: The max number of frames kept per stack.
+        """
+        assert interval > 0
+        assert max_depth > 0
+        self.interval = interval
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stacks = {}
+        self._samples = 0
+        # Maps the code objects to their frame names.
+        self._frame_names = {}
+
+    def start(self):
+        """Starts sampling in a background thread."""
+        assert self._thread is None
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='dolon-stack-sampler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling waiting for the background thread to exit."""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def take_samples(self):
+        """Returns the number of samples taken since the last call.
+
+        :rtype: int
+        """
+        with self._lock:
+            samples, self._samples = self._samples, 0
+        return samples
+
+    def take_stacks(self):
+        """Returns the stacks sampled since the last call.
+
+        :returns: Maps the folded stacks to their number of samples.
+        :rtype: dict
+        """
+        with self._lock:
+            stacks, self._stacks = self._stacks, {}
+        return stacks
+
+    def sample(self):
+        """Samples the stacks of all threads but the calling one."""
+        own_id = threading.get_ident()
+        folded = [
+            self._fold(frame)
+            for thread_id, frame in sys._current_frames().items()
+            if thread_id != own_id
+        ]
+        with self._lock:
+            stacks = self._stacks
+            for stack in folded:
+                stacks[stack] = stacks.get(stack, 0) + 1
+            self._samples += len(folded)
+
+    def _run(self):
+        """Samples until stopped."""
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def _fold(self, frame):
+        """Returns the folded stack ending to the passed in frame.
+
+        :param frame: The innermost frame of the stack.
+
+        :rtype: str
+        """
+        names = []
+        frame_names = self._frame_names
+        while frame is not None:
+            if len(names) == self.max_depth:
+                names.append(TRUNCATED_FRAME)
+                break
+            code = frame.f_code
+            name = frame_names.get(code)
+            if name is None:
+                name = frame_names[code] = self._get_frame_name(frame)
+            names.append(name)
+            frame = frame.f_back
+        names.reverse()
+        return ';'.join(names)
+
+    @staticmethod
+    def _get_frame_name(frame):
+        """Returns the name of the function running in the passed in frame.
+
+        :rtype: str
+        """
+        code = frame.f_code
+        module = frame.f_globals.get('__name__') or '?'
+        function = getattr(code, 'co_qualname', code.co_name)
+        return f'{module}:{function}'.replace(';', ',')
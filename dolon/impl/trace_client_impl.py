@@ -2,21 +2,48 @@ import aiohttp
 import asyncio
 import datetime
 import json
+import logging
 import os
 import socket
-import tracemalloc
+import time
 import uuid
 
+import dolon.impl.wire_protocol as wire_protocol
+
+_logger = logging.getLogger(__name__)
+
+# The max size of the datagrams holding stack samples; they are sent at most
+# once per tracing interval so they are allowed to exceed the MTU.
+_MAX_STACKS_DATAGRAM_SIZE = 60000
+
 
 class TraceClientImpl:
 
-    def __init__(self, app_name, host, port, verbose, *diagnostics):
+    def __init__(self, app_name, host, port, verbose, *diagnostics,
+                 use_binary=False, max_batch_delay=0,
+                 max_datagram_size=1400, diagnostic_timeout=None,
+                 report_latency=False):
         self._app_name = app_name
         self._host = host
         self._port = port
         self._diagnostics = list(diagnostics)
+        self._stack_samplers = [
+            diagnostic for diagnostic in self._diagnostics
+            if hasattr(diagnostic, 'take_stacks')
+        ]
+        self._diagnostic_timeout = diagnostic_timeout
+        self._report_latency = report_latency
+        self._last_values = [None] * len(self._diagnostics)
+        self._running = [None] * len(self._diagnostics)
         self._socket = None
         self._verbose = verbose
+        self._use_binary = use_binary
+        self._row_encoder = None
+        self._max_batch_delay = max_batch_delay
+        self._max_datagram_size = max_datagram_size
+        self._max_rows_size = 0
+        self._pending_rows = []
+        self._pending_size = 0
 
     def _send(self, data):
         assert self._socket
@@ -25,22 +52,153 @@ class TraceClientImpl:
         txt = json.dumps(data)
         self._socket.sendto(txt.encode('utf-8'), (self._host, self._port))
 
+    def _send_rows(self, rows):
+        if self._row_encoder:
+            if len(rows) == 1:
+                timestamp, row_data = rows[0]
+                frame = self._row_encoder.encode(row_data, timestamp)
+            else:
+                frame = self._row_encoder.encode_rows(rows)
+            self._socket.sendto(frame, (self._host, self._port))
+        elif len(rows) == 1:
+            self._send({"msg_type": "row", "row_data": rows[0][1]})
+        else:
+            self._send({
+                "msg_type": "rows",
+                "rows": [[timestamp, row_data] for timestamp, row_data in rows]
+            })
+
+    def _send_stacks(self, stacks, timestamp):
+        """Sends the sampled stacks splitting them in several datagrams.
+
+        Stacks too big to fit in a datagram of their own are dropped.
+        """
+        empty_msg = {
+            "msg_type": "stacks",
+            "timestamp": timestamp,
+            "stacks": {},
+            "uuid": self._uuid
+        }
+        max_size = _MAX_STACKS_DATAGRAM_SIZE - len(json.dumps(empty_msg))
+        chunk, chunk_size = {}, 0
+        for stack, samples in stacks.items():
+            size = len(json.dumps({stack: samples}))
+            if size > max_size:
+                continue
+            if chunk and chunk_size + size > max_size:
+                self._send({
+                    "msg_type": "stacks",
+                    "timestamp": timestamp,
+                    "stacks": chunk
+                })
+                chunk, chunk_size = {}, 0
+            chunk[stack] = samples
+            chunk_size += size
+        if chunk:
+            self._send({
+                "msg_type": "stacks",
+                "timestamp": timestamp,
+                "stacks": chunk
+            })
+
+    def _get_row_size(self, timestamp, row_data):
+        if self._row_encoder:
+            return wire_protocol.get_row_size(len(row_data))
+        return len(json.dumps([timestamp, row_data])) + 2
+
+    def _flush_rows(self):
+        if self._pending_rows:
+            self._send_rows(self._pending_rows)
+            self._pending_rows = []
+            self._pending_size = 0
+
+    def _add_row(self, row_data, timestamp, frequency):
+        """Sends the row batching it with others if batching is enabled.
+
+        Rows are accumulated until the datagram holding them would exceed
+        the max datagram size or until the oldest of them would exceed the
+        max batch delay by waiting for the next sample.
+        """
+        if not self._max_batch_delay:
+            self._send_rows([(timestamp, row_data)])
+            return
+        row_size = self._get_row_size(timestamp, row_data)
+        if self._pending_size + row_size > self._max_rows_size:
+            self._flush_rows()
+        self._pending_rows.append((timestamp, row_data))
+        self._pending_size += row_size
+        oldest_timestamp = self._pending_rows[0][0]
+        if timestamp + frequency - oldest_timestamp > self._max_batch_delay:
+            self._flush_rows()
+
+    async def _collect(self, index, timeout):
+        """Collects the value of a diagnostic.
+
+        A diagnostic that does not complete within the timeout keeps running
+        in the background and its last known value is used instead; no new
+        call is started for it until the running one completes.
+
+        :returns: The value of the diagnostic and the time (in seconds) it
+            has been running for.
+        :rtype: tuple
+        """
+        if self._running[index] is None:
+            task = asyncio.ensure_future(self._diagnostics[index]())
+            self._running[index] = task, time.perf_counter()
+        task, started = self._running[index]
+        await asyncio.wait([task], timeout=timeout)
+        latency = time.perf_counter() - started
+        if task.done():
+            self._running[index] = None
+            try:
+                self._last_values[index] = task.result()
+            except Exception as ex:
+                _logger.exception(ex)
+        return self._last_values[index], latency
+
     async def run(self, frequency):
+        """Samples the diagnostics sending them to the mnemic service.
+
+        The diagnostics are collected concurrently on a fixed schedule so
+        the time they take does not skew the sampling frequency; samples
+        that are missed because collection took too long are skipped.
+        """
+        timeout = self._diagnostic_timeout or frequency / 2
+        loop = asyncio.get_event_loop()
+        next_sample_time = loop.time() + frequency
         while 1:
-            await asyncio.sleep(frequency)
-            msg = {
-                "msg_type": "row",
-                "row_data": [
-                    await diagnostic() for diagnostic in self._diagnostics
-                ]
-            }
+            await asyncio.sleep(max(0, next_sample_time - loop.time()))
+            timestamp = time.time()
+            collected = await asyncio.gather(*[
+                self._collect(index, timeout)
+                for index in range(len(self._diagnostics))
+            ])
+            row_data = [value for value, _ in collected]
+            if self._report_latency:
+                row_data += [latency for _, latency in collected]
             if self._verbose:
-                print("Sending:", msg)
-            self._send(msg)
+                print("Sending:", row_data)
+            self._add_row(row_data, timestamp, frequency)
+            for diagnostic in self._stack_samplers:
+                stacks = diagnostic.take_stacks()
+                if stacks:
+                    self._send_stacks(stacks, timestamp)
+            next_sample_time += frequency
+            now = loop.time()
+            if next_sample_time < now:
+                missed = (now - next_sample_time) // frequency + 1
+                next_sample_time += missed * frequency
 
     async def __aenter__(self):
-        tracemalloc.start()
         self._uuid = str(uuid.uuid4())
+        if self._use_binary:
+            self._row_encoder = wire_protocol.RowEncoder(self._uuid)
+            self._max_rows_size = self._max_datagram_size - \
+                wire_protocol.ROWS_OVERHEAD
+        else:
+            empty_msg = {"msg_type": "rows", "rows": [], "uuid": self._uuid}
+            self._max_rows_size = self._max_datagram_size - \
+                len(json.dumps(empty_msg))
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, 0)
         column_names = []
         for diagnostic in self._diagnostics:
@@ -50,6 +208,8 @@ class TraceClientImpl:
                 column_names.append(diagnostic.__class__.__name__)
             else:
                 raise ValueError
+        if self._report_latency:
+            column_names += [f'{name}_latency' for name in column_names]
 
         msg = {
             "msg_type": "create_trace_run",
@@ -60,10 +220,14 @@ class TraceClientImpl:
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
+        for running in self._running:
+            if running is not None:
+                running[0].cancel()
+        self._running = [None] * len(self._diagnostics)
         if self._socket:
+            self._flush_rows()
             self._socket.close()
             self._socket = None
-            tracemalloc.stop()
 
 
 class RabbitmqStats:
@@ -4,22 +4,26 @@ import datetime
 import json
 import math
 
-import dolon.db_conn as db_conn
 import dolon.exceptions as exceptions
 import dolon.impl.constants as constants
-
-# Aliases.
-DbConnection = db_conn.DbConnection
+import dolon.impl.run_stats_impl as run_stats_impl
+import dolon.impl.wire_protocol as wire_protocol
+import dolon.trace_data as trace_data
 
 _PREFETCH_SIZE = 100
 
 
-async def process_message(db, payload):
+async def process_message(db, payload, row_batcher=None):
     """Processes a tracing message storing it to the db.
 
     :param db: The database object to use.
 
-    :param dict payload: A dict representing the message to store.
+    :param dict payload: A dict representing the message to store; the
+        received datagram can also be passed as is, either as json or as a
+        binary frame (see wire_protocol).
+
+    :param RowBatcher row_batcher: If passed, tracing rows are buffered to it
+        to be stored in batches instead of being inserted one by one.
 
     Can be either a tracing run creation in the form of:
 
@@ -38,13 +42,36 @@ async def process_message(db, payload):
             "row_data": [12.2, 123.1]
         }
 
+    or for the insertion of several tracing rows along with the client
+    timestamp (epoch) they were sampled at:
+
+        msg = {
+            "msg_type": "rows",
+            "uuid": identifier,
+            "rows": [
+                [1622305220.25, [12.2, 123.1]],
+                [1622305220.75, [12.4, 121.0]]
+            ]
+        }
+
+    or for the insertion of the stack samples taken since the previous
+    stacks message, counted per call path (see trace_client.StackSampler):
+
+        msg = {
+            "msg_type": "stacks",
+            "uuid": identifier,
+            "timestamp": 1622305220.25,
+            "stacks": {"__main__:main;__main__:work": 12}
+        }
+
     raises: InvalidMessage
     """
-    if not isinstance(payload, dict):
-        assert isinstance(payload, str)
-        msg = json.loads(payload)
-    else:
-        msg = payload
+    if wire_protocol.is_binary(payload):
+        identifier, _, rows = wire_protocol.decode(payload)
+        for timestamp, row_data in rows:
+            await store_row(db, identifier, row_data, row_batcher, timestamp)
+        return
+    msg = decode_message(payload)
     # logging.info(str(payload)) # Will cause missed messages.
     msg_type = msg.get('msg_type')
     try:
@@ -61,7 +88,40 @@ async def process_message(db, payload):
         elif msg_type == 'row':
             identifier = msg.get('uuid')
             row_data = msg.get('row_data')
-            await _insert_row(db, identifier, *row_data)
+            if not _is_valid_row(identifier, row_data):
+                raise exceptions.InvalidMessage(
+                    f"Message not supported: {str(payload)}"
+                )
+            await store_row(db, identifier, row_data, row_batcher)
+        elif msg_type == 'rows':
+            identifier = msg.get('uuid')
+            rows = msg.get('rows')
+            if not isinstance(rows, list) or not all(
+                    isinstance(row, list) and len(row) == 2 and
+                    isinstance(row[0], (int, float)) and
+                    _is_valid_row(identifier, row[1])
+                    for row in rows):
+                raise exceptions.InvalidMessage(
+                    f"Message not supported: {str(payload)}"
+                )
+            for timestamp, row_data in rows:
+                await store_row(
+                    db, identifier, row_data, row_batcher, timestamp
+                )
+        elif msg_type == 'stacks':
+            identifier = msg.get('uuid')
+            timestamp = msg.get('timestamp')
+            stacks = msg.get('stacks')
+            if not identifier or not isinstance(identifier, str) or \
+                    not isinstance(timestamp, (int, float)) or \
+                    not isinstance(stacks, dict) or not all(
+                        isinstance(stack, str) and isinstance(samples, int)
+                        and samples > 0
+                        for stack, samples in stacks.items()):
+                raise exceptions.InvalidMessage(
+                    f"Message not supported: {str(payload)}"
+                )
+            await store_stacks(db, identifier, timestamp, stacks)
         else:
             raise exceptions.InvalidMessage(
                 f"Message not supported: {str(payload)}"
@@ -72,40 +132,170 @@ async def process_message(db, payload):
         ) from ex
 
 
-async def get_trace_as_json(uuid):
-    """Returns all the tracing rows for the passed in uuid as json.
+async def store_row(db, identifier, row_data, row_batcher=None,
+                    timestamp=None):
+    """Stores a tracing row.
+
+    :param db: The database object to use.
+    :param str identifier: The identifier for the trace run.
+    :param list row_data: Represent the values for each data point.
+    :param RowBatcher row_batcher: If passed, the row is buffered to it to be
+        stored in the next batch.
+    :param float timestamp: The time the row was sampled (epoch); if not
+        passed the time the row is stored is used.
+    """
+    date_time = None
+    if timestamp is not None:
+        date_time = datetime.datetime.fromtimestamp(timestamp)
+    if row_batcher:
+        await row_batcher.add_row(identifier, row_data, date_time)
+    else:
+        await _insert_row(db, identifier, row_data, date_time)
+
+
+async def store_stacks(db, identifier, timestamp, stacks):
+    """Stores the stack samples of a run.
+
+    :param db: The database object to use.
+    :param str identifier: The identifier for the trace run.
+    :param float timestamp: The time the samples were taken until (epoch).
+    :param dict stacks: Maps the call paths to their number of samples.
+    """
+    date_time = datetime.datetime.fromtimestamp(timestamp)
+    records = [
+        (identifier, date_time, stack, samples)
+        for stack, samples in stacks.items()
+    ]
+    if not records:
+        return
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        await conn.copy_records_to_table(
+            constants.TRACING_STACK_TABLE,
+            records=records,
+            columns=constants.TRACING_STACK_COPY_COLUMNS
+        )
+
+
+async def get_stacks(db, uuid, from_time=None, to_time=None,
+                     max_stacks=5000):
+    """Returns the stack samples of a run added up per call path.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
+    :param datetime.datetime from_time: If passed, samples taken before it
+        are excluded.
+    :param datetime.datetime to_time: If passed, samples taken at or after
+        it are excluded.
+    :param int max_stacks: The max number of call paths to return.
+
+    :returns: The (stack, samples) pairs, the most sampled first.
+    :rtype: list[tuple]
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        records = await conn.fetch(
+            constants.SQL_SELECT_STACKS, uuid, from_time, to_time, max_stacks
+        )
+    return [(record['stack'], record['samples']) for record in records]
 
-    :returns: All the tracing rows for the passed in uuid as json.
-    :rtype: list[dict]
+
+def decode_message(payload):
+    """Decodes a tracing message.
+
+    :param payload: The message to decode; can be the raw datagram, its
+        decoded text or an already decoded dict.
+
+    :returns: The decoded message.
+    :rtype: dict
+
+    raises: InvalidMessage
     """
-    data = await get_trace(uuid)
-    lines = data.split('\n')
-    field_names = lines[0].split(',')
-    columns = [list() for _ in range(len(field_names))]
-
-    for line in lines[1:]:
-        fields = line.split(',')
-        for index, value in enumerate(fields):
-            try:
-                columns[index].append(float(value))
-            except ValueError:
-                columns[index].append(value)
-
-    trace_as_json = {}
-    for field_name, values in zip(field_names, columns):
-        if field_name != 'time':
-            value_pairs = [["Time", field_name]] + \
-                          [[i, v] for i, v in enumerate(values)]
-            trace_as_json[field_name] = value_pairs
+    if isinstance(payload, dict):
+        return payload
+    try:
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        msg = json.loads(payload)
+    except (TypeError, ValueError) as ex:
+        raise exceptions.InvalidMessage(
+            f"Message not supported: {str(payload)}"
+        ) from ex
+    if not isinstance(msg, dict):
+        raise exceptions.InvalidMessage(
+            f"Message not supported: {str(payload)}"
+        )
+    return msg
+
+
+def _is_valid_row(identifier, row_data):
+    """Checks if the passed in row can be stored.
+
+    Validation happens before the row is stored since a single invalid row
+    would otherwise fail the whole batch it belongs to.
+
+    :param str identifier: The identifier for the trace run.
+    :param list row_data: Represent the values for each data point.
+
+    :returns: True if the row can be stored.
+    :rtype: bool
+    """
+    if not identifier or not isinstance(identifier, str):
+        return False
+    if not isinstance(row_data, list):
+        return False
+    return all(
+        value is None or isinstance(value, (int, float))
+        for value in row_data
+    )
+
+
+async def get_trace_as_json(db, uuid, max_points=None, from_time=None,
+                            to_time=None):
+    """Returns the tracing rows for the passed in uuid as json.
 
+    The downsampling is done by the database so only the selected points
+    are transferred.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param int max_points: If passed, each column is downsampled to about
+        this number of points keeping the min and max values of consecutive
+        rows.
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are returned.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are returned.
+
+    :returns: Maps each column name to its [index, value] pairs preceded
+        by the column headers.
+    :rtype: dict
+    """
+    assert max_points is None or max_points > 0
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        records = await conn.fetch(constants.SQL_SELECT_COL_NAMES, uuid)
+        col_names = [record['col_name'] for record in records]
+        trace_as_json = {
+            col_name: [["Time", col_name]] for col_name in col_names
+        }
+        stmt = await conn.prepare(constants.SQL_SELECT_DOWNSAMPLED_TRACE)
+        async with conn.transaction():
+            async for record in stmt.cursor(
+                    uuid, from_time, to_time, max_points,
+                    prefetch=_PREFETCH_SIZE):
+                col = record['col'] - 1
+                if col < len(col_names):
+                    trace_as_json[col_names[col]].append(
+                        [record['idx'], record['value']]
+                    )
     return trace_as_json
 
 
-async def get_trace_run_info(uuid):
+async def get_trace_run_info(db, uuid):
     """Returns descriptive info for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
     :returns: Descriptive info for the passed in uuid.
@@ -116,22 +306,19 @@ async def get_trace_run_info(uuid):
     from_time = None
     to_time = None
 
-    async with DbConnection() as db:
-        conn_pool = db.get_conn_pool()
-        async with conn_pool.acquire() as conn:
-            stmt = await conn.prepare(constants.SQL_SELECT_APP_NAME)
-            async with conn.transaction():
-                async for record in stmt.cursor(uuid,
-                                                prefetch=_PREFETCH_SIZE):
-                    app_name = record['app_name']
-                    creation_time = _format_datetime(record['creation_time'])
-            stmt = await conn.prepare(constants.SQL_SELECT_RUN_INFO)
-            async with conn.transaction():
-                async for record in stmt.cursor(uuid,
-                                                prefetch=_PREFETCH_SIZE):
-                    counter = record['counter']
-                    from_time = record['from_time']
-                    to_time = record['to_time']
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        stmt = await conn.prepare(constants.SQL_SELECT_APP_NAME)
+        async with conn.transaction():
+            async for record in stmt.cursor(uuid, prefetch=_PREFETCH_SIZE):
+                app_name = record['app_name']
+                creation_time = _format_datetime(record['creation_time'])
+        stmt = await conn.prepare(constants.SQL_SELECT_RUN_INFO)
+        async with conn.transaction():
+            async for record in stmt.cursor(uuid, prefetch=_PREFETCH_SIZE):
+                counter = record['counter']
+                from_time = record['from_time']
+                to_time = record['to_time']
 
     if to_time is None or from_time is None:
         # There are no rows for this run
@@ -149,32 +336,31 @@ async def get_trace_run_info(uuid):
     }
 
 
-async def get_latest_trace(app_name):
+async def get_latest_trace(db, app_name):
     """Returns the latest trace for the passed in app_name.
 
-    :return: A list of objects.
+    :param db: The database object to use.
+    :param str app_name: The application name.
+
+    :return: A csv view of the latest tracing run.
+    :rtype: str
     """
-    async with DbConnection() as db:
-        conn_pool = db.get_conn_pool()
-        async with conn_pool.acquire() as conn:
-            stmt = await conn.prepare(constants.SQL_SELECT_LATEST_RUN)
-            async with conn.transaction():
-                async for record in stmt.cursor(app_name,
-                                                prefetch=_PREFETCH_SIZE):
-                    uuid = record['uuid']
-        return await _get_trace(uuid, db)
-
-
-async def get_trace(uuid):
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        uuid = await conn.fetchval(constants.SQL_SELECT_LATEST_RUN, app_name)
+    return (await get_trace_data(db, uuid)).to_csv()
+
+
+async def get_trace(db, uuid):
     """Returns all the tracing rows for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
-    :returns: A list of strings representing a csv view of the tracing run.
-    :rtype: list[str]
+    :returns: A csv view of the tracing run.
+    :rtype: str
     """
-    async with DbConnection() as db:
-        return await _get_trace(uuid, db)
+    return (await get_trace_data(db, uuid)).to_csv()
 
 
 async def _create_tracer(db, identifier, app_name, *column_names):
@@ -192,115 +378,216 @@ async def _create_tracer(db, identifier, app_name, *column_names):
             list(column_names))
 
 
-async def _insert_row(db, uuid, *row_data):
+async def _insert_row(db, uuid, row_data, date_time=None):
     """Inserts a tracing row to the database.
 
     :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
-    :param row_data: Represent the values for each data point.
+    :param list row_data: Represent the values for each data point.
+    :param datetime.datetime date_time: The time of the row; if None the
+        current time is used.
     """
     conn_pool = db.get_conn_pool()
     async with conn_pool.acquire() as conn:
-        await conn.execute(constants.SQL_INSERT_ROW, uuid, list(row_data))
+        async with conn.transaction():
+            await conn.execute(
+                constants.SQL_INSERT_ROW, uuid, list(row_data), date_time
+            )
+            await run_stats_impl.store_run_stats(conn, [(uuid, row_data)])
+            await notify_rows_stored(conn, [uuid])
+
 
+async def notify_rows_stored(conn, uuids):
+    """Notifies that new rows were stored for the passed in runs.
 
-async def get_trace_run_name(uuid):
+    The notifications are delivered when the transaction commits.
+
+    :param conn: The connection to use.
+    :param uuids: The identifiers for the trace runs.
+    """
+    await conn.execute(constants.SQL_NOTIFY_ROWS_STORED, list(uuids))
+
+
+async def get_last_row_id(db, uuid):
+    """Returns the id of the last raw row stored for the passed in run.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+
+    :returns: The id of the last row; 0 if there are no rows.
+    :rtype: int
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        return await conn.fetchval(constants.SQL_SELECT_LAST_ROW_ID, uuid)
+
+
+async def get_rows_after(db, uuid, after_id, max_rows):
+    """Returns the raw rows of a run stored after the passed in row.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param int after_id: The id of the last row already seen.
+    :param int max_rows: The max number of rows to return.
+
+    :returns: The (id, date_time, row_data) tuples of the rows in the order
+        they were stored.
+    :rtype: list[tuple]
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        records = await conn.fetch(
+            constants.SQL_SELECT_ROWS_AFTER, uuid, after_id, max_rows
+        )
+    return [
+        (record['id'], record['date_time'], record['row_data'])
+        for record in records
+    ]
+
+
+async def get_trace_run_name(db, uuid):
     """Returns the name of the trace run for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
     :returns: The name of the trace run.
     :rtype: str.
     """
-    sql = f" select app_name, creation_time from " \
-          f"tracing_run where uuid='{uuid}';"
+    async for value in db.execute_query(constants.SQL_SELECT_APP_NAME,
+                                        [uuid]):
+        app_name = str(value["app_name"])
+        creation_time = value["creation_time"]
+        app_name = app_name.replace(" ", "")
+        t = creation_time.strftime('%Y-%m-%d-%H:%M:%S.%f')[:-7]
+        csv_filename = f"{app_name}-{t}.csv"
+        return csv_filename
 
-    async with DbConnection() as db:
-        async for value in db.execute_query(sql):
-            app_name = str(value["app_name"])
-            creation_time = value["creation_time"]
-            app_name = app_name.replace(" ", "")
-            t = creation_time.strftime('%Y-%m-%d-%H:%M:%S.%f')[:-7]
-            csv_filename = f"{app_name}-{t}.csv"
-            return csv_filename
 
+async def get_trace_data(db, uuid):
+    """Returns all the tracing rows for the passed in uuid in columns.
 
-async def _get_trace(uuid, db):
-    """Returns all the tracing rows for the passed in uuid.
-
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
-    :returns: A list of strings representing a csv view of the tracing run.
-    :rtype: list[str]
+    :returns: The tracing rows of the run.
+    :rtype: trace_data.TraceData
     """
     conn_pool = db.get_conn_pool()
     assert uuid
     assert conn_pool
-    col_names = []
     async with conn_pool.acquire() as conn:
-        stmt = await conn.prepare(constants.SQL_SELECT_COL_NAMES)
+        records = await conn.fetch(constants.SQL_SELECT_COL_NAMES, uuid)
+        col_names = [record['col_name'] for record in records]
+        data = trace_data.TraceData(col_names)
+        stmt = await conn.prepare(constants.SQL_SELECT_TRACE)
         async with conn.transaction():
-            async for record in stmt.cursor(uuid, prefetch=_PREFETCH_SIZE):
-                col_names.append(record['col_name'])
+            async for record in stmt.cursor(
+                    uuid, None, None, prefetch=_PREFETCH_SIZE):
+                data.add_row(record['date_time'], record['row_data'])
+        return data
+
+
+async def export_trace_csv(db, uuid, output, from_time=None, to_time=None,
+                           column_names=None):
+    """Writes the tracing rows for the passed in uuid as csv.
+
+    The csv is produced by the database (COPY TO STDOUT) and passed to the
+    output in chunks as it arrives so memory use does not depend on the
+    size of the run.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param output: A coroutine function called with each chunk (bytes).
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are exported.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are exported.
+    :param list[str] column_names: If passed, only these columns are
+        exported in the passed in order.
+
+    raises: ValueError
+    """
+    conn_pool = db.get_conn_pool()
+    async with conn_pool.acquire() as conn:
+        records = await conn.fetch(constants.SQL_SELECT_COL_NAMES, uuid)
+        indexes = {
+            record['col_name']: record['index'] + 1 for record in records
+        }
+        if column_names is None:
+            column_names = list(indexes)
+        missing = [name for name in column_names if name not in indexes]
+        if missing:
+            raise ValueError(f"Unknown columns: {', '.join(missing)}")
         clauses = [
-            f"row_data[{index + 1}] as {col_name}"
-            for index, col_name in enumerate(col_names)
+            f"row_data[{indexes[name]}] as {_quote_identifier(name)}"
+            for name in column_names
         ]
-        sql = "select to_char(date_time, 'YYYY-MM-DD HH24:MI:SS') as timestamp , " + \
-              ','.join(clauses) + \
-              " from tracing_row where uuid=$1 order by 1"
-        stmt = await conn.prepare(sql)
+        sql = constants.SQL_SELECT_TRACE_CSV(
+            columns=''.join(', ' + clause for clause in clauses)
+        )
+        await conn.copy_from_query(
+            sql, uuid, from_time, to_time, output=output, format='csv',
+            header=True
+        )
 
-        lines = ['time,' + ','.join(col_names)]
-        async with conn.transaction():
-            async for record in stmt.cursor(uuid, prefetch=_PREFETCH_SIZE):
-                values = [str(v) for v in list(dict(record).values())]
-                lines.append(','.join(values))
-        return '\n'.join(lines)
 
+def _quote_identifier(name):
+    """Quotes the passed in name to be used as an sql identifier.
 
-async def get_all_tracers():
-    tracers = []
-    async with DbConnection() as db:
-        tracer_names = await _get_tracer_names(db)
-        for tracer_name in tracer_names:
-            tracers.append(
-                {
-                    "tracer_name": tracer_name,
-                    'runs': await _get_tracer_runs(db, tracer_name)
-                }
-            )
+    :param str name: The name to quote.
 
-        return tracers
+    :returns: The quoted name.
+    :rtype: str
+    """
+    return '"' + name.replace('"', '""') + '"'
 
 
-async def _get_tracer_names(db):
-    tracer_names = []
+async def create_partitions(db, months_ahead):
+    """Creates the missing monthly partitions for the tracing rows.
+
+    :param db: The database object to use.
+    :param int months_ahead: Partitions are created from the current month
+        up to this number of months in the future.
+    """
     conn_pool = db.get_conn_pool()
     async with conn_pool.acquire() as conn:
-        stmt = await conn.prepare(constants.SQL_SELECT_ALL_TRACER_RUNS)
-        async with conn.transaction():
-            async for record in stmt.cursor(prefetch=_PREFETCH_SIZE):
-                tracer_names.append(record['app_name'])
-    return tracer_names
+        await conn.execute(constants.SQL_CREATE_PARTITIONS, months_ahead)
+
 
+async def get_all_tracers(db, max_apps=None, offset=0, max_runs=None):
+    """Returns the tracing runs grouped by application with a single query.
+
+    :param db: The database object to use.
+    :param int max_apps: The max number of applications to return; None for
+        all of them.
+    :param int offset: The number of applications to skip.
+    :param int max_runs: The max number of runs to return per application;
+        None for all of them.
 
-async def _get_tracer_runs(db, app_name):
-    tracer_runs = []
+    :returns: The runs of each application sorted by creation time.
+    :rtype: list[dict]
+    """
+    tracers = []
     conn_pool = db.get_conn_pool()
     async with conn_pool.acquire() as conn:
-        stmt = await conn.prepare(constants.SQL_SELECT_RUNS)
+        stmt = await conn.prepare(constants.SQL_SELECT_TRACER_TREE)
         async with conn.transaction():
-            async for record in stmt.cursor(app_name, prefetch=_PREFETCH_SIZE):
-                creation_date = record['creation_time']
-                tracer_runs.append(
+            async for record in stmt.cursor(
+                    max_apps, offset, max_runs, prefetch=_PREFETCH_SIZE):
+                if not tracers or \
+                        tracers[-1]['tracer_name'] != record['app_name']:
+                    tracers.append(
+                        {"tracer_name": record['app_name'], 'runs': []}
+                    )
+                tracers[-1]['runs'].append(
                     {
-                        'creation_time': _format_datetime(creation_date),
+                        'creation_time':
+                            _format_datetime(record['creation_time']),
                         'uuid': record['uuid'],
                     }
-
                 )
-    return tracer_runs
+    return tracers
 
 
 def _get_duration(start_time, end_time):
@@ -0,0 +1,210 @@
+"""Implements the binary wire protocol for tracing rows.
+
+Every binary frame starts with the following header:
+
+    magic       2 bytes     Always b'DL'; tells binary frames from json.
+    version     uint8       The version of the protocol.
+    msg_type    uint8       The type of the message (ROW or ROWS).
+    uuid        16 bytes    The identifier for the trace run.
+    sequence    uint32      Increased by one for every frame of the run.
+
+A ROW frame holds a single row:
+
+    timestamp   float64     The client time the row was sampled (epoch).
+    values      float32[]   The values of the row; None is sent as NaN.
+
+The number of values is implied by the size of the frame.
+
+A ROWS frame holds several rows sampled by the same client:
+
+    count       uint16      The number of rows in the frame.
+    width       uint16      The number of values in each row.
+    rows        count times a float64 timestamp followed by width float32
+                values.
+
+All the numbers are big-endian.
+"""
+
+import array
+import math
+import struct
+import sys
+import uuid
+
+import dolon.exceptions as exceptions
+
+MAGIC = b'DL'
+VERSION = 1
+MAX_SEQUENCE = 2 ** 32
+
+# Message types.
+ROW = 1
+ROWS = 2
+
+_HEADER = struct.Struct('!2sBB16sI')
+_TIMESTAMP = struct.Struct('!d')
+_ROWS_INFO = struct.Struct('!HH')
+_NAN = float('nan')
+
+# The size of a ROWS frame without its rows.
+ROWS_OVERHEAD = _HEADER.size + _ROWS_INFO.size
+
+
+def is_binary(data):
+    """Checks if the passed in datagram is a binary frame.
+
+    :param bytes data: The received datagram.
+
+    :returns: True if the datagram is a binary frame.
+    :rtype: bool
+    """
+    return isinstance(data, bytes) and data[:2] == MAGIC
+
+
+def get_row_size(width):
+    """Returns the size that a row occupies in a ROWS frame.
+
+    :param int width: The number of values in the row.
+
+    :returns: The size of the row in bytes.
+    :rtype: int
+    """
+    return _TIMESTAMP.size + 4 * width
+
+
+def _pack_values(row_data):
+    """Packs the values of a row as big-endian float32 numbers.
+
+    :param list row_data: The values of the row.
+
+    :returns: The packed values.
+    :rtype: bytes
+    """
+    values = array.array(
+        'f', [_NAN if value is None else value for value in row_data]
+    )
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _unpack_values(data):
+    """Unpacks the values of a row.
+
+    :param bytes data: The big-endian float32 values.
+
+    :returns: The values of the row.
+    :rtype: list
+    """
+    values = array.array('f')
+    values.frombytes(data)
+    if sys.byteorder == 'little':
+        values.byteswap()
+    return [None if math.isnan(value) else value for value in values]
+
+
+class RowEncoder:
+    """Encodes the rows of a tracing run as binary frames.
+
+    :ivar bytes _uuid: The identifier for the trace run.
+    :ivar int _sequence: The sequence number of the next frame.
+    """
+
+    def __init__(self, identifier):
+        """Initializer.
+
+        :param str identifier: The identifier for the trace run.
+        """
+        self._uuid = uuid.UUID(identifier).bytes
+        self._sequence = 0
+
+    def _make_header(self, msg_type):
+        """Returns the header for the next frame.
+
+        :param int msg_type: The type of the frame.
+
+        :returns: The header for the next frame.
+        :rtype: bytes
+        """
+        header = _HEADER.pack(
+            MAGIC, VERSION, msg_type, self._uuid, self._sequence
+        )
+        self._sequence = (self._sequence + 1) % MAX_SEQUENCE
+        return header
+
+    def encode(self, row_data, timestamp):
+        """Encodes a row as a binary frame.
+
+        :param list row_data: The values of the row.
+        :param float timestamp: The time the row was sampled (epoch).
+
+        :returns: The binary frame.
+        :rtype: bytes
+        """
+        return self._make_header(ROW) + _TIMESTAMP.pack(timestamp) + \
+            _pack_values(row_data)
+
+    def encode_rows(self, rows):
+        """Encodes several rows as a single binary frame.
+
+        :param list[tuple] rows: The rows to encode as (timestamp, row_data)
+            tuples; all the rows must have the same number of values.
+
+        :returns: The binary frame.
+        :rtype: bytes
+        """
+        width = len(rows[0][1])
+        parts = [self._make_header(ROWS), _ROWS_INFO.pack(len(rows), width)]
+        for timestamp, row_data in rows:
+            assert len(row_data) == width
+            parts.append(_TIMESTAMP.pack(timestamp))
+            parts.append(_pack_values(row_data))
+        return b''.join(parts)
+
+
+def decode(data):
+    """Decodes a binary frame.
+
+    :param bytes data: The binary frame.
+
+    :returns: A tuple holding the identifier of the run, the sequence number
+        and the rows of the frame as a list of (timestamp, row_data) tuples.
+    :rtype: tuple
+
+    raises: InvalidMessage
+    """
+    try:
+        magic, version, msg_type, uuid_bytes, sequence = \
+            _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise exceptions.InvalidMessage(
+                f"Binary frame not supported: {version}"
+            )
+        offset = _HEADER.size
+        if msg_type == ROW:
+            if (len(data) - offset - _TIMESTAMP.size) % 4:
+                raise exceptions.InvalidMessage("Invalid binary frame.")
+            timestamp, = _TIMESTAMP.unpack_from(data, offset)
+            row_data = _unpack_values(data[offset + _TIMESTAMP.size:])
+            rows = [(timestamp, row_data)]
+        elif msg_type == ROWS:
+            count, width = _ROWS_INFO.unpack_from(data, offset)
+            offset += _ROWS_INFO.size
+            row_size = get_row_size(width)
+            if len(data) - offset != count * row_size:
+                raise exceptions.InvalidMessage("Invalid binary frame.")
+            rows = []
+            for _ in range(count):
+                timestamp, = _TIMESTAMP.unpack_from(data, offset)
+                values_offset = offset + _TIMESTAMP.size
+                offset += row_size
+                rows.append(
+                    (timestamp, _unpack_values(data[values_offset:offset]))
+                )
+        else:
+            raise exceptions.InvalidMessage(
+                f"Binary frame not supported: {msg_type}"
+            )
+    except struct.error as ex:
+        raise exceptions.InvalidMessage("Invalid binary frame.") from ex
+    return str(uuid.UUID(bytes=uuid_bytes)), sequence, rows
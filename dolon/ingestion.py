@@ -0,0 +1,386 @@
+"""Ingests the tracing messages storing them to the database."""
+
+import asyncio
+import collections
+import datetime
+import logging
+import time
+
+import dolon.exceptions as exceptions
+import dolon.impl.constants as constants
+import dolon.impl.run_stats_impl as run_stats_impl
+import dolon.impl.utils_impl as utils_impl
+import dolon.impl.wire_protocol as wire_protocol
+
+_logger = logging.getLogger(__name__)
+
+# Drop policies applied when the ingest queue reaches its high-water mark.
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+SAMPLE = 'sample'
+
+_DROP_POLICIES = (DROP_NEWEST, DROP_OLDEST, SAMPLE)
+
+
+class RowBatcher:
+    """Buffers tracing rows and flushes them to the database in batches.
+
+    Must be used as an async context manager; while the context is active a
+    background task drains the queue storing the rows with a single COPY per
+    batch. A batch is flushed as soon as it holds max_batch_size rows or when
+    its oldest row has waited for max_delay seconds, whichever comes first.
+    The running statistics of the runs are updated in the same transaction
+    which, once committed, notifies the followers of the runs.
+
+    Since a row can be stored some time after it was received, rows that do
+    not carry their own timestamp are stamped when they are added to the
+    batcher instead of relying on the default value of the date_time column.
+
+    :ivar db: The database object to use.
+    :ivar int _max_batch_size: The max number of rows to store per flush.
+    :ivar float _max_delay: The max time (in seconds) a row can wait before
+        being flushed.
+    :ivar asyncio.Queue _queue: Holds the rows that are waiting to be flushed.
+    :ivar asyncio.Event _batch_ready: Set when a full batch is waiting.
+    :ivar asyncio.Task _flush_task: The task that flushes the rows.
+    """
+
+    def __init__(self, db, max_batch_size=500, max_delay=0.5,
+                 max_queue_size=50000):
+        """Initializer.
+
+        :param db: The database object to use.
+        :param int max_batch_size: The max number of rows to store per flush.
+        :param float max_delay: The max time (in seconds) a row can wait
+            before being flushed.
+        :param int max_queue_size: The max number of rows that can be waiting
+            to be flushed; adding a row to a full queue waits for the next
+            flush.
+        """
+        assert max_batch_size > 0
+        assert max_delay > 0
+        self._db = db
+        self._max_batch_size = max_batch_size
+        self._max_delay = max_delay
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._batch_ready = asyncio.Event()
+        self._flush_task = None
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._failed_rows = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+        self._last_flush_latency = 0
+        self._max_flush_latency = 0
+        self._total_flush_latency = 0
+
+    async def add_row(self, uuid, row_data, date_time=None):
+        """Adds a tracing row to the batch that will be flushed next.
+
+        :param str uuid: The identifier for the trace run.
+        :param list row_data: Represent the values for each data point.
+        :param datetime.datetime date_time: The time of the row; if None the
+            current time is used.
+        """
+        await self._queue.put(
+            (uuid, list(row_data), date_time or datetime.datetime.now())
+        )
+        if self._queue.qsize() >= self._max_batch_size:
+            self._batch_ready.set()
+
+    async def __aenter__(self):
+        """Enters the context starting the flushing task."""
+        self._flush_task = asyncio.ensure_future(self._flush_forever())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exits the context flushing all the pending rows."""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        while not self._queue.empty():
+            await self._flush(self._drain(self._max_batch_size))
+
+    def _drain(self, max_rows):
+        """Removes up to max_rows from the queue without waiting.
+
+        :param int max_rows: The max number of rows to remove.
+
+        :returns: The rows that were removed from the queue.
+        :rtype: list[tuple]
+        """
+        rows = []
+        while len(rows) < max_rows and not self._queue.empty():
+            rows.append(self._queue.get_nowait())
+        return rows
+
+    async def _flush_forever(self):
+        """Flushes the queued rows until cancelled."""
+        while True:
+            first_row = await self._queue.get()
+            if self._queue.qsize() + 1 < self._max_batch_size:
+                try:
+                    await asyncio.wait_for(
+                        self._batch_ready.wait(), self._max_delay
+                    )
+                except asyncio.TimeoutError:
+                    pass
+            self._batch_ready.clear()
+            batch = [first_row] + self._drain(self._max_batch_size - 1)
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        """Stores the passed in rows to the database.
+
+        A batch that fails to be stored is logged and discarded so a single
+        bad flush will not stall the ingestion.
+
+        :param list[tuple] batch: The rows to store.
+        """
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            conn_pool = self._db.get_conn_pool()
+            async with conn_pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.copy_records_to_table(
+                        constants.TRACING_ROW_TABLE,
+                        records=batch,
+                        columns=constants.TRACING_ROW_COPY_COLUMNS
+                    )
+                    await run_stats_impl.store_run_stats(
+                        conn, ((uuid, row_data) for uuid, row_data, _ in batch)
+                    )
+                    await utils_impl.notify_rows_stored(
+                        conn, {uuid for uuid, _, _ in batch}
+                    )
+        except Exception as ex:
+            self._failed_rows += len(batch)
+            _logger.exception(ex)
+            return
+        latency = time.perf_counter() - started
+        self._flushes += 1
+        self._rows_flushed += len(batch)
+        self._last_batch_size = len(batch)
+        self._max_batch_size_seen = max(self._max_batch_size_seen, len(batch))
+        self._last_flush_latency = latency
+        self._max_flush_latency = max(self._max_flush_latency, latency)
+        self._total_flush_latency += latency
+
+    def get_metrics(self):
+        """Returns the flushing metrics.
+
+        Latencies are expressed in seconds.
+
+        :returns: The flushing metrics.
+        :rtype: dict
+        """
+        flushes = self._flushes
+        return {
+            'queue_size': self._queue.qsize(),
+            'flushes': flushes,
+            'rows_flushed': self._rows_flushed,
+            'failed_rows': self._failed_rows,
+            'last_batch_size': self._last_batch_size,
+            'max_batch_size': self._max_batch_size_seen,
+            'average_batch_size': self._rows_flushed / flushes if flushes else 0,
+            'last_flush_latency': self._last_flush_latency,
+            'max_flush_latency': self._max_flush_latency,
+            'average_flush_latency':
+                self._total_flush_latency / flushes if flushes else 0,
+        }
+
+
+class Ingestor:
+    """Feeds the received datagrams to a bounded queue.
+
+    Must be used as an async context manager; while the context is active a
+    single background task processes the queued messages in arrival order.
+
+    Datagrams are decoded as soon as they are received so malformed ones are
+    rejected before they take space in the queue. Once the queue holds
+    high_water_mark messages the drop policy decides what happens to any
+    new tracing row:
+
+        DROP_NEWEST: The new row is dropped.
+        DROP_OLDEST: The oldest queued row is dropped to make room.
+        SAMPLE: One of every sample_rate new rows is kept by dropping the
+            oldest queued row; the rest are dropped.
+
+    Messages creating a tracing run are rare and every row of the run depends
+    on them so they are never dropped.
+
+    Binary frames carry a sequence number which is used to count the frames
+    that were lost before reaching the ingestor.
+
+    :ivar db: The database object to use.
+    :ivar RowBatcher _row_batcher: Buffers the tracing rows to store.
+    :ivar int _high_water_mark: The max number of queued messages.
+    :ivar str _drop_policy: The policy to apply when the queue is full.
+    :ivar int _sample_rate: Used by the SAMPLE policy.
+    :ivar collections.deque _queue: Holds the messages to process.
+    :ivar asyncio.Event _not_empty: Set when there are queued messages.
+    :ivar asyncio.Task _process_task: The task that processes the messages.
+    :ivar dict _sequences: Maps run identifiers to their last sequence.
+    """
+
+    def __init__(self, db, row_batcher=None, high_water_mark=10000,
+                 drop_policy=DROP_NEWEST, sample_rate=10):
+        """Initializer.
+
+        :param db: The database object to use.
+        :param RowBatcher row_batcher: If passed, the tracing rows will be
+            stored in batches.
+        :param int high_water_mark: The max number of queued messages.
+        :param str drop_policy: The policy to apply when the queue is full.
+        :param int sample_rate: Used by the SAMPLE policy; one of this number
+            of rows is kept when the queue is full.
+
+        raises: ValueError
+        """
+        if drop_policy not in _DROP_POLICIES:
+            raise ValueError(f"Invalid drop policy: {drop_policy}")
+        assert high_water_mark > 0
+        assert sample_rate > 0
+        self._db = db
+        self._row_batcher = row_batcher
+        self._high_water_mark = high_water_mark
+        self._drop_policy = drop_policy
+        self._sample_rate = sample_rate
+        self._queue = collections.deque()
+        self._not_empty = asyncio.Event()
+        self._process_task = None
+        self._overflow_count = 0
+        self._accepted = 0
+        self._dropped = 0
+        self._malformed = 0
+        self._lost = 0
+        self._sequences = {}
+
+    def submit(self, data):
+        """Queues a received datagram applying the drop policy if needed.
+
+        Never blocks so it can be called directly from the protocol.
+
+        :param bytes data: The received datagram.
+        """
+        try:
+            if wire_protocol.is_binary(data):
+                msg = wire_protocol.decode(data)
+                self._track_sequence(msg[0], msg[1])
+            else:
+                msg = utils_impl.decode_message(data)
+        except exceptions.InvalidMessage:
+            self._malformed += 1
+            return
+        if len(self._queue) >= self._high_water_mark and \
+                not _is_run_creation(msg):
+            if self._drop_policy == DROP_NEWEST:
+                self._dropped += 1
+                return
+            elif self._drop_policy == SAMPLE:
+                self._overflow_count += 1
+                if self._overflow_count % self._sample_rate:
+                    self._dropped += 1
+                    return
+            if _is_run_creation(self._queue[0]):
+                self._dropped += 1
+                return
+            self._queue.popleft()
+            self._dropped += 1
+        self._queue.append(msg)
+        self._accepted += 1
+        self._not_empty.set()
+
+    def _track_sequence(self, identifier, sequence):
+        """Counts the frames missing before the passed in sequence number.
+
+        :param str identifier: The identifier for the trace run.
+        :param int sequence: The sequence number of the received frame.
+        """
+        last_sequence = self._sequences.get(identifier)
+        if last_sequence is not None:
+            gap = (sequence - last_sequence - 1) % wire_protocol.MAX_SEQUENCE
+            # A huge gap means that the frame arrived out of order.
+            if gap >= wire_protocol.MAX_SEQUENCE // 2:
+                return
+            self._lost += gap
+        self._sequences[identifier] = sequence
+
+    async def __aenter__(self):
+        """Enters the context starting the processing task."""
+        self._process_task = asyncio.ensure_future(self._process_forever())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exits the context processing all the queued messages."""
+        if self._process_task:
+            self._process_task.cancel()
+            try:
+                await self._process_task
+            except asyncio.CancelledError:
+                pass
+            self._process_task = None
+        while self._queue:
+            await self._process(self._queue.popleft())
+
+    async def _process_forever(self):
+        """Processes the queued messages until cancelled."""
+        while True:
+            await self._not_empty.wait()
+            while self._queue:
+                await self._process(self._queue.popleft())
+            self._not_empty.clear()
+
+    async def _process(self, msg):
+        """Processes a single message.
+
+        :param msg: The message to process; either a dict or a tuple holding
+            a decoded binary frame.
+        """
+        try:
+            if isinstance(msg, tuple):
+                identifier, _, rows = msg
+                for timestamp, row_data in rows:
+                    await utils_impl.store_row(
+                        self._db, identifier, row_data, self._row_batcher,
+                        timestamp
+                    )
+            else:
+                await utils_impl.process_message(
+                    self._db, msg, self._row_batcher
+                )
+        except exceptions.InvalidMessage:
+            self._malformed += 1
+        except Exception as ex:
+            _logger.exception(ex)
+
+    def get_metrics(self):
+        """Returns the ingestion counters.
+
+        :returns: The ingestion counters.
+        :rtype: dict
+        """
+        return {
+            'queue_size': len(self._queue),
+            'accepted': self._accepted,
+            'dropped': self._dropped,
+            'malformed': self._malformed,
+            'lost': self._lost,
+        }
+
+
+def _is_run_creation(msg):
+    """Checks if the passed in message creates a tracing run.
+
+    :param msg: A queued message.
+
+    :returns: True if the message creates a tracing run.
+    :rtype: bool
+    """
+    return isinstance(msg, dict) and msg.get('msg_type') == 'create_trace_run'
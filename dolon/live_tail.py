@@ -0,0 +1,153 @@
+"""Follows the rows of live tracing runs."""
+
+import asyncio
+import logging
+
+import dolon.impl.constants as constants
+import dolon.utils as utils
+
+_logger = logging.getLogger(__name__)
+
+
+class LiveTail:
+    """Streams the rows of tracing runs as they are stored.
+
+    Must be used as an async context manager; while the context is active a
+    connection of the pool listens for the notifications sent whenever rows
+    are stored and wakes up the followers of the affected runs, which then
+    read only the rows after the last one they have seen. Followers do not
+    hold a connection while waiting so any number of them can share the
+    pool.
+
+    Followers also poll every poll_interval seconds so they keep up even if
+    a notification is missed or the listening connection is lost.
+
+    :ivar db: The database object to use.
+    :ivar float _poll_interval: The max time (in seconds) between reads.
+    :ivar dict _followers: Maps run identifiers to the events of their
+        followers.
+    :ivar bool _closed: Set when the context is exited.
+    :ivar _conn: The connection listening for the notifications.
+    :ivar _conn_context: The context that acquired the listening connection.
+    """
+
+    def __init__(self, db, poll_interval=5.0):
+        """Initializer.
+
+        :param db: The database object to use.
+        :param float poll_interval: The max time (in seconds) between reads.
+        """
+        assert poll_interval > 0
+        self._db = db
+        self._poll_interval = poll_interval
+        self._followers = {}
+        self._closed = False
+        self._conn = None
+        self._conn_context = None
+        self._notifications = 0
+        self._rows_sent = 0
+
+    async def __aenter__(self):
+        """Enters the context starting to listen for stored rows."""
+        self._closed = False
+        self._conn_context = self._db.get_conn_pool().acquire()
+        self._conn = await self._conn_context.__aenter__()
+        await self._conn.add_listener(
+            constants.TRACING_ROWS_CHANNEL, self._on_rows_stored
+        )
+        self._conn.add_termination_listener(self._on_connection_lost)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exits the context stopping the followers."""
+        self.close()
+        if self._conn:
+            if not self._conn.is_closed():
+                self._conn.remove_termination_listener(
+                    self._on_connection_lost
+                )
+                await self._conn.remove_listener(
+                    constants.TRACING_ROWS_CHANNEL, self._on_rows_stored
+                )
+            self._conn = None
+            await self._conn_context.__aexit__(exc_type, exc_val, exc_tb)
+            self._conn_context = None
+
+    def close(self):
+        """Stops all the followers."""
+        self._closed = True
+        for events in self._followers.values():
+            for event in events:
+                event.set()
+
+    def _on_rows_stored(self, conn, pid, channel, payload):
+        """Called when rows of a run are stored."""
+        self._notifications += 1
+        for event in self._followers.get(payload, ()):
+            event.set()
+
+    def _on_connection_lost(self, conn):
+        """Called when the listening connection is closed."""
+        _logger.warning("Lost the stored rows notifications; polling only.")
+        self._conn = None
+
+    async def follow(self, uuid, after_id=None, max_rows=1000):
+        """Yields the rows of a run as they are stored.
+
+        Yields after every wake up, with an empty list if there are no new
+        rows, so the caller can tell if its client is still connected. Stops
+        when the context is exited.
+
+        :param str uuid: The identifier for the trace run.
+        :param int after_id: The id of the last row already seen; if None
+            only the rows stored from now on are yielded.
+        :param int max_rows: The max number of rows to yield at once.
+
+        :returns: An async generator of (last_id, rows) tuples where rows
+            are the (date_time, row_data) tuples stored after the previously
+            yielded last_id.
+        """
+        assert max_rows > 0
+        if after_id is None:
+            after_id = await utils.get_last_row_id(self._db, uuid)
+        event = asyncio.Event()
+        followers = self._followers.setdefault(uuid, set())
+        followers.add(event)
+        try:
+            while not self._closed:
+                # Cleared before reading so rows stored meanwhile are not
+                # missed.
+                event.clear()
+                records = await utils.get_rows_after(
+                    self._db, uuid, after_id, max_rows
+                )
+                if records:
+                    after_id = records[-1][0]
+                    self._rows_sent += len(records)
+                yield after_id, [
+                    (date_time, row_data) for _, date_time, row_data in records
+                ]
+                if len(records) == max_rows:
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            followers.discard(event)
+            if not followers:
+                self._followers.pop(uuid, None)
+
+    def get_metrics(self):
+        """Returns the live tail metrics.
+
+        :returns: The live tail metrics.
+        :rtype: dict
+        """
+        return {
+            'listening': self._conn is not None,
+            'followed_runs': len(self._followers),
+            'followers': sum(len(events) for events in self._followers.values()),
+            'notifications': self._notifications,
+            'rows_sent': self._rows_sent,
+        }
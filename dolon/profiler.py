@@ -1,36 +1,124 @@
-"""Implements the function profiler."""
+"""Implements the function profiler.
+
+The statistics of each profiled callable are kept in shards, one per thread
+that calls it, so threads never contend on the same counters; the shards
+are merged when the statistics are read. When a thread exits its counters
+are folded into a single retired shard so threads that come and go (like a
+thread per request) do not grow the memory or the cost of reading.
+
+Pre-fork servers (like gunicorn or a multiprocessing pool) can call
+share_between_processes before forking so the shards live in shared memory
+and the statistics read from any process are the totals of all of them;
+the shared shard of an exited thread is reused by the next thread that
+needs one.
+"""
 
-import datetime
 import functools
 import inspect
-import uuid
+import logging
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+import weakref
+
+import dolon.impl.histogram as histogram
+
+_logger = logging.getLogger(__name__)
+
+# Aliases.
+_perf_counter_ns = time.perf_counter_ns
+
+# The columns computed over the calls completed since the previous sample.
+_WINDOW_COLUMNS = ('p50', 'p95', 'p99', 'max_time', 'throughput')
+
+_SUB_BUCKET_BITS = histogram.SUB_BUCKET_BITS
+_SUB_BUCKET_SHIFT = histogram.SUB_BUCKET_BITS + 1
+
+# The layout of a shard: three counters followed by the histogram counters.
+_HITS = 0
+_COMPLETED = 1
+_TOTAL_TIME = 2
+_COUNTS = 3
+_SHARD_SIZE = _COUNTS + histogram.NUMBER_OF_BUCKETS
+_SHARD_BYTES = 8 * _SHARD_SIZE
+
 
 def clear():
     """Removes all the profiling functions."""
     _ProfilingStatCollection.clear()
 
+
+def share_between_processes(max_shards=64):
+    """Keeps the statistics of the profiled callables in shared memory.
+
+    Must be called in the parent process before forking the workers and
+    after the callables to profile are decorated; the statistics read from
+    any of the processes are then the totals of all of them. Each running
+    thread of each process calling a profiled callable takes one of
+    max_shards slots, freed when the thread exits; threads that find no
+    free slot are only counted by their own process. The slots of processes
+    that exit without their threads exiting first (like a forked child
+    calling os._exit) are not freed.
+
+    :param int max_shards: The max number of running threads, in all
+        processes, that can share the statistics of a callable.
+    """
+    assert max_shards > 0
+    _ProfilingStatCollection.share_between_processes(max_shards)
+
+
 def profiler(foo):
     """Decorates a callable or coro making it profile-able.
 
+    The statistics of the callable are resolved once, when it is decorated,
+    so each call only updates a few counters of the shard of its thread.
+
     :param callable foo: The callable (sync or async) to profile.
     """
-    _ProfilingStatCollection.register_profiling_function(foo)
+    stats = _ProfilingStatCollection.register_profiling_function(foo)
+    get_shard = stats.get_shard
     if inspect.iscoroutinefunction(foo):
         @functools.wraps(foo)
         async def _inner(*args, **kwargs):
-            with _ProfilingStatCollection(foo):
+            shard = get_shard()
+            started = shard.enter()
+            try:
                 return await foo(*args, **kwargs)
+            finally:
+                shard.exit(started)
     else:
         @functools.wraps(foo)
         def _inner(*args, **kwargs):
-            with _ProfilingStatCollection(foo):
+            shard = get_shard()
+            started = shard.enter()
+            try:
                 return foo(*args, **kwargs)
+            finally:
+                shard.exit(started)
     return _inner
 
 
 def get_profiling_functions(use_async=False):
     """Returns all the available profiling functions.
 
+    For each profiled callable the following functions are returned:
+
+        hits: The number of calls.
+        active_instances: The number of running calls.
+        average_time: The average duration of the calls (in seconds).
+        p50, p95, p99: Percentiles of the duration (in seconds) of the calls
+            completed since the previous sample.
+        max_time: The max duration (in seconds) of the calls completed since
+            the previous sample.
+        throughput: The number of calls completed per second since the
+            previous sample.
+
+    A new sample starts when the first of the windowed functions of a
+    callable is called after all of them were called for the previous one,
+    so they must be called once per sample.
+
     :param bool use_async: If true the returned functions will be async.
 
     :return: A list of sync/ async async functions one for each function to
@@ -90,6 +178,14 @@ def get_profiling_functions(use_async=False):
             profiling_callable_name=name, profile_func=_get_average_time,
             tag='average_time')
         )
+        for column in _WINDOW_COLUMNS:
+            func.append(make_func(
+                profiling_callable_name=name,
+                profile_func=functools.partial(
+                    _get_window_value, column=column
+                ),
+                tag=column)
+            )
     return func
 
 
@@ -128,6 +224,169 @@ def _get_average_time(callable_name):
         callable_name).average_time
 
 
+def _get_window_value(callable_name, column):
+    """Returns a statistic of the current sample for the passed-in callable.
+
+    :param str callable_name: The name of the callable.
+    :param str column: One of _WINDOW_COLUMNS.
+
+    :returns: The value of the statistic; None for the durations if no call
+        completed during the sample.
+    :rtype: float
+    """
+    return _ProfilingStatCollection.get_stats_for_callable(
+        callable_name).read_window()[column]
+
+
+class _Shard:
+    """The statistics of a callable updated by a single thread.
+
+    :ivar values: The counters of the shard laid out as described by the
+        _HITS, _COMPLETED, _TOTAL_TIME (in nanoseconds) and _COUNTS (the
+        histogram of the durations) offsets; either a list, which is the
+        fastest to update, or a memoryview of shared memory.
+    """
+
+    __slots__ = ('values',)
+
+    def __init__(self, values=None):
+        """Initializer.
+
+        :param values: The counters of the shard; if None new ones are
+            allocated in process memory.
+        """
+        if values is None:
+            values = [0] * _SHARD_SIZE
+        self.values = values
+
+    def enter(self):
+        """Called when a callable starts.
+
+        :returns: The time the callable started (in nanoseconds).
+        :rtype: int
+        """
+        self.values[_HITS] += 1
+        return _perf_counter_ns()
+
+    def exit(self, started):
+        """Called when a callable exits.
+
+        :param int started: The time the callable started as returned from
+            enter.
+        """
+        duration = _perf_counter_ns() - started
+        values = self.values
+        values[_COMPLETED] += 1
+        values[_TOTAL_TIME] += duration
+        # Inlines histogram.get_bucket_index.
+        index = duration
+        shift = duration.bit_length() - _SUB_BUCKET_SHIFT
+        if shift > 0:
+            index = (shift << _SUB_BUCKET_BITS) + (duration >> shift)
+        values[_COUNTS + index] += 1
+
+
+class _SharedSegment:
+    """Shared memory holding the shards of a callable for several processes.
+
+    The memory is mapped before forking so it is shared by the children.
+    It starts with a header of 8 byte integers: the number of shards ever
+    claimed, the number of freed shards and the stack of the indexes of the
+    freed shards; the shards follow.
+
+    :ivar int _max_shards: The number of shards that fit in the segment.
+    :ivar mmap.mmap _memory: The shared memory.
+    :ivar _header: The header of the segment.
+    :ivar _lock: Serializes claiming and freeing shards across processes.
+    :ivar list _views: The counters of each claimed shard.
+    """
+
+    # The offsets of the counters of the header.
+    _CLAIMED = 0
+    _FREED = 1
+    _FREE_STACK = 2
+
+    def __init__(self, max_shards):
+        """Initializer.
+
+        :param int max_shards: The number of shards that fit in the segment.
+        """
+        self._max_shards = max_shards
+        self._header_bytes = 8 * (self._FREE_STACK + max_shards)
+        self._memory = mmap.mmap(
+            -1, self._header_bytes + max_shards * _SHARD_BYTES
+        )
+        self._header = memoryview(self._memory)[:self._header_bytes].cast('q')
+        self._lock = multiprocessing.Lock()
+        self._views = []
+
+    def claim(self):
+        """Claims a shard, preferring one freed by an exited thread.
+
+        A reused shard keeps the counters of its previous owner, which are
+        cumulative so the totals stay correct.
+
+        :returns: The index and the counters of the claimed shard; None if
+            the segment is full.
+        :rtype: tuple
+        """
+        header = self._header
+        with self._lock:
+            freed = header[self._FREED]
+            if freed:
+                index = header[self._FREE_STACK + freed - 1]
+                header[self._FREED] = freed - 1
+            else:
+                index = header[self._CLAIMED]
+                if index >= self._max_shards:
+                    return None
+                header[self._CLAIMED] = index + 1
+        return index, self._get_view(index)
+
+    def release(self, index):
+        """Frees a shard whose thread exited.
+
+        :param int index: The index of the shard.
+        """
+        header = self._header
+        with self._lock:
+            freed = header[self._FREED]
+            header[self._FREE_STACK + freed] = index
+            header[self._FREED] = freed + 1
+
+    def _get_view(self, index):
+        """Returns the counters of the passed in shard.
+
+        :param int index: The index of the shard.
+
+        :rtype: memoryview
+        """
+        offset = self._header_bytes + index * _SHARD_BYTES
+        return memoryview(self._memory)[offset:offset + _SHARD_BYTES].cast(
+            'q'
+        )
+
+    def get_shards(self):
+        """Returns the counters of the shards claimed by all processes.
+
+        :rtype: list[memoryview]
+        """
+        claimed = self._header[self._CLAIMED]
+        while len(self._views) < claimed:
+            self._views.append(self._get_view(len(self._views)))
+        return self._views
+
+
+class _ThreadSentinel:
+    """Lives in the thread local storage of a thread until the thread exits.
+
+    Only its lifetime matters: a finalizer attached to it retires the shard
+    of the thread.
+    """
+
+    __slots__ = ('__weakref__',)
+
+
 class _ProfilingStats:
     """Holds the profiling statistics for a callable.
 
@@ -135,39 +394,195 @@ class _ProfilingStats:
     a class level dictionary making them available for querying at
     any time.
 
-    :ivar int _hits: How many times a function was called.
-    :ivar int _running_instances: How many instances of this functions are
-        running (applicable to async calls ofc).
-    :ivar float _average_time: The average duration for each call (in seconds).
-    :ivar float _enter_time: The time the callable started  (in seconds).
+    Each thread updates its own shard; reading a statistic merges the
+    shards. The durations of the calls are counted in histograms whose
+    difference between consecutive samples gives the percentiles of the
+    recent calls.
+
+    :ivar threading.local _local: Holds the shard of each thread along with
+        the sentinel whose finalizer retires it when the thread exits.
+    :ivar set[_Shard] _shards: The shards of the running threads kept in
+        process memory.
+    :ivar list _retired: The sum of the counters of the shards of the
+        exited threads; replaced, never updated in place, so a reader that
+        took it along with the shards counts every call once.
+    :ivar _SharedSegment _segment: Holds the shards shared by all the
+        processes; None if the statistics are not shared.
+    :ivar list _last_counts: The histogram counters at the previous sample.
+    :ivar int _window_started: When the current sample started (in
+        nanoseconds).
+    :ivar dict _last_window: The statistics of the previous sample.
+    :ivar int _window_reads: How many windowed values were read.
     """
 
-    _hits = 0
-    _running_instances = 0
-    _average_time = 0
-    _enter_time = None
-
     def __init__(self):
-        self._hits = 0
-        self._running_instances = 0
-        self._average_time = 0
-        self._enter_time = {}
-        self._completed = 0
-
-    def enter(self, identifier):
-        """Called when a callable starts."""
-        self._hits += 1
-        self._running_instances += 1
-        self._enter_time[identifier] = datetime.datetime.now()
-
-    def exit(self, identifier):
-        """Called when a callable exits."""
-        self._running_instances -= 1
-        t_now = self._enter_time.pop(identifier)
-        duration = (datetime.datetime.now() - t_now).total_seconds()
-        x1 = self._average_time * self._completed + duration
-        self._average_time = x1 / (self._completed + 1)
-        self._completed += 1
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = set()
+        self._retired = [0] * _SHARD_SIZE
+        self._segment = None
+        self._last_counts = [0] * histogram.NUMBER_OF_BUCKETS
+        self._window_started = _perf_counter_ns()
+        self._last_window = None
+        self._window_reads = 0
+
+    def get_shard(self):
+        """Returns the shard of the calling thread.
+
+        :rtype: _Shard
+        """
+        try:
+            return self._local.shard
+        except AttributeError:
+            return self._add_shard()
+
+    def _add_shard(self):
+        """Creates the shard of the calling thread.
+
+        :rtype: _Shard
+        """
+        sentinel = _ThreadSentinel()
+        segment = self._segment
+        claimed = segment.claim() if segment else None
+        if claimed is not None:
+            index, values = claimed
+            shard = _Shard(values)
+            finalizer = weakref.finalize(
+                sentinel, _release_shared_shard, segment, index, os.getpid()
+            )
+        else:
+            if segment:
+                _logger.warning("No free shared profiling shard; the calls "
+                                "of this thread are counted by its process "
+                                "only.")
+            shard = _Shard()
+            with self._lock:
+                self._shards.add(shard)
+            finalizer = weakref.finalize(sentinel, self._retire_shard, shard)
+        finalizer.atexit = False
+        self._local.sentinel = sentinel
+        self._local.shard = shard
+        return shard
+
+    def _retire_shard(self, shard):
+        """Folds the counters of the shard of an exited thread.
+
+        Shards already dropped (by share or after a fork) are ignored.
+
+        :param _Shard shard: The shard of the exited thread.
+        """
+        with self._lock:
+            if shard not in self._shards:
+                return
+            self._retired = [
+                retired + value
+                for retired, value in zip(self._retired, shard.values)
+            ]
+            self._shards.discard(shard)
+
+    def share(self, max_shards):
+        """Moves the statistics to memory shared with the forked processes.
+
+        The statistics counted so far are kept in the first shared shard,
+        which is not owned by any thread.
+
+        :param int max_shards: The max number of shared shards.
+        """
+        segment = _SharedSegment(max_shards)
+        _, values = segment.claim()
+        for shard_values in self._get_all_shards():
+            for index, value in enumerate(shard_values):
+                if value:
+                    values[index] += value
+        with self._lock:
+            self._shards = set()
+            self._retired = [0] * _SHARD_SIZE
+            self._segment = segment
+            self._local = threading.local()
+
+    def after_fork(self):
+        """Drops the shards of the parent process in a forked child.
+
+        The threads of the parent do not exist in the child; if the
+        statistics are not shared the child starts counting from zero.
+        """
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = set()
+        if not self._segment:
+            self._retired = [0] * _SHARD_SIZE
+            self._last_counts = [0] * histogram.NUMBER_OF_BUCKETS
+            self._window_started = _perf_counter_ns()
+
+    def _get_all_shards(self):
+        """Returns the counters of all the shards.
+
+        :rtype: list
+        """
+        with self._lock:
+            shards = [shard.values for shard in self._shards]
+            shards.append(self._retired)
+        if self._segment:
+            shards += self._segment.get_shards()
+        return shards
+
+    def _get_total(self, offset):
+        """Returns the sum of a counter over all the shards.
+
+        :param int offset: The offset of the counter.
+
+        :rtype: int
+        """
+        return sum(values[offset] for values in self._get_all_shards())
+
+    def take_window(self):
+        """Ends the current sample starting a new one.
+
+        :returns: The p50, p95, p99 and max duration (in seconds) of the
+            calls completed during the sample, None if there were none, and
+            their throughput (calls per second).
+        :rtype: dict
+        """
+        counts = [0] * histogram.NUMBER_OF_BUCKETS
+        for values in self._get_all_shards():
+            for index, count in enumerate(values[_COUNTS:]):
+                if count:
+                    counts[index] += count
+        window = histogram.Histogram.from_counts(
+            [
+                count - last_count
+                for count, last_count in zip(counts, self._last_counts)
+            ]
+        )
+        self._last_counts = counts
+        now = _perf_counter_ns()
+        elapsed = (now - self._window_started) / 1e9
+        self._window_started = now
+
+        def to_seconds(value):
+            return None if value is None else value / 1e9
+
+        return {
+            'p50': to_seconds(window.get_percentile(50)),
+            'p95': to_seconds(window.get_percentile(95)),
+            'p99': to_seconds(window.get_percentile(99)),
+            'max_time': to_seconds(window.get_max()),
+            'throughput': window.total / elapsed if elapsed > 0 else 0,
+        }
+
+    def read_window(self):
+        """Returns the statistics of the current sample.
+
+        Each windowed column reads the statistics once per sample; the first
+        read of a sample ends it.
+
+        :returns: The statistics as returned from take_window.
+        :rtype: dict
+        """
+        if self._window_reads % len(_WINDOW_COLUMNS) == 0:
+            self._last_window = self.take_window()
+        self._window_reads += 1
+        return self._last_window
 
     @property
     def hits(self):
@@ -176,7 +591,7 @@ class _ProfilingStats:
         :return: The number of hits.
         :rtype: int
         """
-        return self._hits
+        return self._get_total(_HITS)
 
     @property
     def running_instances(self):
@@ -185,7 +600,10 @@ class _ProfilingStats:
         :return: The number of concurrent instances.
         :rtype: int
         """
-        return self._running_instances
+        # Reading the completed calls first keeps a call that completes
+        # in between from making the result negative.
+        completed = self._get_total(_COMPLETED)
+        return self._get_total(_HITS) - completed
 
     @property
     def average_time(self):
@@ -194,23 +612,39 @@ class _ProfilingStats:
         :return: The average duration in seconds.
         :rtype: float
         """
-        return self._average_time
+        completed = self._get_total(_COMPLETED)
+        if not completed:
+            return 0
+        return self._get_total(_TOTAL_TIME) / completed / 1e9
 
     def __repr__(self):
-        return f'ProfilingStats: hits = {self._hits} ' \
-               f'running_instances = {self._running_instances}' \
-               f'avg. duration = {self._average_time}'
+        return f'ProfilingStats: hits = {self.hits} ' \
+               f'running_instances = {self.running_instances}' \
+               f'avg. duration = {self.average_time}'
+
+
+def _release_shared_shard(segment, index, pid):
+    """Frees the shared shard of an exited thread.
+
+    Called by the finalizer of the sentinel of the thread; ignored in a
+    forked child dropping the thread locals it inherited, since the shard
+    still belongs to the thread of the parent.
+
+    :param _SharedSegment segment: The segment holding the shard.
+    :param int index: The index of the shard.
+    :param int pid: The process that claimed the shard.
+    """
+    if os.getpid() == pid:
+        segment.release(index)
 
 
 class _ProfilingStatCollection:
     """Profiling data accumulator.
 
-    A context manager that has keeps a global state where it accumulates
-    profiling statistics for callables.
+    Keeps a global state where it accumulates profiling statistics for
+    callables.
 
     :cvar dict[str, ProfilingStats]: Maps callables to their profiling stats.
-
-    :ivar str _func_name: The callable's name to profile.
     """
 
     _stats = {}
@@ -222,34 +656,32 @@ class _ProfilingStatCollection:
 
     @classmethod
     def register_profiling_function(cls, func):
-        name = func.__qualname__
-
-        while '.' in name:
-            name = name.replace('.', '_')
-
-        cls._stats[name] = _ProfilingStats()
-
-    def __init__(self, func):
-        """Initializer.
+        """Registers a callable to profile.
 
         :param callable func: The callable to profile.
-        """
-        name = func.__qualname__
 
-        while '.' in name:
-            name = name.replace('.', '_')
+        :returns: The statistics of the callable.
+        :rtype: _ProfilingStats
+        """
+        name = func.__qualname__.replace('.', '_')
+        stats = _ProfilingStats()
+        cls._stats[name] = stats
+        return stats
 
-        self._func_name = name
-        self._uuid = None
+    @classmethod
+    def share_between_processes(cls, max_shards):
+        """Moves the statistics of all the callables to shared memory.
 
-    def __enter__(self):
-        """Called when the callable starts."""
-        self._uuid = uuid.uuid4()
-        self._stats[self._func_name].enter(self._uuid)
+        :param int max_shards: The max number of shared shards per callable.
+        """
+        for stats in cls._stats.values():
+            stats.share(max_shards)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        """Called when the callable exits."""
-        self._stats[self._func_name].exit(self._uuid)
+    @classmethod
+    def after_fork(cls):
+        """Called in the child process after a fork."""
+        for stats in cls._stats.values():
+            stats.after_fork()
 
     @classmethod
     def get_profiling_callable_names(cls):
@@ -268,3 +700,6 @@ class _ProfilingStatCollection:
         :rtype: _ProfilingStats
         """
         return cls._stats.get(callable_name)
+
+
+os.register_at_fork(after_in_child=_ProfilingStatCollection.after_fork)
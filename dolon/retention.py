@@ -0,0 +1,50 @@
+"""Exposes the retention policies of the tracing rows."""
+
+import dolon.impl.retention_impl as retention_impl
+
+# The application name of the policy that applies to all the applications
+# without their own policy.
+DEFAULT_POLICY = retention_impl.DEFAULT_POLICY
+
+
+async def set_retention_policy(db, app_name, raw_days, bucket_seconds):
+    """Sets the retention policy for an application.
+
+    Rows older than raw_days are rolled up to buckets of bucket_seconds
+    holding the min, max and average of each column; once rolled up, the
+    raw rows are discarded by dropping whole monthly partitions.
+
+    :param db: The database object to use.
+    :param str app_name: The application name; DEFAULT_POLICY to set the
+        policy for all the applications without their own policy.
+    :param int raw_days: The number of days to keep the raw rows for.
+    :param int bucket_seconds: The size of the buckets to roll up to.
+    """
+    await retention_impl.set_retention_policy(
+        db, app_name, raw_days, bucket_seconds
+    )
+
+
+async def delete_retention_policy(db, app_name):
+    """Removes the retention policy of an application.
+
+    Rows that are already rolled up are not restored.
+
+    :param db: The database object to use.
+    :param str app_name: The application name.
+    """
+    await retention_impl.delete_retention_policy(db, app_name)
+
+
+async def apply_retention(db):
+    """Rolls up the expired rows and drops the expired partitions.
+
+    Should run periodically; only one caller can apply the retention at the
+    same time, calls made while another one is running return immediately.
+
+    :param db: The database object to use.
+
+    :returns: The names of the dropped partitions.
+    :rtype: list[str]
+    """
+    return await retention_impl.apply_retention(db)
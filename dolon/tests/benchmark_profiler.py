@@ -0,0 +1,65 @@
+"""Measures the overhead the profiler adds to each call.
+
+Not part of the test suite; run it directly:
+
+    python -m dolon.tests.benchmark_profiler [number_of_calls]
+"""
+
+import asyncio
+import sys
+import time
+
+import dolon.profiler as profiler
+
+
+def _plain():
+    """The function to profile."""
+
+
+async def _plain_async():
+    """The coroutine to profile."""
+
+
+def _time_sync(func, number_of_calls):
+    """Returns the average duration of a call (in nanoseconds)."""
+    started = time.perf_counter_ns()
+    for _ in range(number_of_calls):
+        func()
+    return (time.perf_counter_ns() - started) / number_of_calls
+
+
+def _time_async(func, number_of_calls):
+    """Returns the average duration of awaiting a call (in nanoseconds)."""
+
+    async def run():
+        started = time.perf_counter_ns()
+        for _ in range(number_of_calls):
+            await func()
+        return (time.perf_counter_ns() - started) / number_of_calls
+
+    return asyncio.run(run())
+
+
+def main(number_of_calls):
+    """Prints the overhead per call for sync and async callables.
+
+    :param int number_of_calls: The number of calls to time.
+    """
+    profiler.clear()
+    profiled = profiler.profiler(_plain)
+    profiled_async = profiler.profiler(_plain_async)
+    for name, timer, plain, wrapped in (
+            ('sync', _time_sync, _plain, profiled),
+            ('async', _time_async, _plain_async, profiled_async)):
+        # The best of a few runs hides the noise of the machine.
+        plain_ns = min(timer(plain, number_of_calls) for _ in range(5))
+        wrapped_ns = min(timer(wrapped, number_of_calls) for _ in range(5))
+        print(
+            f'{name:>5}: plain {plain_ns:7.1f} ns/call, '
+            f'profiled {wrapped_ns:7.1f} ns/call, '
+            f'overhead {wrapped_ns - plain_ns:7.1f} ns/call'
+        )
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
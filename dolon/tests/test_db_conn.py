@@ -5,9 +5,11 @@ import unittest
 
 import dolon.db_conn as db_conn
 import dolon.exceptions as exceptions
+import dolon.tests.common as common
 
 # Aliases.
 DbConnection = db_conn.DbConnection
+async_testable = common.async_testable
 
 
 class DbConnectionTest(unittest.TestCase):
@@ -26,6 +28,26 @@ class DbConnectionTest(unittest.TestCase):
         os.environ["POSTGRES_CONN_STR"] = conn_str
         self.assertEqual(conn_str, DbConnection._get_conn_str())
 
+    @async_testable
+    async def test_get_metrics(self):
+        """Tests the metrics of the connection pool."""
+        conn_str = await common.recreate_db('db_conn_test')
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with DbConnection(min_size=1, max_size=4) as db:
+            conn_pool = db.get_conn_pool()
+            async with conn_pool.acquire():
+                async with conn_pool.acquire():
+                    metrics = db.get_metrics()
+                    self.assertEqual(metrics['in_use'], 2)
+                    self.assertEqual(metrics['max_size'], 4)
+                    self.assertEqual(metrics['saturation'], 0.5)
+            metrics = db.get_metrics()
+            self.assertEqual(metrics['in_use'], 0)
+            self.assertEqual(metrics['waiting'], 0)
+            self.assertEqual(metrics['acquisitions'], 2)
+            self.assertGreaterEqual(metrics['max_wait'], 0)
+        del os.environ["POSTGRES_CONN_STR"]
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,78 @@
+"""Tests the event loop diagnostics."""
+
+import asyncio
+import time
+import unittest
+
+import dolon.trace_client as trace_client
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+class TestEventLoopDiagnostics(unittest.TestCase):
+    """Tests the EventLoopDiagnostics class."""
+
+    @async_testable
+    async def test_blocked_loop(self):
+        """Tests the diagnostics of a loop blocked by a callback."""
+        loop = asyncio.get_running_loop()
+        original_run = asyncio.Handle._run
+        diagnostics = trace_client.EventLoopDiagnostics(
+            probe_interval=0.05, slow_callback_duration=0.1
+        )
+        async with diagnostics:
+            self.assertIsNot(asyncio.Handle._run, original_run)
+            await asyncio.sleep(0.2)
+            self.assertLess(await diagnostics.max_loop_lag(), 0.05)
+            self.assertEqual(await diagnostics.slow_callbacks(), 0)
+
+            # The callbacks due right after the probe are waiting when the
+            # probe runs.
+            for _ in range(20):
+                loop.call_at(diagnostics._due_time + 0.001, lambda: None)
+            loop.call_soon(time.sleep, 0.2)
+            await asyncio.sleep(0.3)
+
+            self.assertGreaterEqual(await diagnostics.max_loop_lag(), 0.1)
+            self.assertGreater(await diagnostics.loop_lag(), 0)
+            self.assertGreaterEqual(await diagnostics.ready_queue(), 20)
+            self.assertEqual(await diagnostics.slow_callbacks(), 1)
+            self.assertGreaterEqual(
+                await diagnostics.slow_callbacks_time(), 0.2
+            )
+
+            # Reading a value starts a new window.
+            self.assertEqual(await diagnostics.slow_callbacks(), 0)
+            self.assertEqual(await diagnostics.slow_callbacks_time(), 0)
+        self.assertIs(asyncio.Handle._run, original_run)
+
+    @async_testable
+    async def test_lag_only(self):
+        """Tests measuring the lag without measuring the callbacks."""
+        original_run = asyncio.Handle._run
+        diagnostics = trace_client.EventLoopDiagnostics(
+            probe_interval=0.01, slow_callback_duration=None
+        )
+        async with diagnostics:
+            self.assertIs(asyncio.Handle._run, original_run)
+            self.assertIsNone(await diagnostics.loop_lag())
+            time.sleep(0.05)
+            await asyncio.sleep(0.05)
+            self.assertGreater(await diagnostics.max_loop_lag(), 0.02)
+            self.assertEqual(await diagnostics.slow_callbacks(), 0)
+
+    @async_testable
+    async def test_active_tasks(self):
+        """Tests counting the active tasks."""
+        tasks = [asyncio.ensure_future(asyncio.sleep(1)) for _ in range(3)]
+        try:
+            self.assertGreaterEqual(await trace_client.active_tasks(), 3)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+"""Tests the gc_diagnostics module."""
+
+import gc
+import unittest
+
+import dolon.gc_diagnostics as gc_diagnostics
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+class _Node:
+    """Dummy class used for testing."""
+
+    def __init__(self):
+        self.other = None
+
+
+def _make_cycles(count):
+    """Creates reference cycles for the garbage collector to collect."""
+    for _ in range(count):
+        first, second = _Node(), _Node()
+        first.other, second.other = second, first
+
+
+class TestGcDiagnostics(unittest.TestCase):
+    """Tests the GcDiagnostics class."""
+
+    @async_testable
+    async def test_collections(self):
+        """Tests the values reported for explicit collections."""
+        diagnostics = gc_diagnostics.GcDiagnostics()
+        self.assertFalse(diagnostics.active)
+        async with diagnostics:
+            self.assertTrue(diagnostics.active)
+            self.assertIn(diagnostics._on_gc, gc.callbacks)
+            # Starts the windows from the collections already done.
+            await diagnostics.gen0_collections()
+            await diagnostics.gen1_collections()
+            await diagnostics.gen2_collections()
+            await diagnostics.gc_pause_time()
+            await diagnostics.max_gc_pause()
+            await diagnostics.gc_collected()
+
+            _make_cycles(100)
+            gc.collect(1)
+            _make_cycles(100)
+            gc.collect()
+            gc.collect()
+
+            self.assertGreaterEqual(await diagnostics.gen1_collections(), 1)
+            self.assertGreaterEqual(await diagnostics.gen2_collections(), 2)
+            self.assertGreaterEqual(await diagnostics.gc_collected(), 400)
+            self.assertEqual(await diagnostics.gc_uncollectable(), 0)
+            pause_time = await diagnostics.gc_pause_time()
+            max_pause = await diagnostics.max_gc_pause()
+            self.assertGreater(max_pause, 0)
+            self.assertGreaterEqual(pause_time, max_pause)
+
+            # Reading a value starts a new window.
+            self.assertEqual(await diagnostics.gen2_collections(), 0)
+            self.assertEqual(await diagnostics.gc_collected(), 0)
+            self.assertEqual(await diagnostics.gc_pause_time(), 0)
+            self.assertEqual(await diagnostics.max_gc_pause(), 0)
+        self.assertFalse(diagnostics.active)
+        self.assertNotIn(diagnostics._on_gc, gc.callbacks)
+
+        # Collections are not counted once stopped.
+        gc.collect()
+        self.assertEqual(await diagnostics.gen2_collections(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+"""Tests the ingestion module."""
+
+import json
+import os
+import unittest
+import uuid
+
+import dolon.db_conn as db_conn
+import dolon.ingestion as ingestion
+import dolon.impl.wire_protocol as wire_protocol
+import dolon.utils as utils
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+class TestRowBatcher(unittest.TestCase):
+    """Tests the RowBatcher class.
+
+    :cvar str DB_NAME: The name of the database to create.
+    """
+
+    DB_NAME = 'ingestion_test'
+
+    @async_testable
+    async def test_rows_are_flushed(self):
+        """Tests that all the batched rows are stored."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        number_of_rows = 25
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v2']
+                }
+            )
+            row_batcher = ingestion.RowBatcher(db, max_batch_size=10)
+            async with row_batcher:
+                for index in range(number_of_rows):
+                    await utils.process_message(
+                        db=db,
+                        payload={
+                            "msg_type": "row",
+                            "uuid": identifier,
+                            "row_data": [index, None]
+                        },
+                        row_batcher=row_batcher
+                    )
+            metrics = row_batcher.get_metrics()
+            self.assertEqual(metrics['rows_flushed'], number_of_rows)
+            self.assertEqual(metrics['failed_rows'], 0)
+            self.assertLessEqual(metrics['max_batch_size'], 10)
+            info = await utils.get_trace_run_info(db, identifier)
+            self.assertEqual(info['counter'], f'{number_of_rows:,}')
+        del os.environ["POSTGRES_CONN_STR"]
+
+
+def _make_row(value):
+    """Returns a datagram holding a tracing row.
+
+    :param float value: The value to store in the row.
+
+    :returns: The encoded tracing row.
+    :rtype: bytes
+    """
+    msg = {"msg_type": "row", "uuid": "dummy", "row_data": [value]}
+    return json.dumps(msg).encode()
+
+
+class TestIngestor(unittest.TestCase):
+    """Tests the Ingestor class."""
+
+    def _get_queued_values(self, ingestor):
+        """Returns the values of the queued rows."""
+        return [msg['row_data'][0] for msg in ingestor._queue]
+
+    def test_malformed(self):
+        """Tests that malformed datagrams are counted and rejected."""
+        ingestor = ingestion.Ingestor(db=None)
+        ingestor.submit(b'not a json')
+        ingestor.submit(b'[1, 2]')
+        ingestor.submit(_make_row(1))
+        metrics = ingestor.get_metrics()
+        self.assertEqual(metrics['malformed'], 2)
+        self.assertEqual(metrics['accepted'], 1)
+        self.assertEqual(metrics['queue_size'], 1)
+
+    def test_drop_newest(self):
+        """Tests the drop newest policy."""
+        ingestor = ingestion.Ingestor(
+            db=None, high_water_mark=3, drop_policy=ingestion.DROP_NEWEST
+        )
+        for value in range(5):
+            ingestor.submit(_make_row(value))
+        self.assertListEqual(self._get_queued_values(ingestor), [0, 1, 2])
+        metrics = ingestor.get_metrics()
+        self.assertEqual(metrics['accepted'], 3)
+        self.assertEqual(metrics['dropped'], 2)
+
+    def test_drop_oldest(self):
+        """Tests the drop oldest policy."""
+        ingestor = ingestion.Ingestor(
+            db=None, high_water_mark=3, drop_policy=ingestion.DROP_OLDEST
+        )
+        for value in range(5):
+            ingestor.submit(_make_row(value))
+        self.assertListEqual(self._get_queued_values(ingestor), [2, 3, 4])
+        metrics = ingestor.get_metrics()
+        self.assertEqual(metrics['accepted'], 5)
+        self.assertEqual(metrics['dropped'], 2)
+
+    def test_sample(self):
+        """Tests the sample policy."""
+        ingestor = ingestion.Ingestor(
+            db=None, high_water_mark=2, drop_policy=ingestion.SAMPLE,
+            sample_rate=3
+        )
+        for value in range(8):
+            ingestor.submit(_make_row(value))
+        self.assertListEqual(self._get_queued_values(ingestor), [4, 7])
+        metrics = ingestor.get_metrics()
+        self.assertEqual(metrics['dropped'], 6)
+
+    def test_create_trace_run_is_never_dropped(self):
+        """Tests that run creation messages are accepted when full."""
+        ingestor = ingestion.Ingestor(db=None, high_water_mark=1)
+        ingestor.submit(_make_row(0))
+        msg = {
+            "msg_type": "create_trace_run",
+            "app_name": "testing_app",
+            "uuid": "dummy",
+            "column_names": ["v1"]
+        }
+        ingestor.submit(json.dumps(msg).encode())
+        self.assertEqual(ingestor.get_metrics()['queue_size'], 2)
+
+    def test_binary_frames(self):
+        """Tests queuing binary frames and counting the lost ones."""
+        ingestor = ingestion.Ingestor(db=None)
+        encoder = wire_protocol.RowEncoder(str(uuid.uuid4()))
+        frames = [encoder.encode([value], 0) for value in range(6)]
+        for index in (0, 1, 4, 3, 5):
+            ingestor.submit(frames[index])
+        metrics = ingestor.get_metrics()
+        self.assertEqual(metrics['accepted'], 5)
+        self.assertEqual(metrics['lost'], 2)
+        self.assertListEqual(
+            [msg[2][0][1][0] for msg in ingestor._queue], [0, 1, 4, 3, 5]
+        )
+
+    def test_invalid_drop_policy(self):
+        """Tests passing an invalid drop policy."""
+        with self.assertRaises(ValueError):
+            ingestion.Ingestor(db=None, drop_policy='junk')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+"""Tests the live_tail module."""
+
+import asyncio
+import os
+import unittest
+import uuid
+
+import dolon.db_conn as db_conn
+import dolon.ingestion as ingestion
+import dolon.live_tail as live_tail
+import dolon.utils as utils
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+async def _store_row(db, identifier, value, row_batcher=None):
+    """Stores a tracing row for the passed in run."""
+    await utils.process_message(
+        db=db,
+        payload={"msg_type": "row", "uuid": identifier, "row_data": [value]},
+        row_batcher=row_batcher
+    )
+
+
+class TestLiveTail(unittest.TestCase):
+    """Tests the LiveTail class.
+
+    :cvar str DB_NAME: The name of the database to create.
+    """
+
+    DB_NAME = 'live_tail_test'
+
+    @async_testable
+    async def test_follow(self):
+        """Tests following the rows stored for a run."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1"]
+                }
+            )
+            await _store_row(db, identifier, 1)
+            first_id = await utils.get_last_row_id(db, identifier)
+            self.assertGreater(first_id, 0)
+            await _store_row(db, identifier, 2)
+
+            # The long poll interval means that only the notifications can
+            # wake up the follower in time.
+            async with live_tail.LiveTail(db, poll_interval=60) as tail:
+                received = []
+
+                async def follow(after_id):
+                    follower = tail.follow(identifier, after_id)
+                    try:
+                        async for _, rows in follower:
+                            received.extend(
+                                row_data[0] for _, row_data in rows
+                            )
+                            if len(received) >= 3:
+                                break
+                    finally:
+                        await follower.aclose()
+
+                task = asyncio.ensure_future(follow(first_id))
+                await asyncio.sleep(0.1)
+                self.assertListEqual(received, [2])
+                self.assertEqual(tail.get_metrics()['followers'], 1)
+
+                await _store_row(db, identifier, 3)
+                async with ingestion.RowBatcher(db) as row_batcher:
+                    await _store_row(db, identifier, 4, row_batcher)
+                await asyncio.wait_for(task, 5)
+                self.assertListEqual(received, [2, 3, 4])
+                self.assertEqual(tail.get_metrics()['followers'], 0)
+
+                # Closing the live tail stops the followers.
+                task = asyncio.ensure_future(follow(None))
+                await asyncio.sleep(0.1)
+                tail.close()
+                await asyncio.wait_for(task, 5)
+                self.assertListEqual(received, [2, 3, 4])
+        del os.environ["POSTGRES_CONN_STR"]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+"""Tests the memory diagnostics."""
+
+import gc
+import tracemalloc
+import unittest
+
+import psutil
+
+import dolon.trace_client as trace_client
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+class _Node:
+    """Dummy class used for testing."""
+
+    def __init__(self):
+        self.other = None
+
+
+def _make_cycles(count):
+    """Creates reference cycles for the garbage collector to collect."""
+    for _ in range(count):
+        first, second = _Node(), _Node()
+        first.other, second.other = second, first
+
+
+class TestMemory(unittest.TestCase):
+    """Tests the memory diagnostics."""
+
+    @async_testable
+    async def test_process_memory(self):
+        """Tests the resident and unique memory of the process."""
+        rss = await trace_client.resident_memory()
+        expected = psutil.Process().memory_info().rss / 10 ** 6
+        self.assertAlmostEqual(rss, expected, delta=expected * 0.1)
+        uss = await trace_client.unique_memory()
+        self.assertGreater(uss, 0)
+        self.assertLessEqual(uss, rss * 1.1)
+        self.assertGreater(await trace_client.memory_use(), 0)
+
+    @async_testable
+    async def test_gc(self):
+        """Tests the garbage collection diagnostics."""
+        await trace_client.gc_collections()
+        await trace_client.gc_collected()
+        # The first call starts timing the pauses.
+        await trace_client.gc_pause_time()
+
+        _make_cycles(100)
+        gc.collect()
+        gc.collect()
+        self.assertGreaterEqual(await trace_client.gc_collections(), 2)
+        self.assertGreaterEqual(await trace_client.gc_collected(), 200)
+        self.assertGreater(await trace_client.gc_pause_time(), 0)
+        self.assertEqual(await trace_client.gc_pause_time(), 0)
+
+    @async_testable
+    async def test_allocation_diagnostics(self):
+        """Tests reporting the allocation sites that grew."""
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertIsNone(await trace_client.mem_allocation())
+        async with trace_client.AllocationDiagnostics(top_n=3) as diagnostics:
+            self.assertTrue(tracemalloc.is_tracing())
+            self.assertIsNotNone(await trace_client.mem_allocation())
+            allocated = [bytes(1000) for _ in range(1000)]
+            growth = await diagnostics.allocation_growth()
+            self.assertGreater(growth, 0.9)
+            self.assertLessEqual(len(diagnostics.top_allocations), 3)
+            site, size_diff, count_diff = diagnostics.top_allocations[0]
+            self.assertIn('test_memory.py', site)
+            self.assertGreater(size_diff, 10 ** 6)
+            self.assertGreaterEqual(count_diff, 1000)
+            del allocated
+            self.assertLess(await diagnostics.allocation_growth(), -0.9)
+        self.assertFalse(tracemalloc.is_tracing())
+
+        # Tracing started by the client code is left running.
+        tracemalloc.start()
+        try:
+            async with trace_client.AllocationDiagnostics():
+                pass
+            self.assertTrue(tracemalloc.is_tracing())
+        finally:
+            tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests exporting tracing runs as parquet."""
+
+import io
+import os
+import unittest
+import uuid
+
+import dolon.db_conn as db_conn
+import dolon.impl.parquet_impl as parquet_impl
+import dolon.utils as utils
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+async def _create_run(db, column_names, rows):
+    """Creates a tracing run holding the passed in rows.
+
+    :returns: The identifier for the trace run.
+    :rtype: str
+    """
+    identifier = str(uuid.uuid4())
+    await utils.process_message(
+        db=db,
+        payload={
+            "msg_type": "create_trace_run",
+            "app_name": 'testing_app',
+            "uuid": identifier,
+            "column_names": column_names
+        }
+    )
+    await utils.process_message(
+        db=db,
+        payload={"msg_type": "rows", "uuid": identifier, "rows": rows}
+    )
+    return identifier
+
+
+@unittest.skipIf(parquet_impl.pyarrow is None, "pyarrow is not installed.")
+class TestParquet(unittest.TestCase):
+    """Tests the parquet export.
+
+    :cvar str DB_NAME: The name of the database to create.
+    """
+
+    DB_NAME = 'parquet_test'
+
+    @async_testable
+    async def test_export_traces_parquet(self):
+        """Tests exporting two runs with different columns."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        chunks = []
+
+        async def output(chunk):
+            chunks.append(chunk)
+
+        async with db_conn.DbConnection() as db:
+            uuid1 = await _create_run(
+                db, ['v1', 'v2'],
+                [[1622305220 + i, [i, None]] for i in range(25)]
+            )
+            uuid2 = await _create_run(
+                db, ['v2', 'v3'], [[1622305220, [1.5, 2.5]]]
+            )
+            await utils.export_traces_parquet(
+                db, [uuid1, uuid2], output, batch_size=10
+            )
+        del os.environ["POSTGRES_CONN_STR"]
+
+        table = parquet_impl.parquet.read_table(io.BytesIO(b''.join(chunks)))
+        self.assertListEqual(
+            table.column_names, ['uuid', 'time', 'v1', 'v2', 'v3']
+        )
+        self.assertEqual(str(table.schema.field('v1').type), 'float')
+        self.assertEqual(table.num_rows, 26)
+        rows = table.to_pylist()
+        self.assertEqual(rows[24]['v1'], 24)
+        self.assertEqual(rows[25]['uuid'], uuid2)
+        self.assertIsNone(rows[25]['v1'])
+        self.assertEqual(rows[25]['v3'], 2.5)
+        metadata = parquet_impl.parquet.ParquetFile(
+            io.BytesIO(b''.join(chunks))
+        ).metadata
+        self.assertEqual(metadata.num_row_groups, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
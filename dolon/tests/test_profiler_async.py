@@ -49,9 +49,19 @@ class TestProfiler(unittest.TestCase):
             f'{prefix}goo_hits',
             f'{prefix}goo_active_instances',
             f'{prefix}goo_average_time',
+            f'{prefix}goo_p50',
+            f'{prefix}goo_p95',
+            f'{prefix}goo_p99',
+            f'{prefix}goo_max_time',
+            f'{prefix}goo_throughput',
             f'{prefix}foo_hits',
             f'{prefix}foo_active_instances',
-            f'{prefix}foo_average_time'
+            f'{prefix}foo_average_time',
+            f'{prefix}foo_p50',
+            f'{prefix}foo_p95',
+            f'{prefix}foo_p99',
+            f'{prefix}foo_max_time',
+            f'{prefix}foo_throughput'
         ]
 
         self.assertListEqual(retrieved_func_names, expected_func_names)
@@ -1,5 +1,8 @@
 """Tests sync profiler."""
 
+import concurrent.futures
+import multiprocessing
+import threading
 import time
 import unittest
 
@@ -47,13 +50,165 @@ class TestProfilerSync(unittest.TestCase):
             f'{prefix}RetrieveInfo.retriever_hits',
             f'{prefix}RetrieveInfo.retriever_active_instances',
             f'{prefix}RetrieveInfo.retriever_average_time',
+            f'{prefix}RetrieveInfo.retriever_p50',
+            f'{prefix}RetrieveInfo.retriever_p95',
+            f'{prefix}RetrieveInfo.retriever_p99',
+            f'{prefix}RetrieveInfo.retriever_max_time',
+            f'{prefix}RetrieveInfo.retriever_throughput',
             f'{prefix}foo_hits',
             f'{prefix}foo_active_instances',
-            f'{prefix}foo_average_time'
+            f'{prefix}foo_average_time',
+            f'{prefix}foo_p50',
+            f'{prefix}foo_p95',
+            f'{prefix}foo_p99',
+            f'{prefix}foo_max_time',
+            f'{prefix}foo_throughput'
         ]
 
         self.assertListEqual(retrieved_func_names, expected_func_names)
 
+    def test_stats(self):
+        """Tests the statistics of a profiled function."""
+        profiler.clear()
+
+        @profiler.profiler
+        def foo(fail=False):
+            """Dummy function for testing."""
+            time.sleep(0.01)
+            if fail:
+                raise ValueError
+
+        foo()
+        with self.assertRaises(ValueError):
+            foo(fail=True)
+
+        funcs = {
+            func.__name__.split('_foo_')[-1]: func
+            for func in profiler.get_profiling_functions()
+            if '_foo_' in func.__name__
+        }
+        self.assertEqual(funcs['hits'](), 2)
+        self.assertEqual(funcs['active_instances'](), 0)
+        self.assertGreaterEqual(funcs['average_time'](), 0.01)
+        self.assertLess(funcs['average_time'](), 1)
+
+        # The first windowed value read starts a new sample.
+        window = {
+            column: funcs[column]()
+            for column in ('p50', 'p95', 'p99', 'max_time', 'throughput')
+        }
+        self.assertGreaterEqual(window['p50'], 0.01)
+        self.assertLessEqual(window['p50'], window['p95'])
+        self.assertLessEqual(window['p95'], window['p99'])
+        self.assertLessEqual(window['p99'], window['max_time'])
+        self.assertLess(window['max_time'], 1)
+        self.assertGreater(window['throughput'], 0)
+
+        foo()
+        window = {
+            column: funcs[column]()
+            for column in ('p50', 'p95', 'p99', 'max_time', 'throughput')
+        }
+        self.assertGreaterEqual(window['max_time'], 0.01)
+        self.assertEqual(window['p50'], window['max_time'])
+
+        # No calls completed during the last sample.
+        self.assertIsNone(funcs['p99']())
+        self.assertEqual(funcs['throughput'](), 0)
+        self.assertEqual(funcs['hits'](), 3)
+
+    def test_threads(self):
+        """Tests that the calls from several threads are all counted."""
+        profiler.clear()
+        number_of_threads = 8
+        calls_per_thread = 2000
+
+        @profiler.profiler
+        def foo():
+            """Dummy function for testing."""
+
+        def call_foo():
+            for _ in range(calls_per_thread):
+                foo()
+
+        with concurrent.futures.ThreadPoolExecutor(number_of_threads) as pool:
+            for _ in range(number_of_threads):
+                pool.submit(call_foo)
+
+        stats = profiler._ProfilingStatCollection.get_stats_for_callable(
+            foo.__qualname__.replace('.', '_')
+        )
+        self.assertEqual(stats.hits, number_of_threads * calls_per_thread)
+        self.assertEqual(stats.running_instances, 0)
+
+    def test_thread_churn(self):
+        """Tests that the shards of exited threads are retired or reused."""
+        profiler.clear()
+        number_of_threads = 200
+
+        @profiler.profiler
+        def foo():
+            """Dummy function for testing."""
+
+        stats = profiler._ProfilingStatCollection.get_stats_for_callable(
+            foo.__qualname__.replace('.', '_')
+        )
+        for _ in range(number_of_threads):
+            thread = threading.Thread(target=foo)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(stats._shards), 0)
+        self.assertEqual(stats.hits, number_of_threads)
+        self.assertEqual(stats.running_instances, 0)
+        self.assertIsNotNone(stats.take_window()['max_time'])
+
+        # Shared shards of exited threads are claimed again.
+        profiler.share_between_processes(max_shards=2)
+        for _ in range(number_of_threads):
+            thread = threading.Thread(target=foo)
+            thread.start()
+            thread.join()
+        self.assertEqual(len(stats._segment.get_shards()), 2)
+        self.assertEqual(stats.hits, 2 * number_of_threads)
+        self.assertEqual(stats.running_instances, 0)
+
+    def test_share_between_processes(self):
+        """Tests that the calls from forked processes are counted."""
+        profiler.clear()
+        number_of_processes = 3
+        calls_per_process = 100
+
+        @profiler.profiler
+        def foo():
+            """Dummy function for testing."""
+
+        # Calls made before sharing are kept.
+        foo()
+        profiler.share_between_processes(max_shards=8)
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(
+                target=lambda: [foo() for _ in range(calls_per_process)]
+            )
+            for _ in range(number_of_processes)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+        foo()
+
+        stats = profiler._ProfilingStatCollection.get_stats_for_callable(
+            foo.__qualname__.replace('.', '_')
+        )
+        self.assertEqual(
+            stats.hits, number_of_processes * calls_per_process + 2
+        )
+        self.assertEqual(stats.running_instances, 0)
+        window = stats.take_window()
+        self.assertIsNotNone(window['max_time'])
+        self.assertGreater(window['throughput'], 0)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,110 @@
+"""Tests the retention module."""
+
+import datetime
+import os
+import unittest
+import uuid
+
+import dolon.db_conn as db_conn
+import dolon.retention as retention
+import dolon.utils as utils
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+_SQL_CREATE_PARTITION = "SELECT create_tracing_row_partition($1)"
+
+_SQL_COUNT_PARTITIONS = """
+select count(*) as counter from pg_class where relname=$1
+"""
+
+_SQL_SELECT_ROLLUP = """
+select samples, row_min, row_max, row_avg from tracing_row_rollup
+where uuid=$1 order by bucket_start
+"""
+
+
+class TestRetention(unittest.TestCase):
+    """Tests the retention functions.
+
+    :cvar str DB_NAME: The name of the database to create.
+    """
+
+    DB_NAME = 'retention_test'
+
+    @async_testable
+    async def test_apply_retention(self):
+        """Tests rolling up the old rows and dropping their partition."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        old_date = datetime.datetime(2020, 3, 10, 12, 0, 0)
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v2']
+                }
+            )
+            conn_pool = db.get_conn_pool()
+            async with conn_pool.acquire() as conn:
+                await conn.execute(_SQL_CREATE_PARTITION, old_date.date())
+            rows = [
+                [old_date.timestamp() + seconds, [seconds, None]]
+                for seconds in range(0, 120, 10)
+            ]
+            await utils.process_message(
+                db=db,
+                payload={"msg_type": "rows", "uuid": identifier, "rows": rows}
+            )
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "row",
+                    "uuid": identifier,
+                    "row_data": [1000, 1]
+                }
+            )
+
+            # Without a policy nothing is rolled up or dropped.
+            self.assertListEqual(await retention.apply_retention(db), [])
+
+            await retention.set_retention_policy(
+                db, retention.DEFAULT_POLICY, raw_days=30, bucket_seconds=60
+            )
+            dropped = await retention.apply_retention(db)
+            self.assertListEqual(dropped, ['tracing_row_2020_03'])
+            async with conn_pool.acquire() as conn:
+                self.assertEqual(
+                    await conn.fetchval(
+                        _SQL_COUNT_PARTITIONS, 'tracing_row_2020_03'
+                    ),
+                    0
+                )
+                buckets = await conn.fetch(_SQL_SELECT_ROLLUP, identifier)
+            self.assertListEqual([b['samples'] for b in buckets], [6, 6])
+            self.assertListEqual(list(buckets[0]['row_min']), [0, None])
+            self.assertListEqual(list(buckets[1]['row_max']), [110, None])
+            self.assertListEqual(list(buckets[1]['row_avg']), [85, None])
+
+            # The count of the run includes the rolled up samples.
+            info = await utils.get_trace_run_info(db, identifier)
+            self.assertEqual(info['counter'], '13')
+
+            trace = (await utils.get_trace(db, identifier)).splitlines()
+            self.assertEqual(len(trace), 4)
+            self.assertTrue(trace[1].startswith('2020-03-10 12:00:00,25.0'))
+
+            # Applying it again changes nothing.
+            self.assertListEqual(await retention.apply_retention(db), [])
+            info = await utils.get_trace_run_info(db, identifier)
+            self.assertEqual(info['counter'], '13')
+        del os.environ["POSTGRES_CONN_STR"]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests the stack sampler."""
+
+import asyncio
+import threading
+import unittest
+
+import dolon.trace_client as trace_client
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+def _wait_for(event):
+    """Dummy function for testing."""
+    event.wait()
+
+
+def _deep(depth, event):
+    """Dummy function for testing."""
+    if depth:
+        _deep(depth - 1, event)
+    else:
+        event.wait()
+
+
+class TestStackSampler(unittest.TestCase):
+    """Tests the StackSampler class."""
+
+    def test_sample(self):
+        """Tests folding the sampled stacks."""
+        event = threading.Event()
+        thread = threading.Thread(target=_wait_for, args=(event,))
+        deep_thread = threading.Thread(target=_deep, args=(100, event))
+        thread.start()
+        deep_thread.start()
+        try:
+            sampler = trace_client.StackSampler(max_depth=8)
+            sampler.sample()
+            sampler.sample()
+        finally:
+            event.set()
+            thread.join()
+            deep_thread.join()
+
+        stacks = sampler.take_stacks()
+        prefix = __name__
+        waiting = [stack for stack in stacks if f'{prefix}:_wait_for' in stack]
+        self.assertEqual(len(waiting), 1)
+        frames = waiting[0].split(';')
+        self.assertEqual(frames[0], 'threading:Thread._bootstrap')
+        self.assertIn(f'{prefix}:_wait_for', frames)
+        self.assertEqual(stacks[waiting[0]], 2)
+
+        deep = [stack for stack in stacks if f'{prefix}:_deep' in stack]
+        self.assertEqual(len(deep), 1)
+        frames = deep[0].split(';')
+        self.assertEqual(len(frames), 9)
+        self.assertEqual(frames[0], '...')
+
+        # The calling thread is not sampled.
+        self.assertFalse(any('test_sample' in stack for stack in stacks))
+        self.assertEqual(sampler.take_samples(), sum(stacks.values()))
+        self.assertEqual(sampler.take_samples(), 0)
+        self.assertDictEqual(sampler.take_stacks(), {})
+
+    @async_testable
+    async def test_background_sampling(self):
+        """Tests sampling from the background thread."""
+        async with trace_client.StackSampler(interval=0.005) as sampler:
+            await asyncio.sleep(0.2)
+        samples = await sampler()
+        self.assertGreater(samples, 0)
+        stacks = sampler.take_stacks()
+        self.assertEqual(sum(stacks.values()), samples)
+        self.assertTrue(
+            any('asyncio.base_events' in stack for stack in stacks)
+        )
+        # No samples are taken once stopped.
+        await asyncio.sleep(0.02)
+        self.assertEqual(await sampler(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""Tests the tracers_cache module."""
+
+import asyncio
+import os
+import unittest
+import uuid
+
+import dolon.db_conn as db_conn
+import dolon.tracers_cache as tracers_cache
+import dolon.utils as utils
+import dolon.tests.common as common
+
+# Aliases.
+async_testable = common.async_testable
+
+
+async def _create_run(db, app_name):
+    """Creates a tracing run for the passed in application."""
+    await utils.process_message(
+        db=db,
+        payload={
+            "msg_type": "create_trace_run",
+            "app_name": app_name,
+            "uuid": str(uuid.uuid4()),
+            "column_names": ["v1"]
+        }
+    )
+
+
+class TestTracersCache(unittest.TestCase):
+    """Tests the TracersCache class.
+
+    :cvar str DB_NAME: The name of the database to create.
+    """
+
+    DB_NAME = 'tracers_cache_test'
+
+    @async_testable
+    async def test_invalidated_by_new_run(self):
+        """Tests that creating a run invalidates the cached tracers."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await _create_run(db, 'app1')
+            async with tracers_cache.TracersCache(db) as cache:
+                tracers = await cache.get_all_tracers()
+                self.assertEqual(len(tracers), 1)
+                self.assertIs(await cache.get_all_tracers(), tracers)
+                self.assertEqual(cache.get_metrics()['hits'], 1)
+
+                await _create_run(db, 'app2')
+                # Give the notification the time to arrive.
+                for _ in range(50):
+                    if not cache.get_metrics()['cached_pages']:
+                        break
+                    await asyncio.sleep(0.01)
+                tracers = await cache.get_all_tracers()
+                self.assertEqual(len(tracers), 2)
+            self.assertFalse(cache.get_metrics()['listening'])
+        del os.environ["POSTGRES_CONN_STR"]
+
+
+if __name__ == '__main__':
+    unittest.main()
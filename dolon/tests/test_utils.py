@@ -1,11 +1,15 @@
 """Tests the utils module."""
+import datetime
+import math
 import os
 import random
+import statistics
 import unittest
 import uuid
 
 import dolon.db_conn as db_conn
 import dolon.exceptions as exceptions
+import dolon.ingestion as ingestion
 import dolon.utils as utils
 import dolon.tests.common as common
 
@@ -50,7 +54,9 @@ class TestUtils(unittest.TestCase):
                 "app_name": 81,
                 "uuid": 123,
                 "column_names": ["v1", 'v2']
-            }
+            },
+            {'msg_type': "rows", "uuid": "dummy", "rows": [[1, ["junk"]]]},
+            {'msg_type': "rows", "uuid": "dummy", "rows": [[None, [1.0]]]},
         ]
         os.environ["POSTGRES_CONN_STR"] = conn_str
         async with db_conn.DbConnection() as db:
@@ -59,6 +65,311 @@ class TestUtils(unittest.TestCase):
                     await utils.process_message(db=db, payload=msg)
         del os.environ["POSTGRES_CONN_STR"]
 
+    @async_testable
+    async def test_create_partitions(self):
+        """Tests creating the monthly partitions for the tracing rows."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        sql = "select count(*) as counter from pg_inherits " \
+              "where inhparent = 'tracing_row'::regclass"
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            # Calling it more than once must not fail.
+            await utils.create_partitions(db, months_ahead=4)
+            await utils.create_partitions(db, months_ahead=4)
+            async for value in db.execute_query(sql):
+                # Five monthly partitions plus the default one.
+                self.assertEqual(value['counter'], 6)
+        del os.environ["POSTGRES_CONN_STR"]
+
+    @async_testable
+    async def test_get_trace_as_json(self):
+        """Tests getting a downsampled trace as json."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v2']
+                }
+            )
+            rows = [
+                [1622305220 + index, [index % 10, None]]
+                for index in range(100)
+            ]
+            await utils.process_message(
+                db=db,
+                payload={"msg_type": "rows", "uuid": identifier, "rows": rows}
+            )
+            trace = await utils.get_trace_as_json(db, identifier)
+            self.assertListEqual(trace['v1'][0], ["Time", "v1"])
+            self.assertEqual(len(trace['v1']), 101)
+            self.assertListEqual(trace['v1'][1:4], [[0, 0], [1, 1], [2, 2]])
+            self.assertListEqual(trace['v2'][1], [0, None])
+
+            # Five buckets of 20 rows keeping their min and max points.
+            trace = await utils.get_trace_as_json(
+                db, identifier, max_points=10
+            )
+            self.assertListEqual(
+                trace['v1'][1:],
+                [
+                    [0, 0], [9, 9], [20, 0], [29, 9], [40, 0], [49, 9],
+                    [60, 0], [69, 9], [80, 0], [89, 9]
+                ]
+            )
+            self.assertEqual(len(trace['v2']), 6)
+
+            trace = await utils.get_trace_as_json(
+                db,
+                identifier,
+                from_time=datetime.datetime.fromtimestamp(1622305230),
+                to_time=datetime.datetime.fromtimestamp(1622305240)
+            )
+            self.assertEqual(len(trace['v1']), 11)
+            self.assertListEqual(trace['v1'][1], [0, 0])
+        del os.environ["POSTGRES_CONN_STR"]
+
+    @async_testable
+    async def test_get_trace_data(self):
+        """Tests getting the rows of a trace in columns."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v2']
+                }
+            )
+            rows = [[1622305220 + index, [index, None]] for index in range(3)]
+            await utils.process_message(
+                db=db,
+                payload={"msg_type": "rows", "uuid": identifier, "rows": rows}
+            )
+            data = await utils.get_trace_data(db, identifier)
+            self.assertEqual(len(data), 3)
+            self.assertListEqual(list(data.get_column('v1')), [0, 1, 2])
+            self.assertTrue(all(math.isnan(v) for v in data.get_column('v2')))
+            lines = (await utils.get_trace(db, identifier)).split('\n')
+            self.assertEqual(lines[0], 'time,v1,v2')
+            self.assertEqual(len(lines), 4)
+            self.assertTrue(lines[3].endswith(',2.0,'))
+        del os.environ["POSTGRES_CONN_STR"]
+
+    @async_testable
+    async def test_get_correlations(self):
+        """Tests the correlations computed from the running statistics."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        rows = [
+            [index, 3 * index + (index % 3), None if index % 4 else -index, 7]
+            for index in range(40)
+        ]
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v2', 'v3', 'v4']
+                }
+            )
+            correlations = await utils.get_correlations(db, identifier)
+            self.assertListEqual(
+                correlations['columns'], ["v1", 'v2', 'v3', 'v4']
+            )
+            self.assertListEqual(correlations['matrix'], [[None] * 4] * 4)
+
+            # Half of the rows are inserted one by one and half in batches.
+            for row_data in rows[:20]:
+                await utils.process_message(
+                    db=db,
+                    payload={
+                        "msg_type": "row",
+                        "uuid": identifier,
+                        "row_data": row_data
+                    }
+                )
+            row_batcher = ingestion.RowBatcher(db, max_batch_size=7)
+            async with row_batcher:
+                for row_data in rows[20:]:
+                    await utils.process_message(
+                        db=db,
+                        payload={
+                            "msg_type": "row",
+                            "uuid": identifier,
+                            "row_data": row_data
+                        },
+                        row_batcher=row_batcher
+                    )
+            correlations = await utils.get_correlations(db, identifier)
+        del os.environ["POSTGRES_CONN_STR"]
+
+        matrix = correlations['matrix']
+        for i in range(3):
+            for j in range(3):
+                pairs = [
+                    (row[i], row[j]) for row in rows
+                    if row[i] is not None and row[j] is not None
+                ]
+                expected = statistics.correlation(*zip(*pairs))
+                self.assertAlmostEqual(matrix[i][j], expected, places=9)
+        self.assertAlmostEqual(matrix[0][2], -1)
+        # The correlations of a constant column cannot be computed.
+        self.assertTrue(all(matrix[3][j] is None for j in range(4)))
+        self.assertTrue(all(matrix[i][3] is None for i in range(4)))
+
+    @async_testable
+    async def test_get_stacks(self):
+        """Tests storing and adding up the stack samples of a run."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        start = datetime.datetime(2021, 5, 1, 12, 0, 0)
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            for minutes, stacks in enumerate([
+                    {"m:main;m:work": 3, "m:main;m:wait": 1},
+                    {"m:main;m:work": 2},
+                    {"m:main;m:wait": 5}]):
+                timestamp = start + datetime.timedelta(minutes=minutes)
+                await utils.process_message(
+                    db=db,
+                    payload={
+                        "msg_type": "stacks",
+                        "uuid": identifier,
+                        "timestamp": timestamp.timestamp(),
+                        "stacks": stacks
+                    }
+                )
+            stacks = await utils.get_stacks(db, identifier)
+            self.assertListEqual(
+                stacks, [("m:main;m:wait", 6), ("m:main;m:work", 5)]
+            )
+            stacks = await utils.get_stacks(
+                db,
+                identifier,
+                from_time=start,
+                to_time=start + datetime.timedelta(minutes=2)
+            )
+            self.assertListEqual(
+                stacks, [("m:main;m:work", 5), ("m:main;m:wait", 1)]
+            )
+            stacks = await utils.get_stacks(db, identifier, max_stacks=1)
+            self.assertListEqual(stacks, [("m:main;m:wait", 6)])
+            self.assertListEqual(
+                await utils.get_stacks(db, str(uuid.uuid4())), []
+            )
+
+            for stacks in ({"m:main": 0}, {"m:main": 1.5}, [["m:main", 1]]):
+                with self.assertRaises(exceptions.InvalidMessage):
+                    await utils.process_message(
+                        db=db,
+                        payload={
+                            "msg_type": "stacks",
+                            "uuid": identifier,
+                            "timestamp": start.timestamp(),
+                            "stacks": stacks
+                        }
+                    )
+        del os.environ["POSTGRES_CONN_STR"]
+
+    @async_testable
+    async def test_export_trace_csv(self):
+        """Tests exporting a trace as csv."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        identifier = str(uuid.uuid4())
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        chunks = []
+
+        async def output(chunk):
+            chunks.append(chunk)
+
+        async with db_conn.DbConnection() as db:
+            await utils.process_message(
+                db=db,
+                payload={
+                    "msg_type": "create_trace_run",
+                    "app_name": 'testing_app',
+                    "uuid": identifier,
+                    "column_names": ["v1", 'v "2"']
+                }
+            )
+            rows = [
+                [1622305220 + index, [index + 0.5, None]]
+                for index in range(20)
+            ]
+            await utils.process_message(
+                db=db,
+                payload={"msg_type": "rows", "uuid": identifier, "rows": rows}
+            )
+            await utils.export_trace_csv(db, identifier, output)
+            lines = b''.join(chunks).decode().splitlines()
+            self.assertEqual(lines[0], 'time,v1,"v ""2"""')
+            self.assertEqual(len(lines), 21)
+            self.assertTrue(lines[1].endswith(',0.5,'))
+
+            chunks.clear()
+            await utils.export_trace_csv(
+                db,
+                identifier,
+                output,
+                from_time=datetime.datetime.fromtimestamp(1622305230),
+                column_names=['v "2"', 'v1']
+            )
+            lines = b''.join(chunks).decode().splitlines()
+            self.assertEqual(len(lines), 11)
+            self.assertTrue(lines[1].endswith(',,10.5'))
+
+            with self.assertRaises(ValueError):
+                await utils.export_trace_csv(
+                    db, identifier, output, column_names=['junk']
+                )
+        del os.environ["POSTGRES_CONN_STR"]
+
+    @async_testable
+    async def test_get_all_tracers(self):
+        """Tests getting the tracing runs grouped by application."""
+        conn_str = await common.recreate_db(self.DB_NAME)
+        os.environ["POSTGRES_CONN_STR"] = conn_str
+        async with db_conn.DbConnection() as db:
+            for app_name in ('app1', 'app2', 'app1', 'app3', 'app1'):
+                await utils.process_message(
+                    db=db,
+                    payload={
+                        "msg_type": "create_trace_run",
+                        "app_name": app_name,
+                        "uuid": str(uuid.uuid4()),
+                        "column_names": ["v1"]
+                    }
+                )
+            tracers = await utils.get_all_tracers(db)
+            self.assertListEqual(
+                [t['tracer_name'] for t in tracers], ['app1', 'app3', 'app2']
+            )
+            self.assertListEqual(
+                [len(t['runs']) for t in tracers], [3, 1, 1]
+            )
+            tracers = await utils.get_all_tracers(
+                db, max_apps=2, offset=1, max_runs=1
+            )
+            self.assertListEqual(
+                [t['tracer_name'] for t in tracers], ['app3', 'app2']
+            )
+            tracers = await utils.get_all_tracers(db, max_runs=2)
+            self.assertEqual(len(tracers[0]['runs']), 2)
+        del os.environ["POSTGRES_CONN_STR"]
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,74 @@
+"""Tests the wire protocol."""
+
+import unittest
+import uuid
+
+import dolon.exceptions as exceptions
+import dolon.impl.wire_protocol as wire_protocol
+
+
+class TestWireProtocol(unittest.TestCase):
+    """Tests the binary wire protocol."""
+
+    def test_round_trip(self):
+        """Tests decoding an encoded row."""
+        identifier = str(uuid.uuid4())
+        encoder = wire_protocol.RowEncoder(identifier)
+        frame = encoder.encode([1.5, None, 3], 1622305220.25)
+        self.assertTrue(wire_protocol.is_binary(frame))
+        retrieved = wire_protocol.decode(frame)
+        self.assertEqual(
+            retrieved, (identifier, 0, [(1622305220.25, [1.5, None, 3.0])])
+        )
+
+    def test_multiple_rows(self):
+        """Tests decoding several rows encoded in the same frame."""
+        identifier = str(uuid.uuid4())
+        encoder = wire_protocol.RowEncoder(identifier)
+        rows = [(1622305220.0, [1.0, 2.0]), (1622305221.0, [None, 4.0])]
+        frame = encoder.encode_rows(rows)
+        self.assertEqual(wire_protocol.decode(frame), (identifier, 0, rows))
+
+    def test_frame_size(self):
+        """Tests calculating the size of a frame."""
+        encoder = wire_protocol.RowEncoder(str(uuid.uuid4()))
+        width = 12
+        count = 7
+        rows = [(0, [1.0] * width)] * count
+        expected_size = wire_protocol.ROWS_OVERHEAD + \
+            count * wire_protocol.get_row_size(width)
+        self.assertEqual(len(encoder.encode_rows(rows)), expected_size)
+
+    def test_sequence(self):
+        """Tests that every frame increases the sequence number."""
+        encoder = wire_protocol.RowEncoder(str(uuid.uuid4()))
+        sequences = [
+            wire_protocol.decode(encoder.encode([1], 0))[1]
+            for _ in range(3)
+        ]
+        self.assertListEqual(sequences, [0, 1, 2])
+
+    def test_json_is_not_binary(self):
+        """Tests that json messages are not taken as binary frames."""
+        self.assertFalse(wire_protocol.is_binary(b'{"msg_type": "row"}'))
+        self.assertFalse(wire_protocol.is_binary({"msg_type": "row"}))
+
+    def test_invalid_frames(self):
+        """Tests decoding invalid frames."""
+        encoder = wire_protocol.RowEncoder(str(uuid.uuid4()))
+        frame = encoder.encode([1], 0)
+        rows_frame = encoder.encode_rows([(0, [1]), (1, [2])])
+        invalid_frames = [
+            wire_protocol.MAGIC,
+            frame[:-1],
+            frame[:2] + bytes([99]) + frame[3:],
+            frame[:3] + bytes([99]) + frame[4:],
+            rows_frame[:-4],
+        ]
+        for invalid_frame in invalid_frames:
+            with self.assertRaises(exceptions.InvalidMessage):
+                wire_protocol.decode(invalid_frame)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,20 +2,28 @@
 
 import asyncio
 import logging
-import os
 import tracemalloc
 
 import psutil
 
+import dolon.gc_diagnostics as gc_diagnostics
 import dolon.profiler as profiler
 import dolon.impl.db_conn_impl as db_conn_impl
 import dolon.impl.db_stats as db_stats
+import dolon.impl.event_loop_impl as event_loop_impl
+import dolon.impl.memory_impl as memory_impl
+import dolon.impl.stack_sampler_impl as stack_sampler_impl
 import dolon.impl.trace_client_impl as trace_client_impl
 
 _logger = logging.getLogger(__name__)
 
+_gc_window = memory_impl.GcWindow()
+_gc_pauses = gc_diagnostics.GcDiagnostics()
 
-async def start_tracer(app_name, frequency, host, port, verbose, *diagnostics):
+
+async def start_tracer(app_name, frequency, host, port, verbose, *diagnostics,
+                       use_binary=False, max_batch_delay=0,
+                       diagnostic_timeout=None, report_latency=False):
     """Starts a tracer.
 
     This is where a tracer is created and starts running in the background. It
@@ -45,7 +53,25 @@ async def start_tracer(app_name, frequency, host, port, verbose, *diagnostics):
     :param diagnostics: The diagnostic callable to record. There is no limit
         in the number of diagnostic function to pass and they can differ from
         run to run for the same tracer name. The name of the callable will be
-        used to store it and show it from mnemic's front end.
+        used to store it and show it from mnemic's front end. Diagnostics are
+        collected concurrently; one that raises an exception is logged and
+        reports its last known value.
+
+    :param bool use_binary: If true the tracing rows are sent as compact
+        binary frames instead of json; requires a mnemic backend that
+        supports them.
+
+    :param float max_batch_delay: If positive, several samples are sent
+        together in the same datagram as long as none of them is delayed more
+        than this number of seconds; the datagram never exceeds the MTU.
+        Requires a mnemic backend that supports multi-row messages.
+
+    :param float diagnostic_timeout: The max time (in seconds) to wait for
+        a diagnostic; a diagnostic that takes longer reports its last known
+        value. Defaults to half the frequency.
+
+    :param bool report_latency: If true, the time each diagnostic took to
+        be collected is recorded in its own column.
     """
     diagnostics = list(diagnostics) + profiler.get_profiling_functions(True)
     try:
@@ -54,7 +80,11 @@ async def start_tracer(app_name, frequency, host, port, verbose, *diagnostics):
             host,
             port,
             verbose,
-            *diagnostics
+            *diagnostics,
+            use_binary=use_binary,
+            max_batch_delay=max_batch_delay,
+            diagnostic_timeout=diagnostic_timeout,
+            report_latency=report_latency
         )
         async with tc:
             await tc.run(frequency)
@@ -120,20 +150,269 @@ class PostgresDiagnostics(db_conn_impl.DbConnectionImpl):
         return await db_stats.conn_count_in_db.get_value(self)
 
 
+class StackSampler(stack_sampler_impl.StackSamplerImpl):
+    """Samples the call stacks of the threads of the process.
+
+    Must be used as an async context manager and passed as a diagnostic to
+    start_tracer; its column holds the number of stacks sampled per tracing
+    interval while the sampled stacks themselves are sent along with the
+    rows and can be viewed as a flame graph from the front end.
+
+    Samples are taken from a background thread without instrumenting the
+    code so the overhead depends on the sampling interval and the number of
+    threads but not on the number of calls.
+
+    :ivar float interval: The time (in seconds) between samples.
+    :ivar int max_depth: The max number of frames kept per stack.
+    """
+
+    def __init__(self, interval=0.01, max_depth=64):
+        """Initializer.
+
+        :param float interval: The time (in seconds) between samples.
+        :param int max_depth: The max number of frames kept per stack; the
+            innermost frames are kept.
+        """
+        super().__init__(interval=interval, max_depth=max_depth)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def __call__(self):
+        """Returns the number of stacks sampled since the last call.
+
+        :rtype: int.
+        """
+        return self.take_samples()
+
+
+class EventLoopDiagnostics(event_loop_impl.EventLoopMonitor):
+    """Measures how much the event loop of the tracer is blocked.
+
+    Must be used as an async context manager within the loop start_tracer
+    runs in; its profiler functions can be passed as diagnostics to
+    start_tracer. Each of them reports the values measured since it was
+    last called.
+
+    The duration of every callback run by the loop is measured while the
+    context is active, which adds a fraction of a microsecond per callback;
+    pass slow_callback_duration=None to measure the lag only.
+
+    :ivar float probe_interval: The time (in seconds) between lag probes.
+    :ivar float slow_callback_duration: The min duration (in seconds) of the
+        callbacks counted as slow.
+    """
+
+    def __init__(self, probe_interval=0.1, slow_callback_duration=0.1):
+        """Initializer.
+
+        :param float probe_interval: The time (in seconds) between lag
+            probes.
+        :param float slow_callback_duration: The min duration (in seconds)
+            of the callbacks counted as slow; None to not measure them.
+        """
+        super().__init__(
+            probe_interval=probe_interval,
+            slow_callback_duration=slow_callback_duration
+        )
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def loop_lag(self):
+        """Returns the average delay of the timers of the loop.
+
+        :returns: The average time (in seconds) the lag probes ran after
+            they were due; None if none ran. Can be used as a profiler
+            function.
+
+        :rtype: float.
+        """
+        return self.take_lag()
+
+    async def max_loop_lag(self):
+        """Returns the max delay of the timers of the loop.
+
+        :returns: The max time (in seconds) a lag probe ran (or is still
+            waiting to run) after it was due. Can be used as a profiler
+            function.
+
+        :rtype: float.
+        """
+        return self.take_max_lag()
+
+    async def ready_queue(self):
+        """Returns the max number of callbacks waiting to run.
+
+        :returns: The max length of the ready queue seen by the lag probes.
+            Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self.take_max_ready()
+
+    async def slow_callbacks(self):
+        """Returns the number of slow callbacks.
+
+        :returns: The number of callbacks that took longer than
+            slow_callback_duration. Can be used as a profiler function.
+
+        :rtype: int.
+        """
+        return self.take_slow_callbacks()
+
+    async def slow_callbacks_time(self):
+        """Returns the time spent in slow callbacks.
+
+        :returns: The total time (in seconds) of the callbacks that took
+            longer than slow_callback_duration. Can be used as a profiler
+            function.
+
+        :rtype: float.
+        """
+        return self.take_slow_callbacks_time()
+
+
+class AllocationDiagnostics(memory_impl.AllocationTracker):
+    """Reports the allocation sites that grew between samples.
+
+    Must be used as an async context manager; starts tracemalloc unless the
+    client code already did so (and only then stops it on exit). Since
+    tracemalloc slows down every allocation of the process it is meant to
+    be enabled while looking for a leak.
+
+    Every time allocation_growth is collected a snapshot is compared to the
+    previous one; the top_n allocation sites whose size changed the most are
+    logged and kept in top_allocations.
+
+    :ivar int top_n: The number of allocation sites to report.
+    :ivar int frames: The number of frames stored per allocation.
+    :ivar list top_allocations: The (site, size_diff, count_diff) tuples of
+        the top allocation sites of the last snapshot, sizes in bytes.
+    """
+
+    def __init__(self, top_n=10, frames=1):
+        """Initializer.
+
+        :param int top_n: The number of allocation sites to report.
+        :param int frames: The number of frames stored per allocation; only
+            applies if tracemalloc is started by this object.
+        """
+        super().__init__(top_n=top_n, frames=frames)
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    async def allocation_growth(self):
+        """Returns the growth of the traced memory since the last call.
+
+        :returns: The size difference (in Mb) between the last two
+            snapshots. Can be used as a profiler function.
+
+        :rtype: float.
+        """
+        growth = self.take_growth()
+        for site, size_diff, count_diff in self.top_allocations:
+            _logger.info(
+                "%s: %+.1f KiB, %+d blocks", site, size_diff / 1024,
+                count_diff
+            )
+        return growth / 10 ** 6
+
+
 async def mem_allocation():
     """Returns the size of the allocated memory in Mb.
 
-    Assumes that the client code has already called tracemalloc.start().
+    Assumes that the client code has already called tracemalloc.start();
+    tracemalloc is not started by the tracer since it slows down every
+    allocation.
 
-    :returns: The memory allocation in Mb. Can be used as a profiler
-            function.
+    :returns: The memory allocation in Mb; None if tracemalloc is not
+        tracing. Can be used as a profiler function.
 
     :rtype: int.
     """
+    if not tracemalloc.is_tracing():
+        return None
     current, peak = tracemalloc.get_traced_memory()
     return current / 10 ** 6
 
 
+async def resident_memory():
+    """Returns the resident memory (RSS) of the process in Mb.
+
+    Reads /proc/self/statm where available so it is cheap enough to be
+    collected at any frequency.
+
+    :returns: The resident memory in Mb.
+
+    :rtype: float.
+    """
+    return memory_impl.get_rss() / 10 ** 6
+
+
+async def unique_memory():
+    """Returns the memory unique to the process (USS) in Mb.
+
+    That is the memory that would be freed if the process exited; slower to
+    read than resident_memory since the memory mappings are walked.
+
+    :returns: The unique memory in Mb.
+
+    :rtype: float.
+    """
+    return memory_impl.get_uss() / 10 ** 6
+
+
+async def gc_collections():
+    """Returns the number of garbage collections since the last call.
+
+    :returns: The number of collections of all generations.
+
+    :rtype: int.
+    """
+    return _gc_window.take_collections()
+
+
+async def gc_collected():
+    """Returns the number of objects collected since the last call.
+
+    :returns: The number of unreachable objects the collections found.
+
+    :rtype: int.
+    """
+    return _gc_window.take_collected()
+
+
+async def gc_pause_time():
+    """Returns the time garbage collections took since the last call.
+
+    The collections are timed from a gc callback registered the first time
+    this is called; see gc_diagnostics.GcDiagnostics for more detailed
+    columns.
+
+    :returns: The total pause (in seconds); None for the first call.
+
+    :rtype: float.
+    """
+    if not _gc_pauses.active:
+        _gc_pauses.start()
+        return None
+    return await _gc_pauses.gc_pause_time()
+
+
 async def active_tasks():
     """Returns the number of active async tasks.
 
@@ -141,7 +420,7 @@ async def active_tasks():
 
     :rtype: int.
     """
-    return len([task for task in asyncio.Task.all_tasks() if not task.done()])
+    return len(asyncio.all_tasks())
 
 
 async def cpu_percent():
@@ -171,9 +450,7 @@ async def memory_use():
 
     :rtype: float.
     """
-    pid = os.getpid()
-    py = psutil.Process(pid)
-    return py.memory_info()[0] / 2. ** 30
+    return memory_impl.get_rss_gb()
 
 
 async def rabbitmq_connections():
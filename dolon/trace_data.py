@@ -0,0 +1,87 @@
+"""Holds the tracing rows of a run in columns."""
+
+import array
+import math
+
+_NAN = float('nan')
+_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class TraceData:
+    """The tracing rows of a run stored column by column.
+
+    Each column is an array of float32 numbers (the type of the values
+    stored in the database) where missing values are stored as NaN; this
+    keeps large runs compact and lets the columns be passed as buffers,
+    for example to numpy.frombuffer, without any conversion.
+
+    :ivar list[str] column_names: The names of the columns.
+    :ivar list[datetime.datetime] timestamps: The time of each row.
+    :ivar list[array.array] columns: The values of each column.
+    """
+
+    def __init__(self, column_names):
+        """Initializer.
+
+        :param list[str] column_names: The names of the columns.
+        """
+        self.column_names = list(column_names)
+        self.timestamps = []
+        self.columns = [array.array('f') for _ in self.column_names]
+
+    def __len__(self):
+        """Returns the number of rows."""
+        return len(self.timestamps)
+
+    def add_row(self, date_time, row_data):
+        """Adds a row.
+
+        Values missing from the end of the row are stored as NaN.
+
+        :param datetime.datetime date_time: The time of the row.
+        :param list row_data: The values of the row; None for missing ones.
+        """
+        self.timestamps.append(date_time)
+        row_length = len(row_data)
+        for index, column in enumerate(self.columns):
+            value = row_data[index] if index < row_length else None
+            column.append(_NAN if value is None else value)
+
+    def get_column(self, column_name):
+        """Returns the values of the passed in column.
+
+        :param str column_name: The name of the column.
+
+        :returns: The values of the column.
+        :rtype: array.array
+
+        raises: ValueError
+        """
+        return self.columns[self.column_names.index(column_name)]
+
+    def get_times(self):
+        """Returns the time of each row formatted as a string.
+
+        :returns: The time of each row as YYYY-MM-DD HH:MM:SS.
+        :rtype: list[str]
+        """
+        return [
+            date_time.strftime(_TIME_FORMAT) for date_time in self.timestamps
+        ]
+
+    def to_csv(self):
+        """Returns the rows as csv; missing values are left empty.
+
+        :returns: The csv view of the rows having a time column followed
+            by the columns of the run.
+        :rtype: str
+        """
+        lines = ['time,' + ','.join(self.column_names)]
+        for index, time in enumerate(self.get_times()):
+            values = (column[index] for column in self.columns)
+            lines.append(
+                time + ',' + ','.join(
+                    '' if math.isnan(value) else str(value) for value in values
+                )
+            )
+        return '\n'.join(lines)
@@ -0,0 +1,113 @@
+"""Caches the tree of the tracing runs in process."""
+
+import logging
+
+import dolon.impl.constants as constants
+import dolon.utils as utils
+
+_logger = logging.getLogger(__name__)
+
+
+class TracersCache:
+    """Caches the tracing runs grouped by application.
+
+    Must be used as an async context manager; while the context is active
+    a connection of the pool listens for the notifications sent whenever a
+    tracing run is created and clears the cache. If the listening connection
+    is lost the cache is bypassed since it can no longer be invalidated.
+
+    :ivar db: The database object to use.
+    :ivar dict _cache: Maps the paging arguments to the cached tracers.
+    :ivar int _generation: Increased on every invalidation; tracers fetched
+        while an invalidation happened are not cached.
+    :ivar _conn: The connection listening for the notifications.
+    :ivar _conn_context: The context that acquired the listening connection.
+    """
+
+    def __init__(self, db):
+        """Initializer.
+
+        :param db: The database object to use.
+        """
+        self._db = db
+        self._cache = {}
+        self._generation = 0
+        self._conn = None
+        self._conn_context = None
+        self._hits = 0
+        self._misses = 0
+
+    async def __aenter__(self):
+        """Enters the context starting to listen for new tracing runs."""
+        self._conn_context = self._db.get_conn_pool().acquire()
+        self._conn = await self._conn_context.__aenter__()
+        await self._conn.add_listener(
+            constants.TRACING_RUN_CHANNEL, self._on_run_created
+        )
+        self._conn.add_termination_listener(self._on_connection_lost)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Exits the context releasing the listening connection."""
+        if self._conn:
+            if not self._conn.is_closed():
+                self._conn.remove_termination_listener(
+                    self._on_connection_lost
+                )
+                await self._conn.remove_listener(
+                    constants.TRACING_RUN_CHANNEL, self._on_run_created
+                )
+            self._conn = None
+            await self._conn_context.__aexit__(exc_type, exc_val, exc_tb)
+            self._conn_context = None
+        self.invalidate()
+
+    def _on_run_created(self, conn, pid, channel, payload):
+        """Called when a tracing run is created."""
+        self.invalidate()
+
+    def _on_connection_lost(self, conn):
+        """Called when the listening connection is closed."""
+        _logger.warning("Lost the tracing run notifications; cache disabled.")
+        self._conn = None
+        self.invalidate()
+
+    def invalidate(self):
+        """Clears the cached tracers."""
+        self._generation += 1
+        self._cache.clear()
+
+    async def get_all_tracers(self, max_apps=None, offset=0, max_runs=None):
+        """Returns all the tracing runs grouped by application.
+
+        See utils.get_all_tracers for the arguments and the format of the
+        returned tracers.
+
+        :returns: The runs of each application.
+        :rtype: list[dict]
+        """
+        key = (max_apps, offset, max_runs)
+        if self._conn and key in self._cache:
+            self._hits += 1
+            return self._cache[key]
+        self._misses += 1
+        generation = self._generation
+        tracers = await utils.get_all_tracers(
+            self._db, max_apps, offset, max_runs
+        )
+        if self._conn and generation == self._generation:
+            self._cache[key] = tracers
+        return tracers
+
+    def get_metrics(self):
+        """Returns the cache metrics.
+
+        :returns: The cache metrics.
+        :rtype: dict
+        """
+        return {
+            'listening': self._conn is not None,
+            'cached_pages': len(self._cache),
+            'hits': self._hits,
+            'misses': self._misses,
+        }
@@ -1,14 +1,21 @@
 """Exposes the basic interface to interact with the serialization means."""
 
+import dolon.impl.parquet_impl as parquet_impl
+import dolon.impl.run_stats_impl as run_stats_impl
 import dolon.impl.utils_impl as utils_impl
 
 
-async def process_message(db, payload):
+async def process_message(db, payload, row_batcher=None):
     """Processes a tracing message storing it to the db.
 
     :param db: The database object to use.
 
-    :param dict payload: A dict representing the message to store.
+    :param dict payload: A dict representing the message to store; the
+        received datagram can also be passed as is, either as json or as a
+        binary frame.
+
+    :param RowBatcher row_batcher: If passed, tracing rows are buffered to it
+        to be stored in batches instead of being inserted one by one.
 
     Can be either a tracing run creation in the form of:
 
@@ -27,67 +34,302 @@ async def process_message(db, payload):
             "row_data": [12.2, 123.1]
         }
 
+    or for the insertion of several tracing rows along with the client
+    timestamp (epoch) they were sampled at:
+
+        msg = {
+            "msg_type": "rows",
+            "uuid": identifier,
+            "rows": [
+                [1622305220.25, [12.2, 123.1]],
+                [1622305220.75, [12.4, 121.0]]
+            ]
+        }
+
+    or for the insertion of the stack samples taken since the previous
+    stacks message, counted per call path (see trace_client.StackSampler):
+
+        msg = {
+            "msg_type": "stacks",
+            "uuid": identifier,
+            "timestamp": 1622305220.25,
+            "stacks": {"__main__:main;__main__:work": 12}
+        }
+
     raises: InvalidMessage
     """
-    await utils_impl.process_message(db, payload)
+    await utils_impl.process_message(db, payload, row_batcher)
 
 
-async def get_trace(uuid):
+async def create_partitions(db, months_ahead=2):
+    """Creates the missing monthly partitions for the tracing rows.
+
+    Rows that do not fall in any monthly partition are stored in a default
+    one so this should run periodically to keep the partitions ahead of the
+    current date.
+
+    :param db: The database object to use.
+    :param int months_ahead: Partitions are created from the current month
+        up to this number of months in the future.
+    """
+    await utils_impl.create_partitions(db, months_ahead)
+
+
+async def get_trace(db, uuid):
     """Returns all the tracing rows for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
-    :returns: A list of strings representing a csv view of the tracing run.
-    :rtype: list[str]
+    :returns: A csv view of the tracing run; missing values are left empty.
+    :rtype: str
     """
-    return await utils_impl.get_trace(uuid)
+    return await utils_impl.get_trace(db, uuid)
+
+
+async def get_trace_data(db, uuid):
+    """Returns all the tracing rows for the passed in uuid in columns.
 
+    Prefer this over get_trace when the values are to be processed further
+    since they are fetched straight to float32 arrays without going through
+    any text conversion.
 
-async def get_all_tracers():
-    """Returns a list with the names of all tracing runs.
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
 
-    :returns: A list with the names of all tracing runs.
-    :rtype: list[str]
+    :returns: The tracing rows of the run.
+    :rtype: trace_data.TraceData
     """
-    return await utils_impl.get_all_tracers()
+    return await utils_impl.get_trace_data(db, uuid)
 
 
-async def get_trace_as_json(uuid):
-    """Returns all the tracing rows for the passed in uuid as json.
+async def export_trace_csv(db, uuid, output, from_time=None, to_time=None,
+                           column_names=None):
+    """Writes the tracing rows for the passed in uuid as csv.
 
+    The rows are streamed from the database in chunks so runs of any size
+    can be exported with constant memory, for example to a web response:
+
+        response = web.StreamResponse()
+        await response.prepare(request)
+        await utils.export_trace_csv(db, uuid, response.write)
+
+    The first column holds the time of the row followed by the selected
+    columns of the run; missing values are left empty.
+
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
+    :param output: A coroutine function called with each chunk (bytes).
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are exported.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are exported.
+    :param list[str] column_names: If passed, only these columns are
+        exported in the passed in order.
+
+    raises: ValueError if any of the column names is not a column of the
+        run.
+    """
+    await utils_impl.export_trace_csv(
+        db, uuid, output, from_time, to_time, column_names
+    )
+
 
-    :returns: All the tracing rows for the passed in uuid as json.
+async def export_traces_parquet(db, uuids, output, from_time=None,
+                                to_time=None, batch_size=10000):
+    """Writes the tracing rows of the passed in runs as a parquet file.
+
+    Requires pyarrow (pip install dolon[parquet]). The file holds a uuid
+    and a time column followed by a float32 column for each of the columns
+    of the runs and is produced incrementally from a cursor; to load it
+    with pandas:
+
+        with open('runs.parquet', 'wb') as f:
+            async def write(chunk):
+                f.write(chunk)
+            await utils.export_traces_parquet(db, uuids, write)
+        df = pandas.read_parquet('runs.parquet')
+
+    :param db: The database object to use.
+    :param list[str] uuids: The identifiers for the trace runs.
+    :param output: A coroutine function called with each chunk (bytes).
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are exported.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are exported.
+    :param int batch_size: The number of rows per row group.
+
+    raises: MissingDependency if pyarrow is not installed.
+    """
+    await parquet_impl.export_traces_parquet(
+        db, uuids, output, from_time, to_time, batch_size
+    )
+
+
+async def get_all_tracers(db, max_apps=None, offset=0, max_runs=None):
+    """Returns all the tracing runs grouped by application.
+
+    Applications are sorted by their latest run and their runs by creation
+    time (latest first) in the following format:
+
+        [
+           {
+              "tracer_name":"testing_app",
+              "runs":[
+                 {
+                    "creation_time":"2021-05-29 21:00:20",
+                    "uuid":"eefba555-b816-427f-8138-02013067bad8"
+                 }
+              ]
+           }
+        ]
+
+    :param db: The database object to use.
+    :param int max_apps: If passed, the max number of applications to
+        return; used along with offset to page through the applications.
+    :param int offset: The number of applications to skip.
+    :param int max_runs: If passed, the max number of runs to return per
+        application.
+
+    :returns: The runs of each application.
     :rtype: list[dict]
     """
-    return await utils_impl.get_trace_as_json(uuid)
+    return await utils_impl.get_all_tracers(db, max_apps, offset, max_runs)
+
 
+async def get_trace_as_json(db, uuid, max_points=None, from_time=None,
+                            to_time=None):
+    """Returns the tracing rows for the passed in uuid as json.
 
-async def get_trace_run_info(uuid):
+    Long runs can hold far more points than a chart can display; passing
+    max_points reduces each column to about that many points by splitting
+    the rows to max_points / 2 buckets and keeping the min and the max point
+    of each one, which preserves the spikes of the series.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param int max_points: If passed, the max number of points per column.
+    :param datetime.datetime from_time: If passed, only the rows from this
+        time are returned.
+    :param datetime.datetime to_time: If passed, only the rows before this
+        time are returned.
+
+    :returns: Maps each column name to a list holding the column headers
+        followed by the [index, value] pairs of its points.
+    :rtype: dict
+    """
+    return await utils_impl.get_trace_as_json(
+        db, uuid, max_points, from_time, to_time
+    )
+
+
+async def get_correlations(db, uuid):
+    """Returns the correlations between the columns of the passed in run.
+
+    The correlations are computed from running sums that are updated as the
+    rows are stored so the rows are not read and live runs are supported.
+    Missing values are excluded pair by pair; the result looks like:
+
+        {
+            "columns": ["v1", "v2"],
+            "matrix": [[1.0, -0.4], [-0.4, 1.0]]
+        }
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+
+    :returns: The column names and the correlation matrix; correlations that
+        cannot be computed (like for constant columns) are None.
+    :rtype: dict
+    """
+    return await run_stats_impl.get_correlations(db, uuid)
+
+
+async def get_last_row_id(db, uuid):
+    """Returns the id of the last raw row stored for the passed in run.
+
+    Along with get_rows_after lets a caller follow a live run by keeping
+    track of the last row it has seen.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+
+    :returns: The id of the last row; 0 if there are no rows.
+    :rtype: int
+    """
+    return await utils_impl.get_last_row_id(db, uuid)
+
+
+async def get_rows_after(db, uuid, after_id, max_rows=1000):
+    """Returns the raw rows of a run stored after the passed in row.
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param int after_id: The id of the last row already seen; 0 to start
+        from the first row.
+    :param int max_rows: The max number of rows to return.
+
+    :returns: The (id, date_time, row_data) tuples of the rows in the order
+        they were stored.
+    :rtype: list[tuple]
+    """
+    return await utils_impl.get_rows_after(db, uuid, after_id, max_rows)
+
+
+async def get_stacks(db, uuid, from_time=None, to_time=None,
+                     max_stacks=5000):
+    """Returns the stack samples of a run added up per call path.
+
+    Each call path holds the frames from the outermost to the innermost
+    separated by ';' (the folded format flame graphs are drawn from).
+
+    :param db: The database object to use.
+    :param str uuid: The identifier for the trace run.
+    :param datetime.datetime from_time: If passed, samples taken before it
+        are excluded.
+    :param datetime.datetime to_time: If passed, samples taken at or after
+        it are excluded.
+    :param int max_stacks: The max number of call paths to return.
+
+    :returns: The (stack, samples) pairs, the most sampled first.
+    :rtype: list[tuple]
+    """
+    return await utils_impl.get_stacks(
+        db, uuid, from_time, to_time, max_stacks
+    )
+
+
+async def get_trace_run_info(db, uuid):
     """Returns descriptive info for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
     :returns: Descriptive info for the passed in uuid.
     :rtype: dict
     """
-    return await utils_impl.get_trace_run_info(uuid)
+    return await utils_impl.get_trace_run_info(db, uuid)
 
 
-async def get_trace_run_name(uuid):
+async def get_trace_run_name(db, uuid):
     """Returns the name of the trace run for the passed in uuid.
 
+    :param db: The database object to use.
     :param str uuid: The identifier for the trace run.
 
     :returns: The name of the trace run.
     :rtype: str.
     """
-    return await utils_impl.get_trace_run_name(uuid)
+    return await utils_impl.get_trace_run_name(db, uuid)
 
 
-async def get_latest_trace(app_name):
+async def get_latest_trace(db, app_name):
     """Returns the latest trace for the passed in app_name.
 
-    :return: A list of objects.
+    :param db: The database object to use.
+    :param str app_name: The application name.
+
+    :return: A csv view of the latest tracing run.
+    :rtype: str
     """
-    return await utils_impl.get_latest_trace(app_name)
+    return await utils_impl.get_latest_trace(db, app_name)
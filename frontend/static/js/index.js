@@ -70,7 +70,84 @@ function drawChart(title, data) {
     div.setAttribute("class", "trace_chart");
     document.getElementById('right').appendChild(div);
     const chart = new google.visualization.LineChart(div);
-    chart.draw(google.visualization.arrayToDataTable(data), options);
+    const table = google.visualization.arrayToDataTable(data);
+    chart.draw(table, options);
+    return {chart: chart, table: table, options: options};
+}
+
+// The server-sent events source following the displayed run.
+let live_stream = null;
+
+function follow_run(uuid, columns, charts, max_points) {
+    // Appends the rows stored for the run to its charts as they arrive
+    // keeping up to max_points points per chart; the charts are redrawn at
+    // most once per second.
+    if (live_stream) {
+        live_stream.close();
+    }
+    live_stream = new EventSource("tracing_data_stream?uuid=" + uuid);
+    let redraw_pending = false;
+
+    live_stream.addEventListener("rows", function (event) {
+        const rows = JSON.parse(event.data).rows;
+        $.each(columns, function (index, column) {
+            const chart = charts[column];
+            if (!chart) {
+                return;
+            }
+            const table = chart.table;
+            let count = table.getNumberOfRows();
+            let next_index = count ? table.getValue(count - 1, 0) + 1 : 0;
+            $.each(rows, function (row_index, row) {
+                const value = index < row[1].length ? row[1][index] : null;
+                table.addRow([next_index++, value]);
+            });
+            count = table.getNumberOfRows();
+            if (count > max_points) {
+                table.removeRows(0, count - max_points);
+            }
+        });
+        if (!redraw_pending) {
+            redraw_pending = true;
+            setTimeout(function () {
+                redraw_pending = false;
+                $.each(charts, function (column, chart) {
+                    chart.chart.draw(chart.table, chart.options);
+                });
+            }, 1000);
+        }
+    });
+}
+
+function drawCorrelations(correlations) {
+    // Draws the absolute correlations between the columns as a table
+    // shading each cell by the strength of the correlation.
+    const columns = correlations.columns;
+    if (columns.length < 2) {
+        return;
+    }
+    const table = document.createElement('table');
+    table.setAttribute("class", "correlations");
+    const header = table.insertRow();
+    header.insertCell();
+    $.each(columns, function (index, column) {
+        header.insertCell().textContent = column;
+    });
+    $.each(correlations.matrix, function (row_index, values) {
+        const row = table.insertRow();
+        row.insertCell().textContent = columns[row_index];
+        $.each(values, function (index, value) {
+            const cell = row.insertCell();
+            if (value === null) {
+                cell.textContent = "n/a";
+            } else {
+                cell.textContent = value.toFixed(2);
+                cell.style.backgroundColor = "rgba(7, 7, 148, " + value + ")";
+                cell.style.color = value > 0.5 ? "white" : "black";
+            }
+        });
+    });
+    document.getElementById('right').appendChild(table);
 }
 
 function download_csv(uuid) {
@@ -94,17 +171,117 @@ function download_csv(uuid) {
 
 
 
+}
+
+function buildStackTree(stacks) {
+    // Merges the folded stacks ("outer;...;inner", samples) into a tree.
+    const root = {name: "all", value: 0, children: {}};
+    $.each(stacks, function (index, stack) {
+        const samples = stack[1];
+        let node = root;
+        root.value += samples;
+        $.each(stack[0].split(";"), function (frame_index, frame) {
+            if (!(frame in node.children)) {
+                node.children[frame] = {name: frame, value: 0, children: {}};
+            }
+            node = node.children[frame];
+            node.value += samples;
+        });
+    });
+    return root;
+}
+
+function frameColor(name) {
+    // Returns a warm color that is stable for the same frame name.
+    let hash = 0;
+    for (let i = 0; i < name.length; i++) {
+        hash = (hash * 31 + name.charCodeAt(i)) | 0;
+    }
+    hash = Math.abs(hash);
+    return "rgb(" + (205 + hash % 50) + ", " + (80 + (hash >> 8) % 130) + ", " + ((hash >> 16) % 55) + ")";
+}
+
+function drawFlameGraph(container, root) {
+    // Draws the tree as an icicle graph (the outermost frames on top); the
+    // width of every frame is proportional to its samples. Clicking on a
+    // frame zooms into it, clicking on the top one zooms out.
+    const frame_height = 18;
+    const min_width = 0.002;
+    let max_depth = 0;
+
+    container.empty();
+
+    function drawNode(node, parent, left, width, depth) {
+        if (width < min_width) {
+            return;
+        }
+        max_depth = Math.max(max_depth, depth);
+        const div = document.createElement("div");
+        const percent = (100 * node.value / root.value).toFixed(2);
+        div.textContent = node.name;
+        div.title = node.name + " (" + node.value + " samples, " + percent + "%)";
+        div.style.left = (100 * left) + "%";
+        div.style.width = (100 * width) + "%";
+        div.style.top = (depth * frame_height) + "px";
+        div.style.backgroundColor = frameColor(node.name);
+        div.addEventListener("click", function () {
+            drawFlameGraph(container, depth === 0 && parent ? parent : node);
+        });
+        container.append(div);
+
+        let child_left = left;
+        $.each(node.children, function (name, child) {
+            const child_width = width * child.value / node.value;
+            drawNode(child, node, child_left, child_width, depth + 1);
+            child_left += child_width;
+        });
+    }
+
+    drawNode(root, root.parent, 0, 1, 0);
+    container.css("height", ((max_depth + 1) * frame_height) + "px");
+}
+
+function load_flame_graph(uuid) {
+    // Draws the flame graph of the stack samples of the passed in run.
+    $('body').addClass('waiting');
+    $.get("flame_graph?uuid=" + uuid, function (data) {
+        $('body').removeClass('waiting');
+        $(".flame_graph").remove();
+        if (data.stacks.length === 0) {
+            alert("No stack samples for this run.");
+            return;
+        }
+        const root = buildStackTree(data.stacks);
+        (function setParents(node) {
+            $.each(node.children, function (name, child) {
+                child.parent = node;
+                setParents(child);
+            });
+        })(root);
+        const container = $("<div class='flame_graph'></div>");
+        $("#right").prepend(container);
+        drawFlameGraph(container, root);
+    }).error(function () {
+        $('body').removeClass('waiting');
+        alert("500 Error..");
+    });
 }
 
 function load_run_info(uuid) {
     $('body').addClass('waiting');
 
-    $.get("tracing_data_handler?uuid=" + uuid, function (data) {
+    // Ask for about as many points as the chart can display.
+    const max_points = Math.max(document.getElementById('right').clientWidth, 500);
+
+    $.get("tracer_run?format=json&uuid=" + uuid + "&max_points=" + max_points, function (data) {
         $("#right").empty();
 
-        for (const property in data) {
-            drawChart(property, data[property])
+        const charts = {};
+        for (const property in data.series) {
+            charts[property] = drawChart(property, data.series[property]);
         }
+        drawCorrelations(data.correlations);
+        follow_run(uuid, data.correlations.columns, charts, max_points);
 
         $('body').removeClass('waiting');
     }).error(function () {
@@ -120,6 +297,8 @@ function load_run_info(uuid) {
         // Add the csv download button.
         txt += "<button id = 'download_csv_btn' style='margin-left:102px;'" +
             " >Download csv</button>";
+        txt += "<button id = 'flame_graph_btn' style='margin-left:12px;'" +
+            " >Flame graph</button>";
 
         $("#tracer_description").html(txt);
 
@@ -127,6 +306,9 @@ function load_run_info(uuid) {
         $("#download_csv_btn").on("click", function () {
             download_csv(uuid);
         });
+        $("#flame_graph_btn").on("click", function () {
+            load_flame_graph(uuid);
+        });
     }).error(function () {
         $('body').removeClass('waiting');
         alert("500 Error..");
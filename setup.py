@@ -27,4 +27,7 @@ setup(
         "aiohttp",
         "psutil"
     ],
+    extras_require={
+        "parquet": ["pyarrow"],
+    },
 )